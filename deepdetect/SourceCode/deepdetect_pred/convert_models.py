@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+One-time conversion of the BiLSTM and DeepDigest models of a protease from
+their JSON and h5 files into a single npz file with both architectures and all
+weights, which predictor() loads directly. Run it again after replacing any of
+the JSON or h5 files; until then predictor() falls back to them.
+
+Usage: python convert_models.py [--model_dir=DIR] [protease ...]
+Without proteases, all proteases with model files are converted. The models are
+read from and written to DIR, DeepDetect/ of the repository by default.
+"""
+
+
+import os
+import sys
+import time
+import getopt
+import numpy as np
+from predictor import load_h5_models, model_files, npz_path, default_model_dir
+
+
+proteases = ['Trypsin', 'ArgC', 'Chymotrypsin', 'GluC', 'LysC', 'AspN',
+             'LysN', 'LysargiNase']
+
+
+# write the models of a protease into one npz file
+def convert(protease, model_dir=default_model_dir):
+    model_bilstm, loaded_model_bilstm, model_deepdigest, \
+        loaded_model_deepdigest = load_h5_models(protease, model_dir)
+
+    arrays = {'bilstm_json': np.array(model_bilstm),
+              'deepdigest_json': np.array(model_deepdigest)}
+    for name, model in [('bilstm', loaded_model_bilstm),
+                        ('deepdigest', loaded_model_deepdigest)]:
+        weights = model.get_weights()
+        arrays['%s_num' % name] = np.array(len(weights))
+        for ind, weight in enumerate(weights):
+            arrays['%s_%s' % (name, ind)] = weight
+
+    # written under a temporary name so that an interrupted conversion is
+    # never loaded
+    path = npz_path(protease, model_dir)
+    with open(path + '.tmp', 'wb') as npz:
+        np.savez(npz, **arrays)
+    os.replace(path + '.tmp', path)
+    print("Wrote %s" % path)
+
+
+if __name__ == '__main__':
+    try:
+        options, selected = getopt.getopt(sys.argv[1:], '', ['model_dir='])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit(1)
+    model_dir = default_model_dir
+    for opt, arg in options:
+        if opt == '--model_dir':
+            model_dir = arg
+
+    if len(selected) == 0:
+        selected = [protease for protease in proteases
+                    if all(os.path.exists(path)
+                           for path in model_files(protease, model_dir))]
+
+    for protease in selected:
+        if protease not in proteases:
+            print("Error: This tool does not support %s protease yet." % protease)
+            sys.exit(1)
+        if not all(os.path.exists(path)
+                   for path in model_files(protease, model_dir)):
+            print("Error: The model files of %s do not exist." % protease)
+            sys.exit(1)
+        s = time.time()
+        convert(protease, model_dir)
+        print("Time cost of converting %s is %s seconds."
+              % (protease, time.time() - s))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+DeepDetect as a library: the models of a protease are loaded once and the
+predictions are returned in memory instead of being written to a result file.
+
+    import sys
+    sys.path.insert(0, 'deepdetect/SourceCode/deepdetect_pred')
+    from deepdetect_api import DeepDetect
+
+    dd = DeepDetect('Trypsin', missed_cleavages=2, min_len=7, max_len=47)
+    df = dd.predict_fasta('proteins.fasta')
+    det = dd.predict_peptides(['PEPTIDEK'], ['MPEPTIDEKAAR'])
+"""
+
+
+import numpy as np
+import pandas as pd
+from read_fasta import read_fasta
+from in_silico_digestion import digest_proteins
+from predictor import load_models, predict_data, data_detectabilities
+from predictor import default_model_dir, header
+from main import info
+
+
+# digested data of the selected peptides only
+def select_peptides(data, rows):
+    selected = dict(data)
+    for column in ['protein', 'start', 'end', 'left', 'right']:
+        selected[column] = np.asarray(data[column])[rows]
+    return selected
+
+
+class DeepDetect:
+    '''
+    Parameters
+    ----------
+    protease : str
+        One of the proteases of main.info, e.g. 'Trypsin'.
+    missed_cleavages, min_len, max_len : int
+        The in silico digestion parameters, as in main.py.
+    model_dir : str
+        The directory of the model files, DeepDetect/ of the repository by
+        default.
+    batch_size : int
+        0 predicts all peptides at once, otherwise in length buckets of this
+        size.
+    '''
+    def __init__(self, protease='Trypsin', missed_cleavages=2, min_len=7,
+                 max_len=47, model_dir=default_model_dir, batch_size=0):
+        self.protease = protease
+        self.sites, self.terminal, self.padding_len = info(protease)
+        self.missed_cleavages = missed_cleavages
+        self.min_len = min_len
+        self.max_len = max_len
+        self.batch_size = batch_size
+        self.models = load_models(protease, batch_size, model_dir)
+
+    def digest(self, proteins):
+        return digest_proteins(proteins, self.sites, self.terminal,
+                               self.missed_cleavages, self.min_len,
+                               self.max_len)
+
+    # peptides and detectabilities of digested data
+    def predict_data(self, data):
+        if len(data['protein']) == 0:
+            return [], np.zeros(0)
+        peps, bilstm_pred, sites_pred, _, _ = predict_data(
+            self.models, data, self.padding_len, self.batch_size)
+        return peps, data_detectabilities(data, bilstm_pred, sites_pred)
+
+    def predict_fasta(self, fasta_path, regular=r'>(.*?)\s'):
+        '''
+        Returns the detectabilities of all digested peptides of a fasta file
+        as a DataFrame with the columns of the result file, i.e. 'Protein id',
+        'Peptide sequence' and 'Peptide detectability'.
+        '''
+        data = self.digest(read_fasta(fasta_path, regular))
+        peps, det_probs = self.predict_data(data)
+        pro_ids = data['pro_ids']
+        return pd.DataFrame({
+            header[0]: [pro_ids[pro_ind] for pro_ind in data['protein']],
+            header[1]: peps,
+            header[2]: det_probs}, columns=header)
+
+    def predict_peptides(self, peptides, proteins):
+        '''
+        Returns the detectabilities of peptides, each in the protein sequence
+        at the same position of proteins, as a float64 array. The peptides
+        are digested from their proteins, so that the cleavage sites around
+        them are predicted in their protein; peptides that are not digested
+        from their protein with the digestion parameters are NaN. A peptide
+        that is digested more than once from its protein gets the first
+        detectability, as in the result file.
+        '''
+        # every protein sequence is digested once
+        pro_inds = {}
+        wanted = {(pro_inds.setdefault(pro_seq, len(pro_inds)), pep)
+                  for pep, pro_seq in zip(peptides, proteins)}
+        data = self.digest((pro_ind, pro_seq)
+                           for pro_seq, pro_ind in pro_inds.items())
+
+        # only the peptides that were asked for are predicted
+        rows = []
+        found = {}
+        pro_ids = data['pro_ids']
+        pro_seqs = data['pro_seqs']
+        for row, (pro_ind, start, end) in enumerate(zip(
+                data['protein'], data['start'], data['end'])):
+            key = (pro_ids[pro_ind], pro_seqs[pro_ind][start : end])
+            if key in wanted and key not in found:
+                found[key] = len(rows)
+                rows.append(row)
+        peps, det_probs = self.predict_data(select_peptides(data, rows))
+
+        det = np.full(len(peptides), np.nan)
+        for ind, (pep, pro_seq) in enumerate(zip(peptides, proteins)):
+            key = (pro_inds[pro_seq], pep)
+            if key in found:
+                det[ind] = det_probs[found[key]]
+        return det
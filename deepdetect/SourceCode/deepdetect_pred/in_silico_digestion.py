@@ -1,122 +1,103 @@
+from array import array
+
 # hyper-parameters
 nearnum = 15
 illegal_mer = 'BJOUX'
 illegal_pep = 'BJOUXZ'
 
 
-# get the left and right mers of the sites
-def left_and_right_mer(pro_seq, ed_ind, cut_sites):
+# get the 31-mer positions of the sites, -1 for the sites without 31-mer,
+# and whether the 31-mers are free of illegal amino acids
+def site_windows(pro_seq, cut_sites):
     global nearnum
-    
-    # left mers
-    left_len = len(pro_seq[ : cut_sites[ed_ind]])
-    if left_len >= nearnum:
-        left_mer = pro_seq[cut_sites[ed_ind] - nearnum :
-                           cut_sites[ed_ind] + 1]
-    else:
-        left_mer = 'Z' * (nearnum - left_len) +\
-                        pro_seq[ : cut_sites[ed_ind] + 1]
-    
-    # right mers
-    right_len = len(pro_seq[cut_sites[ed_ind] + 1 : ])
-    if right_len >= nearnum:
-        right_mer = pro_seq[cut_sites[ed_ind] + 1 :
-                            cut_sites[ed_ind] + 1 + nearnum]
-    else:
-        right_mer = pro_seq[cut_sites[ed_ind] + 1 : ] +\
-                        'Z' * (nearnum - right_len)
-    
-    # left_mer = '...K/R', right_mer = '...',
-    # then use full_mer to get left_mer + right_mer = '...K/R...'
-    return left_mer, right_mer
-
-
-# get the full 31-mer of the sites
-def full_mer(pro_seq, ed_ind, cut_sites):
-    if all([ed_ind > 0,
-            ed_ind < len(cut_sites) - 1,
-            cut_sites[ed_ind] != cut_sites[0]]):
-        left_mer, right_mer = left_and_right_mer(pro_seq, ed_ind, cut_sites)
-        mer = left_mer + right_mer
-    else:
-        mer = '*'
-    return mer
+
+    # positions of the illegal amino acids, mostly there are none
+    illegal_pos = []
+    if len(set(illegal_mer) - set(pro_seq)) != 5:
+        illegal_pos = [ind for ind, aa in enumerate(pro_seq)
+                       if aa in illegal_mer]
+
+    windows = []
+    legal = []
+    for ed_ind in range(len(cut_sites)):
+        if all([ed_ind > 0,
+                ed_ind < len(cut_sites) - 1,
+                cut_sites[ed_ind] != cut_sites[0]]):
+            # the 31-mer covers nearnum amino acids on both sides of the site
+            pos = cut_sites[ed_ind]
+            windows.append(pos)
+            legal.append(not any(abs(ind - pos) <= nearnum
+                                 for ind in illegal_pos))
+        else:
+            windows.append(-1)
+            legal.append(True)
+    return windows, legal
+
+
+# get whether the protein pieces between neighbouring sites are free of
+# illegal amino acids, and the offsets of the peptides cut at the sites
+def site_pieces(pro_seq, cut_sites, terminal):
+    shift = 1 if terminal == 'C' else 0
+    offsets = [site + shift for site in cut_sites]
+    pieces = [len(set(illegal_pep) -
+                  set(pro_seq[offsets[ind] : offsets[ind + 1]])) == 6
+              for ind in range(len(cut_sites) - 1)]
+    return pieces, offsets
 
 
-# get the N-terminal digested peptides and the corresponding mers
-def nterminal_pep_and_mers(pro_seq, cut_sites, terminal, missed_cleavages,
-                           min_len, max_len):
-    nterm_seqs = []
+# get the N-terminal digested peptides and the corresponding sites
+def nterminal_pep_and_mers(pro_seq, cut_sites, offsets, pieces, legal,
+                           missed_cleavages, min_len, max_len):
+    nterm_peps = []
     for add_ind in range(1, len(cut_sites)):
         # check the number of missed cleavage sites
         if add_ind >= missed_cleavages + 2:
             break
-        
+
         # the digested peptide with different cutting terminals
-        if terminal =='C':
-            pep = pro_seq[cut_sites[0] + 1 : cut_sites[add_ind] + 1]
-        else:
-            pep = pro_seq[cut_sites[0] : cut_sites[add_ind]]
-        
-        # get the corresponding mers of the N-terminal digested peptide
-        lpep = len(pep)
+        start = offsets[0]
+        end = offsets[add_ind]
+
+        # get the corresponding sites of the N-terminal digested peptide
+        lpep = end - start
 # =============================================================================
 #         If the protein N-terminal amino acid is a candidate site and cutting
 #         terminal is the N-term, then the digested peptide will be '' and the
-#         whole loop should be broken. Otherwise, the N-terminal digested 
+#         whole loop should be broken. Otherwise, the N-terminal digested
 #         peptides will be generated twice.
 # =============================================================================
-        if pep == '':
+        if lpep == 0:
             break
 # =============================================================================
-#         If the shorter digested peptide (in this loop) includes illegal 
+#         If the shorter digested peptide (in this loop) includes illegal
 #         amino acid(s), then the longer digested peptide (in subsequent loops
-#         ) containing the shorter digested peptide (in this loop) will also 
-#         includes illegal amino acid(s). Thus, the whole loop should be 
+#         ) containing the shorter digested peptide (in this loop) will also
+#         includes illegal amino acid(s). Thus, the whole loop should be
 #         broken, too.
 # =============================================================================
-        elif len(set(illegal_pep) - set(pep)) != 6:
+        elif not pieces[add_ind - 1]:
             break
 # =============================================================================
-#         The N-terminal digested peptides starting with M have two possible 
-#         cases, e.g., MPEPTIDESK | PEPTIDESK, and the digestibility of the 
+#         The N-terminal digested peptides starting with M have two possible
+#         cases, e.g., MPEPTIDESK | PEPTIDESK, and the digestibility of the
 #         C-terminal cutting site is also set to 1 even if the site is 'M'.
 # =============================================================================
         elif lpep >= min_len and lpep <= max_len + 1:
-            # 31-mer of left site
-            left_mer = full_mer(pro_seq, 0, cut_sites)
-            if len(set(illegal_mer) - set(left_mer)) != 5:
+            # 31-mers of left, right and missed cleavage sites
+            if not all(legal[0 : add_ind + 1]):
                 continue
-            # 31-mer of right site
-            right_mer = full_mer(pro_seq, add_ind, cut_sites)
-            if len(set(illegal_mer) - set(right_mer)) != 5:
-                continue
-            missed_mers =''
-            # if add_ind > 1, then there is/are cleavage site/sites
-            if add_ind > 1:
-                # 31-mers of missed cleavage sites
-                # missed_num is the number of missed cleavage sites
-                for missed_num in range(1, add_ind):
-                    missed_left, missed_right = \
-                        left_and_right_mer(pro_seq, missed_num, cut_sites)
-                    missed_mer = missed_left + missed_right
-                    missed_mers += (missed_mer + ',')
-            # check illegal amino acids
-            if len(set(illegal_mer) - set(missed_mers)) != 5:
-                continue
-            mers = left_mer + '\t' + right_mer + '\t' + missed_mers.rstrip(',')
-            
+
             # check the two cases starting with and without 'M'
             if lpep <= max_len:
-                nterm_seqs += [pep + '\t' + mers]
-            if pep[0] == 'M' and lpep - 1 >= min_len:
-                nterm_seqs += [pep[1:] + '\t' + mers]
-    
-    # [peptide, left_mer, right_mer, missed_mers]
-    return nterm_seqs
+                nterm_peps.append((start, end, 0, add_ind))
+            if pro_seq[start] == 'M' and lpep - 1 >= min_len:
+                nterm_peps.append((start + 1, end, 0, add_ind))
 
+    # (start, end, left site, right site)
+    return nterm_peps
 
-# get all theoretical peptides and corresponding 31-mers for each protein
+
+# get all theoretical peptides and corresponding sites for each protein
 def peps_and_mers(pro_seq, cut_sites, terminal,
                   missed_cleavages, min_len, max_len):
     '''
@@ -134,16 +115,22 @@ def peps_and_mers(pro_seq, cut_sites, terminal,
         The minimum length of digested peptides.
     max_len : int
         The maximum length of digested peptides.
-    
+
     Returns
     -------
-    seqs : list
-        The list of digested peptides with corresponding 31-mers.
+    windows : list
+        The 31-mer positions of the sites, -1 for the sites without 31-mer.
+    peps : list
+        The digested peptides as (start, end, left site, right site), the
+        sites between the left and right site are the missed cleavage sites.
     '''
-    # the N-terminal digested peptides and the corresponding mers
-    seqs = nterminal_pep_and_mers(pro_seq, cut_sites, terminal,
+    windows, legal = site_windows(pro_seq, cut_sites)
+    pieces, offsets = site_pieces(pro_seq, cut_sites, terminal)
+
+    # the N-terminal digested peptides and the corresponding sites
+    peps = nterminal_pep_and_mers(pro_seq, cut_sites, offsets, pieces, legal,
                                   missed_cleavages, min_len, max_len)
-    
+
     len_cut = len(cut_sites)
     # index of the left site's position (started with the first site)
     for st_ind in range(1, len_cut - 1):
@@ -152,65 +139,45 @@ def peps_and_mers(pro_seq, cut_sites, terminal,
             # check the number of missed cleavage sites
             if add_ind >= missed_cleavages + 2:
                 break
-            
+
             # the digested peptide with different cutting terminals
-            if terminal =='C':
-                pep = pro_seq[cut_sites[st_ind] + 1 :
-                              cut_sites[st_ind + add_ind] + 1]
-            else:
-                pep = pro_seq[cut_sites[st_ind] :
-                              cut_sites[st_ind + add_ind]]
-            
-            # get the corresponding mers of the digested peptide
-            lpep = len(pep)
+            start = offsets[st_ind]
+            end = offsets[st_ind + add_ind]
+
+            # get the corresponding sites of the digested peptide
+            lpep = end - start
 # =============================================================================
-#         If the shorter digested peptide (in this loop) includes illegal 
+#         If the shorter digested peptide (in this loop) includes illegal
 #         amino acid(s), then the longer digested peptide (in subsequent loops
-#         ) containing the shorter digested peptide (in this loop) will also 
-#         includes illegal amino acid(s). Thus, the whole loop should be 
+#         ) containing the shorter digested peptide (in this loop) will also
+#         includes illegal amino acid(s). Thus, the whole loop should be
 #         broken, too.
 # =============================================================================
-            if len(set(illegal_pep) - set(pep)) != 6:
+            if not pieces[st_ind + add_ind - 1]:
                 break
             elif lpep >= min_len and lpep <= max_len:
-                # 31-mer of left site
-                left_mer = full_mer(pro_seq, st_ind, cut_sites)
-                if len(set(illegal_mer) - set(left_mer)) != 5:
-                    continue
-                # 31-mer of right site
-                right_mer = full_mer(pro_seq, st_ind + add_ind, cut_sites)
-                if len(set(illegal_mer) - set(right_mer)) != 5:
+                # 31-mers of left, right and missed cleavage sites
+                if not all(legal[st_ind : st_ind + add_ind + 1]):
                     continue
-                missed_mers = ''
-                # if add_ind > 1, then there is/are cleavage site/sites
-                if add_ind > 1:
-                    # 31-mers of missed cleavage sites
-                    for missed_num in range(1, add_ind):
-                    # missed_num is the number of missed cleavage sites
-                        missed_left, missed_right =\
-                            left_and_right_mer(pro_seq, st_ind + missed_num,
-                                               cut_sites)
-                        missed_mer = missed_left + missed_right
-                        missed_mers += (missed_mer + ',')
-                # check illegal amino acids
-                if len(set(illegal_mer) - set(missed_mers)) != 5:
-                    continue
-                seqs += [pep + '\t' + left_mer + '\t' + right_mer +
-                         '\t' + missed_mers.rstrip(',')]
-    
-    # [peptide, left_mer, right_mer, missed_mers]
-    return seqs
+                peps.append((start, end, st_ind, st_ind + add_ind))
+
+    return windows, peps
 
 
-# protein --> peptide | left 31-mer | right 31-mer | missed 31-mers
-def digestion(pro_seq, sites, terminal, missed_cleavages, min_len, max_len):
+# protein --> 31-mer positions of the sites | (start, end, left, right)
+def digestion(pro_seq, sites, terminal, missed_cleavages, min_len, max_len,
+              cut_sites=None):
     lpro = len(pro_seq)
-    
-    # indexes of the candidate cleavage sites
-    cut_sites = [ind for ind in range(lpro) if pro_seq[ind] in sites]
+
+    # indexes of the candidate cleavage sites, unless they were scanned for
+    # several proteases at once
+    if cut_sites is None:
+        cut_sites = [ind for ind in range(lpro) if pro_seq[ind] in sites]
+    else:
+        cut_sites = list(cut_sites)
     # indexes of the start and end positions
 # =============================================================================
-#     There are some differences between C-terminal and N-terminal cleavage, 
+#     There are some differences between C-terminal and N-terminal cleavage,
 #     but both need to start at the first amino acid and end at the last one.
 # =============================================================================
     if terminal == 'C':
@@ -220,12 +187,15 @@ def digestion(pro_seq, sites, terminal, missed_cleavages, min_len, max_len):
     else:
         cut_sites.insert(0, 0)
         cut_sites += [lpro]
-    
-    # check if there is any candidate sites to cut
-    digested_seqs = []
+
+    # check if there is any candidate sites to cut,
+    # peptides of proteins without sites have no sites either (-1)
+    windows = []
+    digested_peps = []
     if len(cut_sites) > 2:
-        digested_seqs += peps_and_mers(pro_seq, cut_sites, terminal,
-                                       missed_cleavages, min_len, max_len)
+        windows, digested_peps = peps_and_mers(pro_seq, cut_sites, terminal,
+                                               missed_cleavages,
+                                               min_len, max_len)
     elif len(set(illegal_pep) - set(pro_seq)) != 6:
         print("Warning: Protein sequence %s has illegal amino acid(s) "
               "without any candidate sites!" % pro_seq)
@@ -233,8 +203,87 @@ def digestion(pro_seq, sites, terminal, missed_cleavages, min_len, max_len):
         print("Warning: Protein sequence %s has no candidate sites!"
               % pro_seq)
         if lpro <= max_len:
-            digested_seqs += [pro_seq]
+            digested_peps.append((0, lpro, -1, -1))
         if pro_seq[0] == 'M' and lpro - 1 >= min_len:
-            digested_seqs += [pro_seq[1:]]
-    
-    return digested_seqs
+            digested_peps.append((1, lpro, -1, -1))
+
+    return windows, digested_peps
+
+
+# digest all proteins into compact columns instead of one string per peptide
+def digest_proteins(fasta, sites, terminal, missed_cleavages,
+                    min_len, max_len, cut_sites=None):
+    '''
+    cut_sites : list, optional
+        The candidate site indexes of every protein, e.g. from site_scans.
+
+    Returns
+    -------
+    data : dict
+        'pro_ids', 'pro_seqs' : the protein ids and sequences.
+        'windows' : the 31-mer positions of all sites in their protein,
+            -1 for the sites without 31-mer.
+        'protein', 'start', 'end' : the protein index of each peptide and its
+            offsets in the protein sequence.
+        'left', 'right' : the indexes of the left and right site of each
+            peptide in 'windows', the sites in between are missed cleavage
+            sites, -1 for the peptides of proteins without any sites.
+    '''
+    data = {'pro_ids': [], 'pro_seqs': [], 'windows': array('l'),
+            'protein': array('l'), 'start': array('l'), 'end': array('l'),
+            'left': array('l'), 'right': array('l')}
+    for fasta_ind, (pro_id, pro_seq) in enumerate(fasta):
+        windows, digested_peps = digestion(
+            pro_seq, sites, terminal, missed_cleavages, min_len, max_len,
+            cut_sites[fasta_ind] if cut_sites is not None else None)
+        if len(digested_peps) == 0:
+            continue
+
+        pro_ind = len(data['pro_ids'])
+        site_ind = len(data['windows'])
+        data['pro_ids'].append(pro_id)
+        data['pro_seqs'].append(pro_seq)
+        data['windows'].extend(windows)
+        for start, end, left, right in digested_peps:
+            data['protein'].append(pro_ind)
+            data['start'].append(start)
+            data['end'].append(end)
+            if left == -1:
+                data['left'].append(-1)
+                data['right'].append(-1)
+            else:
+                data['left'].append(site_ind + left)
+                data['right'].append(site_ind + right)
+
+    return data
+
+
+# indexes of the residues of every protein that are a site of any of the
+# proteases, by residue, so that proteins are scanned once for all proteases
+def site_scans(proteins, residues):
+    scans = []
+    for pro_id, pro_seq in proteins:
+        scan = {aa: [] for aa in residues}
+        for ind, aa in enumerate(pro_seq):
+            if aa in scan:
+                scan[aa].append(ind)
+        scans.append(scan)
+    return scans
+
+
+# candidate site indexes of every protein for the sites of one protease
+def protease_cut_sites(scans, sites):
+    if len(sites) == 1:
+        return [scan[sites] for scan in scans]
+    return [sorted(ind for aa in sites for ind in scan[aa]) for scan in scans]
+
+
+# digest the same proteins for several proteases, given as (sites, terminal),
+# with one scan for the sites of all of them
+def digest_proteases(proteins, cleavages, missed_cleavages, min_len, max_len):
+    proteins = list(proteins)
+    scans = site_scans(proteins, set(''.join(sites for sites, terminal
+                                             in cleavages)))
+    return [digest_proteins(proteins, sites, terminal, missed_cleavages,
+                            min_len, max_len, protease_cut_sites(scans, sites))
+            for sites, terminal in cleavages]
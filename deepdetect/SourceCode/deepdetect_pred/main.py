@@ -18,9 +18,15 @@ LysargiNase. Please choose the consistent model for prediction.
 import time
 start = time.time()
 from read_fasta import read_fasta
-from in_silico_digestion import digestion
-from predictor import predictor
+from in_silico_digestion import digest_proteins, digest_proteases
+from in_silico_digestion import site_scans, protease_cut_sites
+from predictor import predictor, chunk_predictor, default_model_dir
+from itertools import islice
+import threading
+import queue
 import sys
+import os
+import json
 import getopt
 
 
@@ -69,34 +75,208 @@ def info(protease):
     return sites, terminal, padding_len
 
 
+# =============================================================================
+# Digest chunks of chunk_size proteins in a worker thread into a bounded queue,
+# so that the next chunks are digested while the models predict.
+# =============================================================================
+def digested_chunks(fasta, chunk_size, cleavages,
+                    missed_cleavages, min_len, max_len, skip=0):
+    # at most two digested chunks wait for the models
+    chunks = queue.Queue(maxsize=2)
+    errors = []
+    
+    def digest():
+        try:
+            # proteins already predicted by the run that is resumed
+            for protein in islice(fasta, skip):
+                pass
+            while True:
+                proteins = list(islice(fasta, chunk_size))
+                if len(proteins) == 0:
+                    break
+                chunks.put((len(proteins),
+                            digest_proteases(proteins, cleavages,
+                                             missed_cleavages, min_len,
+                                             max_len)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunks.put(None)
+    
+    worker = threading.Thread(target=digest, daemon=True)
+    worker.start()
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        yield chunk
+    worker.join()
+    if errors:
+        raise errors[0]
+
+
+# =============================================================================
+# The checkpoint of a chunked run records the parameters of the run, the number
+# of fasta proteins whose results are completely written and the sizes of the
+# result files at that point. It is replaced after every chunk and removed when
+# the run has finished.
+# =============================================================================
+def checkpoint_path(res_path):
+    return res_path + '.checkpoint'
+
+
+def run_params(data_path, regular, proteases, missed_cleavages,
+               min_len, max_len):
+    stat = os.stat(data_path)
+    return {'input': os.path.abspath(data_path), 'size': stat.st_size,
+            'mtime': stat.st_mtime, 'regular': regular,
+            'proteases': proteases, 'missed_cleavages': missed_cleavages,
+            'min_len': min_len, 'max_len': max_len}
+
+
+def write_checkpoint(res_path, params, proteins_num, results):
+    sizes = [res.sync() for res in results]
+    # Parquet results are only complete when they are closed
+    if None in sizes:
+        return
+    path = checkpoint_path(res_path)
+    with open(path + '.tmp', 'w') as checkpoint:
+        json.dump({'params': params, 'proteins': proteins_num,
+                   'sizes': sizes}, checkpoint)
+    os.replace(path + '.tmp', path)
+
+
+# number of proteins the checkpoint covers, after cutting the result files back
+# to the sizes they had at the checkpoint
+def read_checkpoint(res_path, res_paths, params):
+    path = checkpoint_path(res_path)
+    if not os.path.exists(path):
+        print("No checkpoint %s, starting from the first protein." % path)
+        return 0
+    with open(path) as checkpoint:
+        record = json.load(checkpoint)
+    if record['params'] != params:
+        print("Error: The checkpoint %s was written with other parameters or "
+              "another input file, cannot resume." % path)
+        sys.exit(1)
+    for res_path, size in zip(res_paths, record['sizes']):
+        if not os.path.exists(res_path) or os.path.getsize(res_path) < size:
+            print("Error: The results in %s are incomplete, cannot resume."
+                  % res_path)
+            sys.exit(1)
+        with open(res_path, 'r+b') as res:
+            res.truncate(size)
+    print("Resuming after %s proteins." % record['proteins'])
+    return record['proteins']
+
+
+# =============================================================================
+# Result file of one of several proteases, e.g. peptides_DD_Trypsin.txt.
+# =============================================================================
+def protease_path(res_path, protease):
+    root, ext = os.path.splitext(res_path)
+    return '%s_%s%s' % (root, protease, ext)
+
+
+# =============================================================================
+# Read fasta file once, in silico digestion, and prediction for each of
+# several proteases.
+# =============================================================================
+def DeepDetect_proteases(data_path, res_path, regular, proteases,
+                         missed_cleavages, min_len, max_len, batch_size=0,
+                         model_dir=default_model_dir):
+    # read fasta file
+    s1 = time.time()
+    proteins = list(read_fasta(data_path, regular))
+    
+    # one scan of the proteins for the sites of all proteases
+    scans = site_scans(proteins, set(''.join(info(protease)[0]
+                                             for protease in proteases)))
+    e1 = time.time()
+    print("Time cost of loading file and scanning sites is %s seconds."
+          % (e1 - s1))
+    
+    for protease in proteases:
+        print("-----%s-----" % protease)
+        sites, terminal, padding_len = info(protease)
+        s2 = time.time()
+        data = digest_proteins(proteins, sites, terminal,
+                               missed_cleavages, min_len, max_len,
+                               protease_cut_sites(scans, sites))
+        e2 = time.time()
+        print("Time cost of in silico digestion is %s seconds." % (e2 - s2))
+        predictor(protease, data, padding_len,
+                  protease_path(res_path, protease), batch_size, model_dir)
+
+
 # =============================================================================
 # Read fasta file, in silico digestion, and prediction.
 # =============================================================================
 def DeepDetect(data_path, res_path, regular, protease,
-               missed_cleavages, min_len, max_len):
+               missed_cleavages, min_len, max_len, batch_size=0,
+               chunk_size=0, resume=False, model_dir=default_model_dir):
+    # one protease or a comma-separated list of proteases, which are all
+    # digested from one read of the fasta file, each into its own result file
+    proteases = []
+    for name in protease.split(','):
+        if name not in proteases:
+            proteases.append(name)
+    cleavages = [info(name)[ : 2] for name in proteases]
+    padding_lens = [info(name)[2] for name in proteases]
+    if len(proteases) > 1:
+        res_paths = [protease_path(res_path, name) for name in proteases]
+    else:
+        res_paths = [res_path]
+    
+    # pipelined digestion and prediction of chunks of proteins, with a
+    # checkpoint after every chunk to resume from
+    if chunk_size > 0:
+        s1 = time.time()
+        fasta = read_fasta(data_path, regular)
+        params = run_params(data_path, regular, proteases, missed_cleavages,
+                            min_len, max_len)
+        skip = read_checkpoint(res_path, res_paths, params) if resume else 0
+        completed = [skip]
+        
+        def done(proteins_num, results):
+            completed[0] += proteins_num
+            write_checkpoint(res_path, params, completed[0], results)
+        
+        chunks = digested_chunks(fasta, chunk_size, cleavages,
+                                 missed_cleavages, min_len, max_len, skip)
+        chunk_predictor(proteases, chunks, padding_lens, res_paths, batch_size,
+                        skip > 0, done, model_dir)
+        if os.path.exists(checkpoint_path(res_path)):
+            os.remove(checkpoint_path(res_path))
+        e1 = time.time()
+        print("Time cost of in silico digestion and prediction is %s seconds."
+              % (e1 - s1))
+        return
+    elif resume:
+        print("Error: --resume needs the chunked mode (--chunk_size).")
+        sys.exit(1)
+    elif len(proteases) > 1:
+        DeepDetect_proteases(data_path, res_path, regular, proteases,
+                             missed_cleavages, min_len, max_len, batch_size,
+                             model_dir)
+        return
+    
     # hyper-parameters
     sites, terminal, padding_len = info(protease)
     
-    # read fasta file
+    # read fasta file, the proteins are digested while the file is read
     s1 = time.time()
     fasta = read_fasta(data_path, regular)
-    e1 = time.time()
-    print("Time cost of loading file is %s seconds." % (e1 - s1))
     
-    # in silico digestion
-    s2 =time.time()
-    data =[]
-    for protein in fasta:
-        pro_id, pro_seq = protein
-        digested_seqs = digestion(pro_seq, sites, terminal,
-                                  missed_cleavages, min_len, max_len)
-        for seqs in digested_seqs:
-            data += [[pro_id, seqs]]
-    e2 = time.time()
-    print("Time cost of in silico digestion is %s seconds." % (e2 - s2))
+    # in silico digestion into peptide offsets and cleavage site indexes
+    data = digest_proteins(fasta, sites, terminal,
+                           missed_cleavages, min_len, max_len)
+    e1 = time.time()
+    print("Time cost of loading file and in silico digestion is %s seconds."
+          % (e1 - s1))
     
     # prediction
-    predictor(protease, data, padding_len, res_path)
+    predictor(protease, data, padding_len, res_path, batch_size, model_dir)
 
 
 if __name__ == '__main__':
@@ -107,6 +287,15 @@ if __name__ == '__main__':
     missed_cleavages = 2
     min_len = 7
     max_len = 47
+    # 0 predicts all peptides at once, otherwise in length buckets of this size
+    batch_size = 0
+    # 0 digests all proteins first, otherwise chunks of this many proteins are
+    # predicted while the next chunks are digested
+    chunk_size = 0
+    # continue a chunked run from its checkpoint
+    resume = False
+    # directory of the model files
+    model_dir = default_model_dir
     
     # input hyper-parameters
     if len(sys.argv[1:]) <= 1:
@@ -119,7 +308,9 @@ if __name__ == '__main__':
         options, remainder = getopt.getopt(sys.argv[1:], '',
                                            ['input=', 'output=', 'regular=',
                                            'protease=', 'missed_cleavages=',
-                                           'min_len=', 'max_len='])
+                                           'min_len=', 'max_len=',
+                                           'batch_size=', 'chunk_size=',
+                                           'resume', 'model_dir='])
         for opt, arg in options:
             if opt == '--input':
                 data_path = arg
@@ -135,6 +326,14 @@ if __name__ == '__main__':
                 min_len = int(arg)
             elif opt == '--max_len':
                 max_len = int(arg)
+            elif opt == '--batch_size':
+                batch_size = int(arg)
+            elif opt == '--chunk_size':
+                chunk_size = int(arg)
+            elif opt == '--resume':
+                resume = True
+            elif opt == '--model_dir':
+                model_dir = arg
             else:
                 print ("Error: Argument: %s is not recognized.\n"
                        "Exiting..." % opt)
@@ -142,7 +341,8 @@ if __name__ == '__main__':
     
     # in silico digesetion and prediction
     DeepDetect(data_path, res_path, regular, protease,
-               missed_cleavages, min_len, max_len)
+               missed_cleavages, min_len, max_len, batch_size, chunk_size,
+               resume, model_dir)
     e0 = time.time()
     print("Time cost of the program is %s seconds." % (e0 - s0))
     
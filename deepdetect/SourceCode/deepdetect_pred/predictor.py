@@ -2,21 +2,32 @@
 from keras.preprocessing.sequence import pad_sequences as padding
 import numpy as np
 import time
-import re
-from math import sqrt
 import os
+import sys
+import json
+from contextlib import ExitStack
+from itertools import islice
+from numpy.lib.stride_tricks import as_strided
+from in_silico_digestion import nearnum
+
+# directory of the model files, DeepDetect/ of the repository by default
+default_model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', '..', 'DeepDetect')
+
+# amino acid dictionaries
+dics = {
+    'peptides': {'A': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5, 'G': 6, 'H': 7, 'I': 8, 'K': 9,
+                 'L': 10, 'M': 11, 'N': 12, 'P': 13, 'Q': 14, 'R': 15, 'S': 16, 'T': 17,
+                 'V': 18, 'W': 19, 'Y': 20},
+    '31mers': {'A': 0, 'C': 1, 'D': 2, 'E': 3, 'F': 4, 'G': 5, 'H': 6, 'I': 7, 'K': 8,
+               'L': 9, 'M': 10, 'N': 11, 'P': 12, 'Q': 13, 'R': 14, 'S': 15, 'T': 16,
+               'V': 17, 'W': 18, 'Y': 19, 'Z': 20},
+}
+
 
 # peptide / 31-mer coding
 def coding(seq_type, seqs):
-    # amino acid dictionaries
-    if seq_type == 'peptides':
-        dic = {'A': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5, 'G': 6, 'H': 7, 'I': 8, 'K': 9,
-               'L': 10, 'M': 11, 'N': 12, 'P': 13, 'Q': 14, 'R': 15, 'S': 16, 'T': 17,
-               'V': 18, 'W': 19, 'Y': 20}
-    elif seq_type == '31mers':
-        dic = {'A': 0, 'C': 1, 'D': 2, 'E': 3, 'F': 4, 'G': 5, 'H': 6, 'I': 7, 'K': 8,
-               'L': 9, 'M': 10, 'N': 11, 'P': 12, 'Q': 13, 'R': 14, 'S': 15, 'T': 16,
-               'V': 17, 'W': 18, 'Y': 19, 'Z': 20}
+    dic = dics[seq_type]
     
     # coding
     coded_seqs = []
@@ -27,16 +38,130 @@ def coding(seq_type, seqs):
     return coded_seqs
 
 
-# predicting
-def predictor(protease, data, padding_len, res_path):
-    print("Loading model.")
-    s3 = time.time()
-    
+# byte --> code table of a dictionary, 255 for the bytes not in it
+def coding_table(seq_type):
+    table = np.full(256, 255, dtype=np.uint8)
+    for aa, code in dics[seq_type].items():
+        table[ord(aa)] = code
+    return table
+
+
+# 31-mers of the sites, taken from all proteins coded once into one
+# uint8 array in which every protein is surrounded by 'Z' padding
+def coding_mers(pro_seqs, site_pro, windows):
+    pad = 'Z' * nearnum
+    # non-ASCII residues become '?' so that every residue is one byte
+    codes = coding_table('31mers')[np.frombuffer(
+        (pad + pad.join(pro_seqs) + pad).encode('ascii', 'replace'),
+        dtype=np.uint8)]
+
+    # start of every protein in the codes
+    lens = np.array([len(pro_seq) for pro_seq in pro_seqs], dtype=np.int64)
+    pro_start = np.zeros(len(pro_seqs), dtype=np.int64)
+    pro_start[1:] = np.cumsum(lens + nearnum)[:-1]
+
+    # all 31-mers of the codes as a strided view, of which the windows of the
+    # sites are gathered into the input matrix
+    mer_len = 2 * nearnum + 1
+    all_mers = as_strided(codes, shape=(len(codes) - mer_len + 1, mer_len),
+                          strides=(codes.strides[0], codes.strides[0]))
+    return all_mers[pro_start[site_pro] + windows]
+
+
+# BiLSTM model with a free sequence length instead of padding_len, so that every
+# bucket of peptides is only padded to its own longest peptide
+def free_length_model(model_json, model):
+    config = json.loads(model_json)
+    for layer in config['config']['layers']:
+        if 'batch_input_shape' in layer['config']:
+            layer['config']['batch_input_shape'] = [None, None]
+        if 'input_length' in layer['config']:
+            layer['config']['input_length'] = None
+    free_model = model_from_json(json.dumps(config))
+    free_model.set_weights(model.get_weights())
+    return free_model
+
+
+# BiLSTM prediction in buckets of at most batch_size peptides of similar length,
+# scattered back into the order of the peptides; the padded positions are
+# masked (mask_zero), so the results are those of the peptides padded to
+# padding_len
+def bucket_predict(model, coded_peps, padding_len, batch_size):
+    lens = np.minimum([len(coded_pep) for coded_pep in coded_peps], padding_len)
+    order = np.argsort(lens, kind='mergesort')
+    bilstm_pred = np.zeros(len(coded_peps), dtype=np.float32)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start : start + batch_size]
+        x_peps = padding([coded_peps[ind] for ind in bucket],
+                         maxlen=int(lens[bucket].max()),
+                         padding='post', truncating='post', value=0)
+        bilstm_pred[bucket] = model.predict(x_peps).reshape(-1)
+    return bilstm_pred
+
+
+# peptide detectabilities from the BiLSTM detectabilities of the peptides and
+# the predicted probabilities of missed digestion of the sites, in float64 and
+# in the same order of operations as per peptide in Python floats
+def detectabilities(bilstm_pred, sites_pred, windows, left, right):
+    bilstm_prob = np.asarray(bilstm_pred, dtype=np.float64).reshape(-1)
+    sites_prob = np.asarray(sites_pred, dtype=np.float64).reshape(-1)
+    has_mer = np.asarray(windows) != -1
+    left = np.asarray(left)
+    right = np.asarray(right)
+
+    # peptides of proteins without any sites only have the BiLSTM detectability
+    no_sites = left == -1
+    left = np.where(no_sites, 0, left)
+    right = np.where(no_sites, 0, right)
+
+    # The model predicted the probabilities of missed digestion!!!
+    # digestibilities of the left and right 31-mers, 1 for sites without 31-mer
+    ones = np.ones(len(left))
+    left_dig = np.where(has_mer[left], 1 - sites_prob[left], ones) \
+        if len(sites_prob) > 0 else ones
+    right_dig = np.where(has_mer[right], 1 - sites_prob[right], ones) \
+        if len(sites_prob) > 0 else ones
+
+    # digestibilities of the missed 31-mers: the sites between the left and
+    # right site, gathered into one array with CSR-style offsets per peptide
+    missed_num = np.maximum(right - left - 1, 0)
+    offsets = np.zeros(len(left) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(missed_num)
+    missed_sites = np.repeat(left + 1 - offsets[:-1], missed_num) + \
+        np.arange(offsets[-1])
+    # a trailing 1 keeps the offsets of the last peptides inside the array,
+    # reduceat gives the first value of an empty slice, so those are set to 1
+    missed_probs = np.append(sites_prob[missed_sites], 1.0)
+    missed_dig = np.where(missed_num > 0,
+                          np.multiply.reduceat(missed_probs, offsets[:-1]),
+                          ones) if len(left) > 0 else ones
+
+    # peptide digestibility and detectability; the digestibility is multiplied
+    # out first, sqrt(bilstm_prob * left_dig * right_dig * missed_dig) rounds
+    # differently from the per-peptide results
+    dig_prob = left_dig * right_dig * missed_dig
+    return np.where(no_sites, bilstm_prob, np.sqrt(bilstm_prob * dig_prob))
+
+
+# model files of one protease
+def model_files(protease, model_dir=default_model_dir):
+    return [os.path.join(model_dir, f'{model}_{protease}.{ext}')
+            for model in ['BiLSTM', 'DeepDigest'] for ext in ['json', 'h5']]
+
+
+# single file with the architectures and weights of both models of a protease,
+# written once by convert_models.py
+def npz_path(protease, model_dir=default_model_dir):
+    return os.path.join(model_dir, f'DeepDetect_{protease}.npz')
+
+
+# loading the BiLSTM and DeepDigest models from their JSON and h5 files
+def load_h5_models(protease, model_dir=default_model_dir):
     # loading BiLSTM model with Linux path syntax
     try:
     	print("Attempting to load BiLSTM model from JSON and weights...")
-    	json_bilstm = os.path.join('..', '..', 'DeepDetect', f'BiLSTM_{protease}.json')
-    	h5_bilstm = os.path.join('..', '..', 'DeepDetect', f'BiLSTM_{protease}.h5')
+    	json_bilstm = os.path.join(model_dir, f'BiLSTM_{protease}.json')
+    	h5_bilstm = os.path.join(model_dir, f'BiLSTM_{protease}.h5')
 
     	import json
     	import h5py
@@ -83,45 +208,228 @@ def predictor(protease, data, padding_len, res_path):
     	raise
 
     # loading DeepDigest model
-    json_deepdigest = os.path.join('..', '..', 'DeepDetect', f'DeepDigest_{protease}.json')
-    h5_deepdigest = os.path.join('..', '..', 'DeepDetect', f'DeepDigest_{protease}.h5')
+    json_deepdigest = os.path.join(model_dir, f'DeepDigest_{protease}.json')
+    h5_deepdigest = os.path.join(model_dir, f'DeepDigest_{protease}.h5')
     
     with open(json_deepdigest, 'r') as deepdigest:
         model_deepdigest = deepdigest.read()
     loaded_model_deepdigest = model_from_json(model_deepdigest)
     loaded_model_deepdigest.load_weights(h5_deepdigest)
+    return model_bilstm, loaded_model_bilstm, model_deepdigest, \
+        loaded_model_deepdigest
+
+
+# loading the BiLSTM and DeepDigest models from the converted npz file
+def load_npz_models(protease, model_dir=default_model_dir):
+    with np.load(npz_path(protease, model_dir)) as models:
+        model_bilstm = str(models['bilstm_json'])
+        loaded_model_bilstm = model_from_json(model_bilstm)
+        loaded_model_bilstm.set_weights(
+            [models['bilstm_%s' % ind] for ind in range(int(models['bilstm_num']))])
+        model_deepdigest = str(models['deepdigest_json'])
+        loaded_model_deepdigest = model_from_json(model_deepdigest)
+        loaded_model_deepdigest.set_weights(
+            [models['deepdigest_%s' % ind]
+             for ind in range(int(models['deepdigest_num']))])
+    return model_bilstm, loaded_model_bilstm, model_deepdigest, \
+        loaded_model_deepdigest
+
+
+# loading the BiLSTM and DeepDigest models, from the converted npz file if it
+# is newer than the model files
+def load_models(protease, batch_size=0, model_dir=default_model_dir):
+    print("Loading model.")
+    s3 = time.time()
+    
+    npz = npz_path(protease, model_dir)
+    if os.path.exists(npz) and all(
+            not os.path.exists(path) or
+            os.path.getmtime(path) <= os.path.getmtime(npz)
+            for path in model_files(protease, model_dir)):
+        print("Loading models from %s" % npz)
+        model_bilstm, loaded_model_bilstm, _, loaded_model_deepdigest = \
+            load_npz_models(protease, model_dir)
+    else:
+        model_bilstm, loaded_model_bilstm, _, loaded_model_deepdigest = \
+            load_h5_models(protease, model_dir)
     
     e3 = time.time()
     print("Time cost of loading model is %s seconds." % (e3 - s3))
-    
-    # prediction
-    print("Predicting! Please wait...")
-    s4 = time.time()
-    
-    # extract all the peptides and 31-mers
+
+    if batch_size > 0:
+        # length-bucketed batches
+        loaded_model_bilstm = free_length_model(model_bilstm,
+                                                loaded_model_bilstm)
+    return loaded_model_bilstm, loaded_model_deepdigest
+
+
+# BiLSTM detectabilities of the peptides and DeepDigest probabilities of missed
+# digestion of the sites of digested data
+def predict_data(models, data, padding_len, batch_size=0):
+    loaded_model_bilstm, loaded_model_deepdigest = models
+
+    # extract all the peptides from their offsets
+    pro_seqs = data['pro_seqs']
+    windows = data['windows']
     peps = []
-    mers = []
-    for line in data:
-        seqs = re.split('[\t,]', line[1])
-        peps.append(seqs[0])  # Using append for clarity
-        mers.extend(mer for mer in seqs[1:] if len(mer) > 1)  # Using extend instead of += for clarity
-    print("There are %s in silico digested peptides.\n"
-          "There are %s candidate cleavage sites." % (len(peps), len(mers)))
+    # protein of every site that is the left, right or a missed cleavage
+    # site of a peptide, -1 for the unused sites
+    site_pro = np.full(len(windows), -1, dtype=np.int64)
+    for pro_ind, start, end, left, right in zip(data['protein'], data['start'],
+                                                data['end'], data['left'],
+                                                data['right']):
+        peps.append(pro_seqs[pro_ind][start : end])
+        if left != -1:
+            site_pro[left : right + 1] = pro_ind
+
+    # every site is shared by many peptides, so its 31-mer is predicted once,
+    # the sites without 31-mer have a digestibility of 1
+    sites = np.flatnonzero((site_pro != -1) & (np.asarray(windows) != -1))
+    x_mers = coding_mers(pro_seqs, site_pro[sites], np.asarray(windows)[sites])
 
     #==============================================================================    
     #     BiLSTM prediction
     #==============================================================================    
-    coded_peps = coding('peptides', peps)
-    x_peps = padding(coded_peps, maxlen=padding_len,
-                     padding='post', truncating='post', value=0)
-    bilstm_pred = loaded_model_bilstm.predict(x_peps).squeeze()
+    # peptides shared by several proteins are predicted once and the
+    # detectabilities are broadcast back to all their rows
+    unique_inds = {}
+    pep_inds = np.array([unique_inds.setdefault(pep, len(unique_inds))
+                         for pep in peps], dtype=np.int64)
+    coded_peps = coding('peptides', sorted(unique_inds, key=unique_inds.get))
+    if batch_size > 0:
+        unique_pred = bucket_predict(loaded_model_bilstm, coded_peps,
+                                     padding_len, batch_size)
+    else:
+        x_peps = padding(coded_peps, maxlen=padding_len,
+                         padding='post', truncating='post', value=0)
+        unique_pred = loaded_model_bilstm.predict(x_peps).reshape(-1)
+    bilstm_pred = unique_pred[pep_inds]
     
     #==============================================================================    
     #     DeepDigest prediction
     #==============================================================================    
-    x_mers = np.array(coding('31mers', mers))
-    mers_pred = loaded_model_deepdigest.predict(x_mers).squeeze()
+    sites_pred = np.zeros(len(windows), dtype=np.float32)
+    if len(sites) > 0:
+        mers_pred = loaded_model_deepdigest.predict(x_mers).squeeze()
+        sites_pred = sites_pred.astype(mers_pred.dtype)
+        sites_pred[sites] = mers_pred
+
+    return peps, bilstm_pred, sites_pred, len(unique_inds), len(sites)
+
+
+# detectabilities of the peptides of digested data
+def data_detectabilities(data, bilstm_pred, sites_pred):
+    return detectabilities(bilstm_pred, sites_pred, data['windows'],
+                           data['left'], data['right'])
+
+
+# result columns
+header = ['Protein id', 'Peptide sequence', 'Peptide detectability']
+
+
+# streaming TSV results, every batch is written when it is produced
+class TsvResults:
+    def __init__(self, res_path, append=False):
+        # append to the results of a resumed run
+        if append:
+            self.res = open(res_path, 'a')
+        else:
+            self.res = open(res_path, 'w')
+            self.res.write('\t'.join(header) + '\n')
+
+    # rows of the digested data, with the full float64 detectabilities, as
+    # written by np.savetxt before
+    def write(self, data, peps, det_probs):
+        pro_ids = data['pro_ids']
+        rows = zip(data['protein'], peps, det_probs.tolist())
+        # formatted in blocks of rows to bound the memory of the text
+        while True:
+            block = ''.join('%s\t%s\t%s\n' % (pro_ids[pro_ind], pep, det_prob)
+                            for pro_ind, pep, det_prob in islice(rows, 100000))
+            if len(block) == 0:
+                break
+            self.res.write(block)
+
+    # flushes the results to disk and returns the file size
+    def sync(self):
+        self.res.flush()
+        os.fsync(self.res.fileno())
+        return os.fstat(self.res.fileno()).st_size
+
+    def close(self):
+        self.res.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# streaming Parquet results with float32 detectabilities and the protein ids
+# dictionary-encoded straight from the protein index column, every batch is
+# written as a row group
+class ParquetResults:
+    def __init__(self, res_path, append=False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print("Error: Writing Parquet results needs pyarrow, "
+                  "please install it or write a .txt file.")
+            sys.exit(1)
+        if append:
+            print("Error: Parquet results cannot be appended to.")
+            sys.exit(1)
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+            (header[0], pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            (header[1], pyarrow.string()),
+            (header[2], pyarrow.float32())])
+        self.res = pyarrow.parquet.ParquetWriter(res_path, self.schema)
+
+    def write(self, data, peps, det_probs):
+        pa = self.pa
+        pro_ids = pa.DictionaryArray.from_arrays(
+            pa.array(np.asarray(data['protein'], dtype=np.int32)),
+            pa.array(data['pro_ids'], type=pa.string()))
+        self.res.write_table(pa.Table.from_arrays(
+            [pro_ids, pa.array(peps, type=pa.string()),
+             pa.array(det_probs.astype(np.float32))], schema=self.schema))
+
+    def sync(self):
+        return None
+
+    def close(self):
+        self.res.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# open the result file, Parquet for .parquet files, otherwise TSV
+def open_results(res_path, append=False):
+    if res_path.endswith('.parquet'):
+        return ParquetResults(res_path, append)
+    return TsvResults(res_path, append)
+
+
+# predicting
+def predictor(protease, data, padding_len, res_path, batch_size=0,
+              model_dir=default_model_dir):
+    models = load_models(protease, batch_size, model_dir)
     
+    # prediction
+    print("Predicting! Please wait...")
+    s4 = time.time()
+    peps, bilstm_pred, sites_pred, unique_num, sites_num = predict_data(
+        models, data, padding_len, batch_size)
+    print("There are %s in silico digested peptides (%s unique).\n"
+          "There are %s candidate cleavage sites."
+          % (len(peps), unique_num, sites_num))
     e4 = time.time()
     print("Time cost of prediction is %s seconds." % (e4 - s4))
     
@@ -130,65 +438,52 @@ def predictor(protease, data, padding_len, res_path):
     # =============================================================================
     print("Calculating peptide detectabilities.")
     s5 = time.time()
-    bilstm_ind = 0  # bilstm detectability
-    dig_ind = 0  # digestibility
-    results = []
-    
-    for line in data:
-        pro_id, seqs = line
-        seqs_list = seqs.split('\t')
-        bilstm_prob = float(bilstm_pred[bilstm_ind])
-        bilstm_ind += 1
-        
-        # The model predicted the probabilities of missed digestion!!!
-        if len(seqs_list) == 4:
-            pep, left_mer, right_mer, missed_mers = seqs_list
-            
-            # digestibility of the left 31-mer
-            if left_mer != '*':
-                left_dig = 1 - float(mers_pred[dig_ind])
-                dig_ind += 1
-            else:
-                left_dig = float(1)
-            
-            # digestibility of the right 31-mer
-            if right_mer != '*':
-                right_dig = 1 - float(mers_pred[dig_ind])
-                dig_ind += 1
-            else:
-                right_dig = float(1)
-            
-            # digestibilities of the missed 31-mers
-            missed_sites = missed_mers.split(',')
-            missed_probs = ''
-            missed_dig = float(1)
-            for site in missed_sites:
-                if len(site) == 31:
-                    prob = float(mers_pred[dig_ind])
-                    dig_ind += 1
-                    missed_probs += str(1 - prob) + ','
-                    missed_dig *= prob
-                elif site != '':
-                    print(line)
-                    print(site)
-                    
-            # peptide digestibility
-            dig_prob = left_dig * right_dig * missed_dig
-            
-            # peptide detectability
-            det_prob = sqrt(bilstm_prob * dig_prob)
-            results.append([pro_id, pep, det_prob])  # Using append for clarity
-        elif len(seqs_list) == 1:
-            results.append(line + [bilstm_prob])  # Using append for clarity
-    
+    det_probs = data_detectabilities(data, bilstm_pred, sites_pred)
     e5 = time.time()
     print("Time cost of calculation is %s seconds." % (e5 - s5))
     
     # save results
     s6 = time.time()
-    np.savetxt(res_path, results, fmt='%s\t%s\t%s',
-               delimiter='\t', newline='\n',
-               header='Protein id\tPeptide sequence\tPeptide detectability',
-               comments='')
+    with open_results(res_path) as res:
+        res.write(data, peps, det_probs)
     e6 = time.time()
     print("Time cost of saving results is %s seconds." % (e6 - s6))
+
+
+# predicting chunks of digested data as they come in, e.g. while the next
+# chunks are still digested, and writing the results of every chunk at once;
+# every chunk is the number of fasta proteins it covers and the digested data
+# of each of the proteases, whose models stay loaded for the whole run;
+# done(proteins_num, results) is called when the results of a chunk are written
+def chunk_predictor(proteases, chunks, padding_lens, res_paths, batch_size=0,
+                    append=False, done=None, model_dir=default_model_dir):
+    models = [load_models(protease, batch_size, model_dir)
+              for protease in proteases]
+
+    print("Predicting! Please wait...")
+    fasta_num = 0
+    peps_num = [0] * len(proteases)
+    sites_num = [0] * len(proteases)
+    with ExitStack() as stack:
+        results = [stack.enter_context(open_results(res_path, append))
+                   for res_path in res_paths]
+        for proteins_num, datas in chunks:
+            for ind, data in enumerate(datas):
+                # chunks of proteins without any peptides
+                if len(data['pro_ids']) == 0:
+                    continue
+                peps, bilstm_pred, sites_pred, _, chunk_sites = predict_data(
+                    models[ind], data, padding_lens[ind], batch_size)
+                results[ind].write(data, peps, data_detectabilities(
+                    data, bilstm_pred, sites_pred))
+                peps_num[ind] += len(peps)
+                sites_num[ind] += chunk_sites
+            fasta_num += proteins_num
+            if done is not None:
+                done(proteins_num, results)
+            print("Predicted %s peptides of %s proteins."
+                  % (sum(peps_num), fasta_num))
+    for ind, protease in enumerate(proteases):
+        print("%s: There are %s in silico digested peptides.\n"
+              "There are %s candidate cleavage sites."
+              % (protease, peps_num[ind], sites_num[ind]))
@@ -1,6 +1,29 @@
 import os
 import sys
 import re
+import mmap
+
+
+# yield the (name, sequence) records of a memory-mapped fasta file
+def fasta_records(records, regular):
+    try:
+        pos = records.find(b'>')
+        while pos != -1:
+            # a header runs from '>' to the end of its line
+            line_end = records.find(b'\n', pos)
+            if line_end == -1:
+                break
+            header = records[pos : line_end].rstrip(b'\r').decode()
+
+            # the sequence runs up to the next '>'
+            pos = records.find(b'>', line_end + 1)
+            end = pos if pos != -1 else len(records)
+            sequence = records[line_end + 1 : end].decode()
+
+            name = re.split(regular, header)[1]
+            yield name, sequence.replace('\r', '').replace('\n', '')
+    finally:
+        records.close()
 
 
 # read fasta file
@@ -9,27 +32,24 @@ def read_fasta(file, regular):
     if not os.path.exists(file):
         print("Error: The input file does not exist. Please check again.")
         sys.exit(1)
-    
-    # record protein names and sequences
-    with open(file) as fasta:
-        records = fasta.read()
-    
+
+    # map the file into memory instead of reading it into one string
+    with open(file, 'rb') as fasta:
+        if os.fstat(fasta.fileno()).st_size == 0:
+            print("Error: The input file seems not in FASTA format!")
+            sys.exit(1)
+        records = mmap.mmap(fasta.fileno(), 0, access=mmap.ACCESS_READ)
+
     # FASTA file must start with character '>'
-    if re.search('>', records) == None:
+    if records.find(b'>') == -1:
+        records.close()
         print("Error: The input file seems not in FASTA format!")
         sys.exit(1)
     # check the regular expression
-    elif re.search(regular, records) == None:
+    elif re.search(regular.encode(), records) == None:
+        records.close()
         print("Error: Cannot parse the fasta file by the regular expression.")
         sys.exit(1)
-    
-    # fasta list
-    records = re.split('(>.*?)\\n', records)[1:]
-    length = len(records)
-    fasta_list = []
-    for ind in range(0, length, 2):
-        name = re.split(regular, records[ind])[1]
-        sequence = records[ind + 1].replace('\n', '')
-        fasta_list += [[name, sequence]]
-    
-    return fasta_list
\ No newline at end of file
+
+    # fasta records, read while they are digested
+    return fasta_records(records, regular)
\ No newline at end of file
@@ -0,0 +1,434 @@
+"""
+The in silico digestion, coding and detectability calculation of DeepDetect
+before they were vectorized, as the reference the tests compare against, and
+the random proteins and stand-in models the tests run them on.
+"""
+from math import sqrt
+import random
+import re
+import numpy as np
+
+
+# hyper-parameters
+nearnum = 15
+illegal_mer = 'BJOUX'
+illegal_pep = 'BJOUXZ'
+
+
+# get the left and right mers of the sites
+def left_and_right_mer(pro_seq, ed_ind, cut_sites):
+    global nearnum
+    
+    # left mers
+    left_len = len(pro_seq[ : cut_sites[ed_ind]])
+    if left_len >= nearnum:
+        left_mer = pro_seq[cut_sites[ed_ind] - nearnum :
+                           cut_sites[ed_ind] + 1]
+    else:
+        left_mer = 'Z' * (nearnum - left_len) +\
+                        pro_seq[ : cut_sites[ed_ind] + 1]
+    
+    # right mers
+    right_len = len(pro_seq[cut_sites[ed_ind] + 1 : ])
+    if right_len >= nearnum:
+        right_mer = pro_seq[cut_sites[ed_ind] + 1 :
+                            cut_sites[ed_ind] + 1 + nearnum]
+    else:
+        right_mer = pro_seq[cut_sites[ed_ind] + 1 : ] +\
+                        'Z' * (nearnum - right_len)
+    
+    # left_mer = '...K/R', right_mer = '...',
+    # then use full_mer to get left_mer + right_mer = '...K/R...'
+    return left_mer, right_mer
+
+
+# get the full 31-mer of the sites
+def full_mer(pro_seq, ed_ind, cut_sites):
+    if all([ed_ind > 0,
+            ed_ind < len(cut_sites) - 1,
+            cut_sites[ed_ind] != cut_sites[0]]):
+        left_mer, right_mer = left_and_right_mer(pro_seq, ed_ind, cut_sites)
+        mer = left_mer + right_mer
+    else:
+        mer = '*'
+    return mer
+
+
+# get the N-terminal digested peptides and the corresponding mers
+def nterminal_pep_and_mers(pro_seq, cut_sites, terminal, missed_cleavages,
+                           min_len, max_len):
+    nterm_seqs = []
+    for add_ind in range(1, len(cut_sites)):
+        # check the number of missed cleavage sites
+        if add_ind >= missed_cleavages + 2:
+            break
+        
+        # the digested peptide with different cutting terminals
+        if terminal =='C':
+            pep = pro_seq[cut_sites[0] + 1 : cut_sites[add_ind] + 1]
+        else:
+            pep = pro_seq[cut_sites[0] : cut_sites[add_ind]]
+        
+        # get the corresponding mers of the N-terminal digested peptide
+        lpep = len(pep)
+# =============================================================================
+#         If the protein N-terminal amino acid is a candidate site and cutting
+#         terminal is the N-term, then the digested peptide will be '' and the
+#         whole loop should be broken. Otherwise, the N-terminal digested 
+#         peptides will be generated twice.
+# =============================================================================
+        if pep == '':
+            break
+# =============================================================================
+#         If the shorter digested peptide (in this loop) includes illegal 
+#         amino acid(s), then the longer digested peptide (in subsequent loops
+#         ) containing the shorter digested peptide (in this loop) will also 
+#         includes illegal amino acid(s). Thus, the whole loop should be 
+#         broken, too.
+# =============================================================================
+        elif len(set(illegal_pep) - set(pep)) != 6:
+            break
+# =============================================================================
+#         The N-terminal digested peptides starting with M have two possible 
+#         cases, e.g., MPEPTIDESK | PEPTIDESK, and the digestibility of the 
+#         C-terminal cutting site is also set to 1 even if the site is 'M'.
+# =============================================================================
+        elif lpep >= min_len and lpep <= max_len + 1:
+            # 31-mer of left site
+            left_mer = full_mer(pro_seq, 0, cut_sites)
+            if len(set(illegal_mer) - set(left_mer)) != 5:
+                continue
+            # 31-mer of right site
+            right_mer = full_mer(pro_seq, add_ind, cut_sites)
+            if len(set(illegal_mer) - set(right_mer)) != 5:
+                continue
+            missed_mers =''
+            # if add_ind > 1, then there is/are cleavage site/sites
+            if add_ind > 1:
+                # 31-mers of missed cleavage sites
+                # missed_num is the number of missed cleavage sites
+                for missed_num in range(1, add_ind):
+                    missed_left, missed_right = \
+                        left_and_right_mer(pro_seq, missed_num, cut_sites)
+                    missed_mer = missed_left + missed_right
+                    missed_mers += (missed_mer + ',')
+            # check illegal amino acids
+            if len(set(illegal_mer) - set(missed_mers)) != 5:
+                continue
+            mers = left_mer + '\t' + right_mer + '\t' + missed_mers.rstrip(',')
+            
+            # check the two cases starting with and without 'M'
+            if lpep <= max_len:
+                nterm_seqs += [pep + '\t' + mers]
+            if pep[0] == 'M' and lpep - 1 >= min_len:
+                nterm_seqs += [pep[1:] + '\t' + mers]
+    
+    # [peptide, left_mer, right_mer, missed_mers]
+    return nterm_seqs
+
+
+# get all theoretical peptides and corresponding 31-mers for each protein
+def peps_and_mers(pro_seq, cut_sites, terminal,
+                  missed_cleavages, min_len, max_len):
+    '''
+    Parameters
+    ----------
+    pro_seq : str
+        The protein sequence.
+    cut_sites : list
+        The locations of all the candidate sites in the protein sequence.
+    terminal : str
+        The cutting terminal.
+    missed_cleavages : int
+        The maximum number of missed cleavage sites allowed in the peptides.
+    min_len : int
+        The minimum length of digested peptides.
+    max_len : int
+        The maximum length of digested peptides.
+    
+    Returns
+    -------
+    seqs : list
+        The list of digested peptides with corresponding 31-mers.
+    '''
+    # the N-terminal digested peptides and the corresponding mers
+    seqs = nterminal_pep_and_mers(pro_seq, cut_sites, terminal,
+                                  missed_cleavages, min_len, max_len)
+    
+    len_cut = len(cut_sites)
+    # index of the left site's position (started with the first site)
+    for st_ind in range(1, len_cut - 1):
+        # the number of sites on the peptide
+        for add_ind in range(1, len_cut - st_ind):
+            # check the number of missed cleavage sites
+            if add_ind >= missed_cleavages + 2:
+                break
+            
+            # the digested peptide with different cutting terminals
+            if terminal =='C':
+                pep = pro_seq[cut_sites[st_ind] + 1 :
+                              cut_sites[st_ind + add_ind] + 1]
+            else:
+                pep = pro_seq[cut_sites[st_ind] :
+                              cut_sites[st_ind + add_ind]]
+            
+            # get the corresponding mers of the digested peptide
+            lpep = len(pep)
+# =============================================================================
+#         If the shorter digested peptide (in this loop) includes illegal 
+#         amino acid(s), then the longer digested peptide (in subsequent loops
+#         ) containing the shorter digested peptide (in this loop) will also 
+#         includes illegal amino acid(s). Thus, the whole loop should be 
+#         broken, too.
+# =============================================================================
+            if len(set(illegal_pep) - set(pep)) != 6:
+                break
+            elif lpep >= min_len and lpep <= max_len:
+                # 31-mer of left site
+                left_mer = full_mer(pro_seq, st_ind, cut_sites)
+                if len(set(illegal_mer) - set(left_mer)) != 5:
+                    continue
+                # 31-mer of right site
+                right_mer = full_mer(pro_seq, st_ind + add_ind, cut_sites)
+                if len(set(illegal_mer) - set(right_mer)) != 5:
+                    continue
+                missed_mers = ''
+                # if add_ind > 1, then there is/are cleavage site/sites
+                if add_ind > 1:
+                    # 31-mers of missed cleavage sites
+                    for missed_num in range(1, add_ind):
+                    # missed_num is the number of missed cleavage sites
+                        missed_left, missed_right =\
+                            left_and_right_mer(pro_seq, st_ind + missed_num,
+                                               cut_sites)
+                        missed_mer = missed_left + missed_right
+                        missed_mers += (missed_mer + ',')
+                # check illegal amino acids
+                if len(set(illegal_mer) - set(missed_mers)) != 5:
+                    continue
+                seqs += [pep + '\t' + left_mer + '\t' + right_mer +
+                         '\t' + missed_mers.rstrip(',')]
+    
+    # [peptide, left_mer, right_mer, missed_mers]
+    return seqs
+
+
+# protein --> peptide | left 31-mer | right 31-mer | missed 31-mers
+def digestion(pro_seq, sites, terminal, missed_cleavages, min_len, max_len):
+    lpro = len(pro_seq)
+    
+    # indexes of the candidate cleavage sites
+    cut_sites = [ind for ind in range(lpro) if pro_seq[ind] in sites]
+    # indexes of the start and end positions
+# =============================================================================
+#     There are some differences between C-terminal and N-terminal cleavage, 
+#     but both need to start at the first amino acid and end at the last one.
+# =============================================================================
+    if terminal == 'C':
+        cut_sites.insert(0, -1)
+        if cut_sites[-1] != lpro - 1:
+            cut_sites += [lpro - 1]
+    else:
+        cut_sites.insert(0, 0)
+        cut_sites += [lpro]
+    
+    # check if there is any candidate sites to cut
+    digested_seqs = []
+    if len(cut_sites) > 2:
+        digested_seqs += peps_and_mers(pro_seq, cut_sites, terminal,
+                                       missed_cleavages, min_len, max_len)
+    elif len(set(illegal_pep) - set(pro_seq)) != 6:
+        print("Warning: Protein sequence %s has illegal amino acid(s) "
+              "without any candidate sites!" % pro_seq)
+    elif lpro >= min_len and lpro <= max_len + 1:
+        print("Warning: Protein sequence %s has no candidate sites!"
+              % pro_seq)
+        if lpro <= max_len:
+            digested_seqs += [pro_seq]
+        if pro_seq[0] == 'M' and lpro - 1 >= min_len:
+            digested_seqs += [pro_seq[1:]]
+    
+    return digested_seqs
+
+
+# protein --> [protein id, digested peptide line] as main.py built its data
+def baseline_data(proteins, sites, terminal, missed_cleavages,
+                  min_len, max_len):
+    data = []
+    for pro_id, pro_seq in proteins:
+        for seqs in digestion(pro_seq, sites, terminal,
+                              missed_cleavages, min_len, max_len):
+            data += [[pro_id, seqs]]
+    return data
+
+
+# the digested data of digest_proteins as the [protein id, peptide line]
+# of baseline_data
+def data_lines(data):
+    pro_ids = data['pro_ids']
+    pro_seqs = data['pro_seqs']
+    windows = data['windows']
+
+    # the 31-mer of a site, '*' for the sites without 31-mer
+    def mer(pro_seq, site):
+        if windows[site] == -1:
+            return '*'
+        padded = 'Z' * nearnum + pro_seq + 'Z' * nearnum
+        return padded[windows[site] : windows[site] + 2 * nearnum + 1]
+
+    lines = []
+    for pro_ind, start, end, left, right in zip(data['protein'], data['start'],
+                                                data['end'], data['left'],
+                                                data['right']):
+        pro_seq = pro_seqs[pro_ind]
+        pep = pro_seq[start : end]
+        if left == -1:
+            lines.append([pro_ids[pro_ind], pep])
+        else:
+            missed_mers = ','.join(mer(pro_seq, site)
+                                   for site in range(left + 1, right))
+            lines.append([pro_ids[pro_ind], '\t'.join(
+                [pep, mer(pro_seq, left), mer(pro_seq, right), missed_mers])])
+    return lines
+
+
+# peptide / 31-mer coding
+def coding(seq_type, seqs):
+    # amino acid dictionaries
+    if seq_type == 'peptides':
+        dic = {'A': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5, 'G': 6, 'H': 7, 'I': 8, 'K': 9,
+               'L': 10, 'M': 11, 'N': 12, 'P': 13, 'Q': 14, 'R': 15, 'S': 16, 'T': 17,
+               'V': 18, 'W': 19, 'Y': 20}
+    elif seq_type == '31mers':
+        dic = {'A': 0, 'C': 1, 'D': 2, 'E': 3, 'F': 4, 'G': 5, 'H': 6, 'I': 7, 'K': 8,
+               'L': 9, 'M': 10, 'N': 11, 'P': 12, 'Q': 13, 'R': 14, 'S': 15, 'T': 16,
+               'V': 17, 'W': 18, 'Y': 19, 'Z': 20}
+
+    # coding
+    coded_seqs = []
+    for seq in seqs:
+        coded_seq = [dic.get(aa) for aa in seq]
+        coded_seqs.append(coded_seq)  # Using append instead of += for clarity
+
+    return coded_seqs
+
+
+# all the peptides and 31-mers of the data, in the order they were predicted
+def peps_and_31mers(data):
+    peps = []
+    mers = []
+    for line in data:
+        seqs = re.split('[\t,]', line[1])
+        peps.append(seqs[0])  # Using append for clarity
+        mers.extend(mer for mer in seqs[1:] if len(mer) > 1)  # Using extend instead of += for clarity
+    return peps, mers
+
+
+# BiLSTM predictions of every peptide and DeepDigest predictions of every
+# 31-mer of every peptide, as predictor predicted them
+def predict_lines(data, padding_len, models):
+    from keras.preprocessing.sequence import pad_sequences as padding
+    loaded_model_bilstm, loaded_model_deepdigest = models
+    peps, mers = peps_and_31mers(data)
+    coded_peps = coding('peptides', peps)
+    x_peps = padding(coded_peps, maxlen=padding_len,
+                     padding='post', truncating='post', value=0)
+    bilstm_pred = loaded_model_bilstm.predict(x_peps).squeeze()
+    x_mers = np.array(coding('31mers', mers))
+    mers_pred = loaded_model_deepdigest.predict(x_mers).squeeze()
+    return bilstm_pred, mers_pred
+
+
+# [protein id, peptide, detectability] of every peptide
+def calculate_detectabilities(data, bilstm_pred, mers_pred):
+    bilstm_ind = 0  # bilstm detectability
+    dig_ind = 0  # digestibility
+    results = []
+
+    for line in data:
+        pro_id, seqs = line
+        seqs_list = seqs.split('\t')
+        bilstm_prob = float(bilstm_pred[bilstm_ind])
+        bilstm_ind += 1
+
+        # The model predicted the probabilities of missed digestion!!!
+        if len(seqs_list) == 4:
+            pep, left_mer, right_mer, missed_mers = seqs_list
+
+            # digestibility of the left 31-mer
+            if left_mer != '*':
+                left_dig = 1 - float(mers_pred[dig_ind])
+                dig_ind += 1
+            else:
+                left_dig = float(1)
+
+            # digestibility of the right 31-mer
+            if right_mer != '*':
+                right_dig = 1 - float(mers_pred[dig_ind])
+                dig_ind += 1
+            else:
+                right_dig = float(1)
+
+            # digestibilities of the missed 31-mers
+            missed_sites = missed_mers.split(',')
+            missed_probs = ''
+            missed_dig = float(1)
+            for site in missed_sites:
+                if len(site) == 31:
+                    prob = float(mers_pred[dig_ind])
+                    dig_ind += 1
+                    missed_probs += str(1 - prob) + ','
+                    missed_dig *= prob
+
+            # peptide digestibility
+            dig_prob = left_dig * right_dig * missed_dig
+
+            # peptide detectability
+            det_prob = sqrt(bilstm_prob * dig_prob)
+            results.append([pro_id, pep, det_prob])  # Using append for clarity
+        elif len(seqs_list) == 1:
+            results.append(line + [bilstm_prob])  # Using append for clarity
+
+    return results
+
+
+# random proteins with sites at both ends, leading methionines, illegal
+# residues and proteins without any sites
+def random_proteins(seed, num=300):
+    rand = random.Random(seed)
+    residues = 'ACDEFGHIKLMNPQRSTVWY' * 20 + 'BJOUXZ'
+    proteins = []
+    for ind in range(num):
+        pro_seq = ''.join(rand.choice(residues)
+                          for _ in range(rand.randint(1, 120)))
+        if ind % 5 == 0:
+            pro_seq = rand.choice('MKRD') + pro_seq
+        elif ind % 7 == 0:
+            pro_seq = pro_seq.translate(str.maketrans('', '', 'KRD'))
+        proteins.append(('pro%s' % ind, pro_seq))
+    return proteins
+
+
+class RowModel:
+    '''
+    Stands in for a model that predicts every row on its own: a float32 in
+    [0, 1) from the codes of the row, unchanged by trailing zero padding as
+    with the masked BiLSTM.
+    '''
+    def __init__(self, seed):
+        self.weights = np.random.default_rng(seed).random(100)
+        self.rows = 0
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        self.rows += len(x)
+        pred = (x * self.weights[:x.shape[1]]).sum(axis=1) % 1
+        return pred.astype(np.float32).reshape(-1, 1)
+
+
+# result file of the detectabilities, as predictor saved them
+def save_results(res_path, results):
+    np.savetxt(res_path, results, fmt='%s\t%s\t%s',
+               delimiter='\t', newline='\n',
+               header='Protein id\tPeptide sequence\tPeptide detectability',
+               comments='')
@@ -0,0 +1,37 @@
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+from predictor import coding_mers
+import baseline_deepdetect
+
+
+def test_coding_mers_matches_baseline_coding():
+    rand = random.Random(0)
+    pro_seqs = [''.join(rand.choice('ACDEFGHIKLMNPQRSTVWY')
+                        for _ in range(rand.randint(1, 80)))
+                for _ in range(50)]
+
+    # sites at every position, including those within 15 residues of the
+    # protein ends, whose 31-mers are padded with 'Z'
+    site_pro = []
+    windows = []
+    mers = []
+    for pro_ind, pro_seq in enumerate(pro_seqs):
+        for pos in range(len(pro_seq)):
+            site_pro.append(pro_ind)
+            windows.append(pos)
+            left_mer, right_mer = baseline_deepdetect.left_and_right_mer(
+                pro_seq, 0, [pos])
+            mers.append(left_mer + right_mer)
+    order = rand.sample(range(len(mers)), len(mers))
+
+    x_mers = coding_mers(pro_seqs, np.array(site_pro)[order],
+                         np.array(windows)[order])
+    expected = np.array(baseline_deepdetect.coding(
+        '31mers', [mers[ind] for ind in order]))
+    assert x_mers.shape == expected.shape
+    assert np.array_equal(x_mers, expected)
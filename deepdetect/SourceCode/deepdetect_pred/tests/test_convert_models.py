@@ -0,0 +1,34 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+from predictor import (default_model_dir, model_files, npz_path, load_h5_models,
+                       load_npz_models)
+from convert_models import convert
+
+
+def test_convert_into_another_model_dir(tmp_path):
+    if not all(os.path.exists(path) for path in model_files('Trypsin')):
+        pytest.skip('the Trypsin model files are not available')
+    model_dir = str(tmp_path)
+    for path in model_files('Trypsin'):
+        shutil.copy(path, model_dir)
+
+    converted = os.path.exists(npz_path('Trypsin', default_model_dir))
+    convert('Trypsin', model_dir)
+    assert os.path.exists(npz_path('Trypsin', model_dir))
+    # nothing is written into the default model directory
+    assert os.path.exists(npz_path('Trypsin', default_model_dir)) == converted
+
+    # the converted models have the weights of the JSON and h5 files
+    h5_models = load_h5_models('Trypsin', model_dir)
+    npz_models = load_npz_models('Trypsin', model_dir)
+    for h5_model, npz_model in [(h5_models[1], npz_models[1]),
+                                (h5_models[3], npz_models[3])]:
+        for h5_weight, npz_weight in zip(h5_model.get_weights(),
+                                         npz_model.get_weights()):
+            assert np.array_equal(h5_weight, npz_weight)
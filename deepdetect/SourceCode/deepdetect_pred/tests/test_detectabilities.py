@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+from in_silico_digestion import digest_proteins
+from predictor import data_detectabilities
+from main import info
+import baseline_deepdetect
+
+
+# random float32 predictions of every peptide and 31-mer, as the models
+# predict them
+def random_predictions(seqs, rng):
+    return dict(zip(sorted(seqs), rng.random(len(seqs)).astype(np.float32)))
+
+
+@pytest.mark.parametrize('protease', ['Trypsin', 'AspN'])
+@pytest.mark.parametrize('missed_cleavages', [0, 1, 2, 3])
+def test_detectabilities_equal_baseline_loop(protease, missed_cleavages):
+    sites, terminal, _ = info(protease)
+    proteins = baseline_deepdetect.random_proteins(missed_cleavages)
+    data = digest_proteins(proteins, sites, terminal, missed_cleavages, 7, 47)
+    lines = baseline_deepdetect.data_lines(data)
+    peps, mers = baseline_deepdetect.peps_and_31mers(lines)
+    rng = np.random.default_rng(missed_cleavages)
+    pep_pred = random_predictions(set(peps), rng)
+    mer_pred = random_predictions(set(mers), rng)
+
+    # the predictions of the baseline, one per peptide and one per 31-mer of
+    # every peptide
+    expected = baseline_deepdetect.calculate_detectabilities(
+        lines, np.array([pep_pred[pep] for pep in peps]),
+        np.array([mer_pred[mer] for mer in mers]))
+
+    # the same predictions, one per peptide and one per site
+    bilstm_pred = np.array([pep_pred[pep] for pep in peps])
+    sites_pred = np.zeros(len(data['windows']), dtype=np.float32)
+    for line, left, right in zip(lines, data['left'], data['right']):
+        if left != -1:
+            pep, left_mer, right_mer, missed_mers = line[1].split('\t')
+            site_mers = [left_mer] + \
+                (missed_mers.split(',') if missed_mers else []) + [right_mer]
+            for site, mer in zip(range(left, right + 1), site_mers):
+                if mer in mer_pred:
+                    sites_pred[site] = mer_pred[mer]
+
+    det_probs = data_detectabilities(data, bilstm_pred, sites_pred)
+    assert len(det_probs) == len(expected)
+    assert any(left == -1 for left in data['left'])
+    assert any(right - left > 1 for left, right in zip(data['left'],
+                                                      data['right'])) \
+        or missed_cleavages == 0
+    # exactly the floats of the per-peptide loop
+    assert det_probs.tolist() == [result[2] for result in expected]
@@ -0,0 +1,36 @@
+import pytest
+
+from in_silico_digestion import digest_proteins, digest_proteases
+import baseline_deepdetect
+
+
+# sites and cutting terminal of the proteases, as in main.info, which imports
+# Keras
+cleavage = {'Trypsin': ('KR', 'C'), 'Chymotrypsin': ('WFYLM', 'C'),
+            'GluC': ('E', 'C'), 'AspN': ('D', 'N'), 'LysN': ('K', 'N'),
+            'LysargiNase': ('KR', 'N')}
+
+
+@pytest.mark.parametrize('protease', ['Trypsin', 'AspN', 'LysargiNase',
+                                      'Chymotrypsin'])
+@pytest.mark.parametrize('missed_cleavages', [0, 1, 2, 3])
+def test_digest_proteins_matches_baseline(protease, missed_cleavages):
+    sites, terminal = cleavage[protease]
+    proteins = baseline_deepdetect.random_proteins(missed_cleavages)
+    for min_len, max_len in [(7, 47), (1, 30)]:
+        expected = baseline_deepdetect.baseline_data(
+            proteins, sites, terminal, missed_cleavages, min_len, max_len)
+        data = digest_proteins(proteins, sites, terminal, missed_cleavages,
+                               min_len, max_len)
+        assert baseline_deepdetect.data_lines(data) == expected
+
+
+def test_digest_proteases_matches_digest_proteins():
+    proteins = baseline_deepdetect.random_proteins(4)
+    proteases = ['Trypsin', 'AspN', 'LysN', 'GluC']
+    cleavages = [cleavage[protease] for protease in proteases]
+    for data, (sites, terminal) in zip(
+            digest_proteases(proteins, cleavages, 2, 7, 47), cleavages):
+        expected = digest_proteins(proteins, sites, terminal, 2, 7, 47)
+        assert baseline_deepdetect.data_lines(data) == \
+            baseline_deepdetect.data_lines(expected)
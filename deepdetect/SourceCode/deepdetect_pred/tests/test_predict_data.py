@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+from in_silico_digestion import digest_proteins
+from predictor import predict_data, data_detectabilities
+from main import info
+import baseline_deepdetect
+
+
+@pytest.mark.parametrize('protease', ['Trypsin', 'AspN'])
+@pytest.mark.parametrize('batch_size', [0, 7])
+def test_predict_data_matches_baseline(protease, batch_size):
+    sites, terminal, padding_len = info(protease)
+    # the proteins twice, so that many peptides are shared by proteins
+    proteins = baseline_deepdetect.random_proteins(2)
+    proteins += [(pro_id + '_copy', pro_seq) for pro_id, pro_seq in proteins]
+    data = digest_proteins(proteins, sites, terminal, 2, 7, 47)
+
+    # the baseline predicts every peptide and the 31-mers of every peptide
+    lines = baseline_deepdetect.data_lines(data)
+    peps, mers = baseline_deepdetect.peps_and_31mers(lines)
+    bilstm_pred, mers_pred = baseline_deepdetect.predict_lines(
+        lines, padding_len, (baseline_deepdetect.RowModel(0),
+                             baseline_deepdetect.RowModel(1)))
+    expected = baseline_deepdetect.calculate_detectabilities(
+        lines, bilstm_pred, mers_pred)
+
+    models = baseline_deepdetect.RowModel(0), baseline_deepdetect.RowModel(1)
+    pred_peps, bilstm_pred, sites_pred, unique_num, sites_num = predict_data(
+        models, data, padding_len, batch_size)
+    det_probs = data_detectabilities(data, bilstm_pred, sites_pred)
+    assert pred_peps == peps
+    assert det_probs.tolist() == [result[2] for result in expected]
+
+    # every peptide sequence and every site is predicted once
+    assert models[0].rows == unique_num == len(set(peps)) < len(peps)
+    assert models[1].rows == sites_num < len(mers)
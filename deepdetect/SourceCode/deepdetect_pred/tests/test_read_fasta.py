@@ -0,0 +1,33 @@
+import re
+
+import pytest
+
+from read_fasta import read_fasta
+
+
+def baseline_read_fasta(file, regular):
+    """read_fasta of the original DeepDetect, which read the whole file into one string."""
+    with open(file) as fasta:
+        records = fasta.read()
+    records = re.split('(>.*?)\\n', records)[1:]
+    length = len(records)
+    fasta_list = []
+    for ind in range(0, length, 2):
+        name = re.split(regular, records[ind])[1]
+        sequence = records[ind + 1].replace('\n', '')
+        fasta_list += [[name, sequence]]
+    return fasta_list
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+@pytest.mark.parametrize('regular', [r'>(.*?)\s', r'>(\S+)'])
+def test_read_fasta_matches_baseline(tmp_path, newline, regular):
+    text = newline.join(['>sp|P1|ONE first protein', 'MPEPTIDEK', 'AAR',
+                         '>sp|P2|TWO second', 'LESLIEK',
+                         '>P3 empty', '',
+                         '>P4 last protein without a final newline', 'MKR', 'DDK'])
+    path = str(tmp_path / 'proteins.fasta')
+    with open(path, 'w', newline='') as fasta:
+        fasta.write(text)
+    expected = baseline_read_fasta(path, regular)
+    assert [list(record) for record in read_fasta(path, regular)] == expected
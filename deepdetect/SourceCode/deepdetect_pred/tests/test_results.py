@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip('keras')
+
+import predictor
+import main
+import baseline_deepdetect
+
+
+def stand_in_models(protease, batch_size=0, model_dir=None):
+    return baseline_deepdetect.RowModel(0), baseline_deepdetect.RowModel(1)
+
+
+def write_fasta(path, proteins):
+    with open(path, 'w') as fasta:
+        for pro_id, pro_seq in proteins:
+            fasta.write('>%s description\n%s\n' % (pro_id, pro_seq))
+
+
+@pytest.mark.parametrize('protease', ['Trypsin', 'AspN'])
+@pytest.mark.parametrize('batch_size', [0, 7])
+def test_tsv_results_are_byte_identical_to_savetxt(tmp_path, monkeypatch,
+                                                   protease, batch_size):
+    monkeypatch.setattr(predictor, 'load_models', stand_in_models)
+    proteins = baseline_deepdetect.random_proteins(3)
+    write_fasta(tmp_path / 'proteins.fasta', proteins)
+
+    # the baseline digests, predicts and saves all results at once
+    sites, terminal, padding_len = main.info(protease)
+    lines = baseline_deepdetect.baseline_data(proteins, sites, terminal,
+                                              2, 7, 47)
+    bilstm_pred, mers_pred = baseline_deepdetect.predict_lines(
+        lines, padding_len, stand_in_models(protease))
+    baseline_deepdetect.save_results(
+        tmp_path / 'baseline.txt',
+        baseline_deepdetect.calculate_detectabilities(lines, bilstm_pred,
+                                                      mers_pred))
+
+    main.DeepDetect(str(tmp_path / 'proteins.fasta'),
+                    str(tmp_path / 'results.txt'), r'>(.*?)\s', protease,
+                    2, 7, 47, batch_size)
+    assert (tmp_path / 'results.txt').read_bytes() == \
+        (tmp_path / 'baseline.txt').read_bytes()
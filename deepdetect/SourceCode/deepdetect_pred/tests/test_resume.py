@@ -0,0 +1,81 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip('keras')
+
+import predictor
+import main
+import baseline_deepdetect
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingModel(baseline_deepdetect.RowModel):
+    '''
+    A BiLSTM stand-in that crashes the run when it is asked for the chunk
+    after the first crash_after chunks; every protease loads its own.
+    '''
+    def __init__(self, seed, crash_after):
+        super().__init__(seed)
+        self.calls = 0
+        self.crash_after = crash_after
+
+    def predict(self, x):
+        self.calls += 1
+        if self.calls > self.crash_after:
+            raise Crash()
+        return super().predict(x)
+
+
+def write_fasta(path, proteins):
+    with open(path, 'w') as fasta:
+        for pro_id, pro_seq in proteins:
+            fasta.write('>%s description\n%s\n' % (pro_id, pro_seq))
+
+
+@pytest.mark.parametrize('protease', ['Trypsin', 'Trypsin,AspN'])
+def test_resumed_run_is_byte_identical_to_one_shot_run(tmp_path, monkeypatch,
+                                                       protease):
+    fasta = str(tmp_path / 'proteins.fasta')
+    write_fasta(fasta, baseline_deepdetect.random_proteins(5))
+    proteases = protease.split(',')
+
+    def res_paths(res_path):
+        if len(proteases) == 1:
+            return [res_path]
+        return [main.protease_path(res_path, name) for name in proteases]
+
+    monkeypatch.setattr(predictor, 'load_models', lambda *args: (
+        baseline_deepdetect.RowModel(0), baseline_deepdetect.RowModel(1)))
+    one_shot = str(tmp_path / 'one_shot.txt')
+    main.DeepDetect(fasta, one_shot, r'>(.*?)\s', protease, 2, 7, 47)
+
+    # the run crashes after the results of 4 chunks of 20 proteins are
+    # written, and a partly written chunk is left behind
+    monkeypatch.setattr(predictor, 'load_models', lambda *args: (
+        CrashingModel(0, 4), baseline_deepdetect.RowModel(1)))
+    resumed = str(tmp_path / 'resumed.txt')
+    with pytest.raises(Crash):
+        main.DeepDetect(fasta, resumed, r'>(.*?)\s', protease, 2, 7, 47,
+                        chunk_size=20)
+    with open(main.checkpoint_path(resumed)) as checkpoint:
+        assert json.load(checkpoint)['proteins'] == 80
+    for res_path in res_paths(resumed):
+        with open(res_path, 'a') as res:
+            res.write('pro80\tPARTLYWRITTEN')
+
+    # resumed with another chunk size
+    monkeypatch.setattr(predictor, 'load_models', lambda *args: (
+        baseline_deepdetect.RowModel(0), baseline_deepdetect.RowModel(1)))
+    main.DeepDetect(fasta, resumed, r'>(.*?)\s', protease, 2, 7, 47,
+                    chunk_size=7, resume=True)
+    assert not os.path.exists(main.checkpoint_path(resumed))
+    for one_shot_path, resumed_path in zip(res_paths(one_shot),
+                                           res_paths(resumed)):
+        with open(one_shot_path, 'rb') as one_shot_res, \
+                open(resumed_path, 'rb') as resumed_res:
+            assert resumed_res.read() == one_shot_res.read()
@@ -7,8 +7,12 @@ Created on Tue Oct 11 15:38:42 2022
 
 
 import os
+import sys
 import pandas as pd
 pd.set_option('display.max_columns', None)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'deepdetect_pred'))
+from deepdetect_api import DeepDetect
 
 
 def deepdetect_filter(fasta_file, rslt_file, regular, protease,
@@ -16,21 +20,12 @@ def deepdetect_filter(fasta_file, rslt_file, regular, protease,
                       speclib_file, percent):
     # fasta prediction
     print("Predicting fasta file with DeepDetect.")
-    os.chdir(r"..\..\DeepDetect")
-    fasta_path = f"..\SourceCode\diann_library_reduction\{fasta_file}"
-    rslt_path = f"..\SourceCode\diann_library_reduction\{rslt_file}"
-    cmd = (f'DeepDetect.exe --input={fasta_path} --output={rslt_path} '
-           f'--regular="{regular}" --protease={protease} '
-           f'--missed_cleavages={missed_cleavages} '
-           f'--min_len={min_len} --max_len={max_len}')
-    os.system(cmd)
-    os.chdir(r"..\SourceCode\diann_library_reduction")
+    dd = DeepDetect(protease, missed_cleavages, min_len, max_len)
+    df_pred = dd.predict_fasta(fasta_file, regular)
+    df_pred.to_csv(rslt_file, sep='\t', index=False)
     
-    # load predicted detectability
-    print("Loading predicted detectabilities.")
-    df_pred = pd.read_csv(rslt_file, sep='\t',
-                          usecols=["Peptide sequence",
-                                   "Peptide detectability"])
+    # predicted detectability
+    df_pred = df_pred[["Peptide sequence", "Peptide detectability"]]
     df_pred.columns = ["PeptideSequence", "Det"]
     df_det = df_pred.groupby("PeptideSequence", as_index=False)["Det"].mean()
     
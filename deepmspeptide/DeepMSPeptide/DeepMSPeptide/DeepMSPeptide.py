@@ -1,63 +1,140 @@
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+import os
 import argparse
+from itertools import islice
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
+from numpy_model import NumpyModel
 
 
-parser = argparse.ArgumentParser(description='''Predicts the detectability of input peptides using a single dimension
-                                                Convolutionar Neural Network, based on Tensorflow 1.13.1
-                                                Requierements: Tensorflow 1.13.1''')
-parser.add_argument('infile', metavar='F', type=str, nargs='+',
-                    help='File containing the peptides to be predicted, one per line (max length= 81)')
-args = parser.parse_args()
+# the model next to this file, wherever the predictor is started from
+default_model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_2_1D.h5')
 
 
-def load_pep_and_codify(file, max_len):
-    aa_dict={'A':1,'R':2,'N':3,'D':4,'C':5,'Q':6,'E':7,'G':8,'H':9,'I':10,'L':11,'K':12,'M':13,'F':14,
-        'P':15,'O':16,'S':17,'U':18,'T':19,'W':20,'Y':21,'V':22}
+aa_dict={'A':1,'R':2,'N':3,'D':4,'C':5,'Q':6,'E':7,'G':8,'H':9,'I':10,'L':11,'K':12,'M':13,'F':14,
+    'P':15,'O':16,'S':17,'U':18,'T':19,'W':20,'Y':21,'V':22}
+
+
+# residue byte --> code, 0 for the bytes that are not a residue
+aa_table = np.zeros(256, dtype=np.int32)
+for aa, code in aa_dict.items():
+    aa_table[ord(aa)] = code
+
+
+# encode the peptides straight into a zero padded array in one pass over their bytes, skipping the
+# peptides longer than max_len and the peptides with illegal residues
+def codify(peptides, max_len):
+    lengths = np.array([len(pep) for pep in peptides], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    # non-ASCII characters are replaced by '?', so that every residue is one byte
+    codes = aa_table[np.frombuffer(''.join(peptides).encode('ascii', 'replace'), dtype=np.uint8)]
+
+    # number of illegal residues in every peptide
+    illegal = np.concatenate(([0], np.cumsum(codes == 0)))
+    legal = (illegal[ends] - illegal[starts]) == 0
+    kept = np.flatnonzero(legal & (lengths <= max_len))
+
+    # position of every residue in the flattened array, the residues of the skipped peptides are
+    # written behind the array
+    rows = np.full(len(peptides), len(kept), dtype=np.int64)
+    rows[kept] = np.arange(len(kept))
+    flat = np.arange(len(codes)) + np.repeat(rows * max_len - starts, lengths)
+
+    behind = max(int(lengths.max()) if len(peptides) else 0, max_len)
+    predict_data = np.zeros(len(kept) * max_len + behind, dtype=np.int32)
+    predict_data[flat] = codes
+    return predict_data[:len(kept) * max_len].reshape(len(kept), max_len), kept
+
+
+# read the peptides of a file, one per line, chunk_size at a time
+def read_chunks(file, chunk_size):
     with open(file, 'r') as inf:
-        lines = inf.read().splitlines()
-    pep_codes=[]
-    long_pep_counter = 0
-    newLines = []
-    for pep in lines:
-        if not len(pep) > max_len:
-            current_pep=[]
-            for aa in pep:
-                current_pep.append(aa_dict[aa])
-            pep_codes.append(current_pep)
-            newLines.extend([pep])
+        while True:
+            chunk = [line.rstrip('\r\n') for line in islice(inf, chunk_size)]
+            if not chunk:
+                break
+            yield chunk
+
+
+class DeepMSPeptide:
+    '''
+    Loads the model once, so that one process can predict many lists of peptides.
+
+    model_path: the Keras model, model_2_1D.h5 next to this file by default, or an npz file of
+        convert_model.py, which is predicted with NumPy and does not need TensorFlow
+    max_len: peptides longer than this are not predicted
+    chunk_size: the number of peptides encoded and predicted at a time
+    '''
+    def __init__(self, model_path=default_model_path, max_len=81, chunk_size=100000):
+        print('Loading model...')
+        if model_path.endswith('.npz'):
+            self.model = NumpyModel(model_path)
         else:
-            long_pep_counter += 1
-    predict_data = keras.preprocessing.sequence.pad_sequences(pep_codes, value=0, padding='post', maxlen=max_len)
-    return predict_data, long_pep_counter, newLines
-
-
-print('Loading model...')
-model_2_1D = keras.models.load_model('model_2_1D.h5')
-
-print('Loading input peptides')
-predict_data, skipped,  lines = load_pep_and_codify(args.infile[0], 81)
-print('Succesfully loaded {0} peptides and skipped {1}'.format(len(lines), str(skipped)))
-
-print('Making predictions')
-model_2_1D_pred = model_2_1D.predict(predict_data)
-model_2_1D_pred = np.hstack((np.array(lines).reshape(len(lines), 1),model_2_1D_pred)).tolist()
-
-Pred_output = []
-for pred in model_2_1D_pred:
-    if float(pred[1]) > 0.5:
-        # pred.extend('0')
-        Pred_output.append([pred[0], str(1-float(pred[1])), '0'])
-    else:
-        Pred_output.append([pred[0], str(1-float(pred[1])), '1'])
-        # pred.extend('1')
-
-outFile = '{0}_Predictions.txt'.format(args.infile[0].split('.')[0])
-print('Saving predictions to file {}'.format(outFile))
-with open(outFile, 'w') as outf:
-    outf.write('Peptide\tProb\tDetectability\n')
-    outf.writelines('\t'.join(i) + '\n' for i in Pred_output)
+            from tensorflow import keras
+            self.model = keras.models.load_model(model_path)
+        self.max_len = max_len
+        self.chunk_size = chunk_size
+
+    def predict(self, peptides):
+        '''
+        Returns the probabilities of the peptides to be detected as a float64 array,
+        NaN for the peptides that are longer than max_len or have illegal residues.
+        '''
+        peptides = list(peptides)
+        probs = np.full(len(peptides), np.nan)
+        # at most chunk_size peptides are encoded at a time
+        for first in range(0, len(peptides), self.chunk_size):
+            predict_data, kept = codify(peptides[first : first + self.chunk_size], self.max_len)
+            if len(kept):
+                # the outputs as they are printed in the result file, so that the probabilities are
+                # the same as the Prob column
+                pred = self.model.predict(predict_data)[:, 0].astype(str).astype(np.float64)
+                probs[first + kept] = 1 - pred
+        return probs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='''Predicts the detectability of input peptides using a single dimension
+                                                    Convolutionar Neural Network, based on Tensorflow 1.13.1
+                                                    Requierements: Tensorflow 1.13.1''')
+    parser.add_argument('infile', metavar='F', type=str, nargs='+',
+                        help='File containing the peptides to be predicted, one per line (max length= 81)')
+    parser.add_argument('--model', type=str, default=default_model_path,
+                        help='The model file, an .npz file of convert_model.py is predicted without TensorFlow '
+                             '(default: model_2_1D.h5 next to DeepMSPeptide.py)')
+    parser.add_argument('--chunk_size', type=int, default=100000,
+                        help='Number of peptides read, predicted and written at a time (default: 100000)')
+    args = parser.parse_args()
+
+    predictor = DeepMSPeptide(args.model, chunk_size=args.chunk_size)
+
+    # the peptides are read, predicted and written chunk by chunk, so that the memory use does not
+    # grow with the number of peptides
+    outFile = '{0}_Predictions.txt'.format(args.infile[0].split('.')[0])
+    print('Making predictions, saving them to file {}'.format(outFile))
+    predicted = 0
+    long_pep_counter = 0
+    illegal_pep_counter = 0
+    with open(outFile, 'w') as outf:
+        outf.write('Peptide\tProb\tDetectability\n')
+        for peptides in read_chunks(args.infile[0], args.chunk_size):
+            probs = predictor.predict(peptides)
+            outf.writelines('{0}\t{1}\t{2}\n'.format(pep, str(prob), '0' if prob < 0.5 else '1')
+                            for pep, prob in zip(peptides, probs) if not np.isnan(prob))
+            for ind in np.flatnonzero(np.isnan(probs)):
+                if len(peptides[ind]) > predictor.max_len:
+                    long_pep_counter += 1
+                else:
+                    print('Warning: Skipping peptide {0} with illegal residue(s)'.format(peptides[ind]))
+                    illegal_pep_counter += 1
+            predicted += len(peptides)
+    predicted -= long_pep_counter + illegal_pep_counter
+    print('Succesfully predicted {0} peptides and skipped {1} longer than {2} and {3} with illegal residues'
+          .format(predicted, long_pep_counter, predictor.max_len, illegal_pep_counter))
+
+
+
+if __name__ == '__main__':
+    main()
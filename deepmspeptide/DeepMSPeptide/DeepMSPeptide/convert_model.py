@@ -0,0 +1,63 @@
+"""
+One-time export of the DeepMSPeptide model from its h5 file into an npz file with the architecture
+and all weights, which numpy_model.py predicts with without TensorFlow. Run it in the DeepMSPeptide
+environment; the predictions of Keras and NumPy are compared on inputExample.txt afterwards.
+
+Usage: python convert_model.py [model.h5 [model.npz]]
+By default model_2_1D.h5 next to this file is written to model_2_1D.npz.
+"""
+import warnings
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+import os
+import sys
+import numpy as np
+from tensorflow import keras
+from DeepMSPeptide import default_model_path, codify
+from numpy_model import NumpyModel
+
+
+# the largest difference to the Keras outputs that is accepted
+tolerance = 1e-5
+
+
+# write the architecture and the weights of every layer into one npz file
+def convert(h5_path, npz_path):
+    model = keras.models.load_model(h5_path)
+    arrays = {'model_json': np.array(model.to_json())}
+    for layer in model.layers:
+        weights = layer.get_weights()
+        arrays['%s_num' % layer.name] = np.array(len(weights))
+        for ind, weight in enumerate(weights):
+            arrays['%s_%s' % (layer.name, ind)] = weight
+
+    # written under a temporary name, so that an interrupted export is never loaded
+    with open(npz_path + '.tmp', 'wb') as npz:
+        np.savez(npz, **arrays)
+    os.replace(npz_path + '.tmp', npz_path)
+    print('Wrote {}'.format(npz_path))
+    return model
+
+
+def main():
+    h5_path = sys.argv[1] if len(sys.argv) > 1 else default_model_path
+    npz_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(h5_path)[0] + '.npz'
+    if not os.path.exists(h5_path):
+        print('Error: The model file {} does not exist.'.format(h5_path))
+        sys.exit(1)
+    model = convert(h5_path, npz_path)
+
+    example = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inputExample.txt')
+    with open(example, 'r') as inf:
+        predict_data, kept = codify(inf.read().splitlines(), model.input_shape[1] or 81)
+    diff = np.abs(model.predict(predict_data) - NumpyModel(npz_path).predict(predict_data)).max()
+    print('Largest difference between the Keras and NumPy outputs on {0} peptides: {1}'
+          .format(len(kept), diff))
+    if not diff <= tolerance:
+        os.remove(npz_path)
+        print('Error: The NumPy outputs differ from Keras, removed {}.'.format(npz_path))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
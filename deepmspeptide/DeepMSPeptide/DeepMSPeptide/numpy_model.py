@@ -0,0 +1,170 @@
+"""
+NumPy forward pass of the Keras model of DeepMSPeptide, read from the npz file written by
+convert_model.py, so that peptides are predicted without TensorFlow. The layers are applied one
+after another, as in a Sequential model, in float32 like Keras.
+"""
+import json
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def sigmoid(x):
+    # split by sign, so that exp does not overflow
+    out = np.empty_like(x)
+    pos = x >= 0
+    out[pos] = 1 / (1 + np.exp(-x[pos]))
+    ex = np.exp(x[~pos])
+    out[~pos] = ex / (1 + ex)
+    return out
+
+
+def softmax(x):
+    ex = np.exp(x - x.max(axis=-1, keepdims=True))
+    return ex / ex.sum(axis=-1, keepdims=True)
+
+
+activations = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': sigmoid,
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0, 1).astype(x.dtype),
+    'tanh': np.tanh,
+    'softmax': softmax,
+    'softplus': lambda x: np.logaddexp(0, x).astype(x.dtype),
+    'softsign': lambda x: x / (1 + np.abs(x)),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+}
+
+
+# padding of the 'same' convolutions and poolings, TensorFlow puts the odd one on the right
+def same_padding(length, size, stride, dilation=1):
+    out_len = -(-length // stride)
+    total = max((out_len - 1) * stride + (size - 1) * dilation + 1 - length, 0)
+    return total // 2, total - total // 2
+
+
+# (n, length, channels) --> (n, windows, size, channels) without copying
+def windows(x, size, stride, dilation=1):
+    n, length, channels = x.shape
+    out_len = (length - (size - 1) * dilation - 1) // stride + 1
+    s0, s1, s2 = x.strides
+    return as_strided(x, (n, out_len, size, channels), (s0, s1 * stride, s1 * dilation, s2),
+                      writeable=False)
+
+
+def conv1d(x, config, weights):
+    kernel = weights[0]
+    size, stride, dilation = kernel.shape[0], config['strides'][0], config['dilation_rate'][0]
+    if config['padding'] == 'same':
+        x = np.pad(x, ((0, 0), same_padding(x.shape[1], size, stride, dilation), (0, 0)), 'constant')
+    elif config['padding'] == 'causal':
+        x = np.pad(x, ((0, 0), ((size - 1) * dilation, 0), (0, 0)), 'constant')
+
+    # one matrix product for the windows of all peptides
+    win = windows(x, size, stride, dilation)
+    n, out_len = win.shape[:2]
+    y = np.dot(win.reshape(n * out_len, -1), kernel.reshape(-1, kernel.shape[2]))
+    if config['use_bias']:
+        y += weights[1]
+    return activations[config['activation']](y.reshape(n, out_len, -1))
+
+
+def pool1d(x, config, reduce):
+    size, stride = config['pool_size'][0], config['strides'][0]
+    if config['padding'] == 'same':
+        # the padding is ignored by both the maximum and the average
+        x = np.pad(x, ((0, 0), same_padding(x.shape[1], size, stride), (0, 0)), 'constant',
+                   constant_values=np.nan)
+        reduce = {np.max: np.nanmax, np.mean: np.nanmean}[reduce]
+    return reduce(windows(x, size, stride), axis=2).astype(x.dtype)
+
+
+def dense(x, config, weights):
+    y = np.dot(x, weights[0])
+    if config['use_bias']:
+        y += weights[1]
+    return activations[config['activation']](y)
+
+
+def batch_normalization(x, config, weights):
+    weights = list(weights)
+    gamma = weights.pop(0) if config['scale'] else 1
+    beta = weights.pop(0) if config['center'] else 0
+    mean, variance = weights
+    return ((x - mean) / np.sqrt(variance + config['epsilon']) * gamma + beta).astype(x.dtype)
+
+
+def relu(x, config, weights):
+    negative = config.get('negative_slope', 0) * (x - config.get('threshold', 0))
+    y = np.where(x >= config.get('threshold', 0), x, negative).astype(x.dtype)
+    if config.get('max_value') is not None:
+        y = np.minimum(y, config['max_value'])
+    return y
+
+
+# Keras layer --> function of the input, the layer config and its weights
+layers = {
+    'Embedding': lambda x, config, weights: weights[0][x],
+    'Conv1D': conv1d,
+    'MaxPooling1D': lambda x, config, weights: pool1d(x, config, np.max),
+    'AveragePooling1D': lambda x, config, weights: pool1d(x, config, np.mean),
+    'GlobalMaxPooling1D': lambda x, config, weights: x.max(axis=1),
+    'GlobalAveragePooling1D': lambda x, config, weights: x.mean(axis=1),
+    'Flatten': lambda x, config, weights: x.reshape(len(x), -1),
+    'Reshape': lambda x, config, weights: x.reshape((len(x),) + tuple(config['target_shape'])),
+    'Dense': dense,
+    'Activation': lambda x, config, weights: activations[config['activation']](x),
+    'BatchNormalization': batch_normalization,
+    'LeakyReLU': lambda x, config, weights: np.where(x > 0, x, config['alpha'] * x).astype(x.dtype),
+    'ReLU': relu,
+}
+
+# layers that only act in training
+inference_identity = ['InputLayer', 'Dropout', 'SpatialDropout1D', 'GaussianNoise',
+                      'GaussianDropout', 'AlphaDropout', 'ActivityRegularization']
+
+
+class NumpyModel:
+    '''
+    The model of an npz file of convert_model.py, with the predict method of a Keras model.
+    '''
+    def __init__(self, path):
+        with np.load(path) as model:
+            config = json.loads(str(model['model_json']))['config']
+            # a list of layers in older Keras versions
+            if isinstance(config, dict):
+                config = config['layers']
+
+            self.layers = []
+            for layer in config:
+                class_name, layer_config = layer['class_name'], layer['config']
+                if class_name in inference_identity:
+                    continue
+                if class_name not in layers:
+                    raise ValueError('The %s layer %s is not supported.' % (class_name, layer_config['name']))
+                if layer_config.get('data_format', 'channels_last') != 'channels_last' \
+                        or layer_config.get('mask_zero') or layer_config.get('axis', -1) not in (-1, [-1]):
+                    raise ValueError('The configuration of layer %s is not supported.' % layer_config['name'])
+                if isinstance(layer_config.get('activation'), str) \
+                        and layer_config['activation'] not in activations:
+                    raise ValueError('The activation %s is not supported.' % layer_config['activation'])
+
+                name = layer_config['name']
+                num = int(model['%s_num' % name]) if '%s_num' % name in model.files else 0
+                weights = [model['%s_%s' % (name, ind)].astype(np.float32) for ind in range(num)]
+                self.layers.append((layers[class_name], layer_config, weights))
+
+    def forward(self, x):
+        for layer, config, weights in self.layers:
+            x = layer(x, config, weights)
+        return x
+
+    def predict(self, x, batch_size=1024):
+        '''
+        Returns the outputs of the encoded peptides x, batch_size peptides at a time.
+        '''
+        x = np.asarray(x)
+        if len(x) == 0:
+            return self.forward(np.zeros((1,) + x.shape[1:], dtype=x.dtype))[:0]
+        return np.concatenate([self.forward(x[first : first + batch_size])
+                               for first in range(0, len(x), batch_size)])
@@ -0,0 +1,46 @@
+import random
+import sys
+
+import numpy as np
+import pytest
+
+import DeepMSPeptide
+from test_codify import baseline_codify, random_peptides
+
+
+class RowModel:
+    """Stands in for the model: a float32 probability of every encoded peptide on its own."""
+    def __init__(self, path):
+        self.weights = np.random.default_rng(0).random(81)
+
+    def predict(self, x, batch_size=1024):
+        return ((np.asarray(x) * self.weights).sum(axis=1) % 1).astype(np.float32).reshape(-1, 1)
+
+
+def baseline_predictions(model, lines):
+    """The output of the original script for the peptides it kept."""
+    predict_data = baseline_codify(lines, 81)[0]
+    model_2_1D_pred = model.predict(predict_data)
+    model_2_1D_pred = np.hstack((np.array(lines).reshape(len(lines), 1),model_2_1D_pred)).tolist()
+
+    Pred_output = []
+    for pred in model_2_1D_pred:
+        if float(pred[1]) > 0.5:
+            Pred_output.append([pred[0], str(1-float(pred[1])), '0'])
+        else:
+            Pred_output.append([pred[0], str(1-float(pred[1])), '1'])
+    return 'Peptide\tProb\tDetectability\n' + ''.join('\t'.join(i) + '\n' for i in Pred_output)
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_chunked_result_file_is_unchanged(tmp_path, monkeypatch, newline):
+    peptides = random_peptides(random.Random(2), 1000)
+    infile = tmp_path / 'peptides.txt'
+    infile.write_bytes(''.join(pep + newline for pep in peptides).encode())
+
+    monkeypatch.setattr(DeepMSPeptide, 'NumpyModel', RowModel)
+    monkeypatch.setattr(sys, 'argv', ['DeepMSPeptide.py', str(infile), '--model=model.npz', '--chunk_size=77'])
+    DeepMSPeptide.main()
+
+    expected = baseline_predictions(RowModel(None), baseline_codify(peptides, 81)[2])
+    assert (tmp_path / 'peptides_Predictions.txt').read_text() == expected
@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+
+from DeepMSPeptide import codify
+
+
+def baseline_codify(peptides, max_len):
+    """load_pep_and_codify of the original script for peptides of the 22 residues, padded as pad_sequences."""
+    aa_dict={'A':1,'R':2,'N':3,'D':4,'C':5,'Q':6,'E':7,'G':8,'H':9,'I':10,'L':11,'K':12,'M':13,'F':14,
+        'P':15,'O':16,'S':17,'U':18,'T':19,'W':20,'Y':21,'V':22}
+    pep_codes=[]
+    long_pep_counter = 0
+    newLines = []
+    for pep in peptides:
+        if not len(pep) > max_len:
+            current_pep=[]
+            for aa in pep:
+                current_pep.append(aa_dict[aa])
+            pep_codes.append(current_pep)
+            newLines.extend([pep])
+        else:
+            long_pep_counter += 1
+    predict_data = np.zeros((len(pep_codes), max_len), dtype=np.int32)
+    for row, codes in enumerate(pep_codes):
+        predict_data[row, :len(codes)] = codes
+    return predict_data, long_pep_counter, newLines
+
+
+def random_peptides(rand, num, residues='ACDEFGHIKLMNOPQRSTUVWY'):
+    return [''.join(rand.choice(residues) for _ in range(rand.randint(1, 90))) for _ in range(num)]
+
+
+def test_codify_matches_baseline():
+    peptides = random_peptides(random.Random(0), 2000)
+    predict_data, kept = codify(peptides, 81)
+    expected, skipped, lines = baseline_codify(peptides, 81)
+    assert predict_data.dtype == expected.dtype
+    assert np.array_equal(predict_data, expected)
+    assert [peptides[ind] for ind in kept] == lines
+    assert len(peptides) - len(kept) == skipped > 0
+
+
+def test_codify_skips_illegal_residues():
+    rand = random.Random(1)
+    peptides = random_peptides(rand, 500, 'ACDEFGHIKLMNOPQRSTUVWYBXZ*é')
+    predict_data, kept = codify(peptides, 81)
+    legal = [pep for pep in peptides if len(pep) <= 81 and set(pep) <= set('ACDEFGHIKLMNOPQRSTUVWY')]
+    assert [peptides[ind] for ind in kept] == legal
+    assert np.array_equal(predict_data, baseline_codify(legal, 81)[0])
+
+    predict_data, kept = codify([], 81)
+    assert predict_data.shape == (0, 81) and len(kept) == 0
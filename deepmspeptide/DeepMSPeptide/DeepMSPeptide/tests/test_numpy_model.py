@@ -0,0 +1,110 @@
+import json
+
+import numpy as np
+import pytest
+
+from numpy_model import NumpyModel
+
+
+def layer(class_name, **config):
+    return {'class_name': class_name, 'config': config}
+
+
+def reference_conv(h, kernel, bias, padding, stride, dilation, activation):
+    """Conv1D as a loop over the output positions and kernel taps, in float64."""
+    size = kernel.shape[0]
+    if padding == 'same':
+        out_len = -(-h.shape[1] // stride)
+        total = max((out_len - 1) * stride + (size - 1) * dilation + 1 - h.shape[1], 0)
+        h = np.pad(h, ((0, 0), (total // 2, total - total // 2), (0, 0)))
+    elif padding == 'causal':
+        h = np.pad(h, ((0, 0), ((size - 1) * dilation, 0), (0, 0)))
+    out_len = (h.shape[1] - (size - 1) * dilation - 1) // stride + 1
+    y = np.zeros((len(h), out_len, kernel.shape[2]))
+    for pos in range(out_len):
+        for tap in range(size):
+            y[:, pos] += h[:, pos * stride + tap * dilation] @ kernel[tap]
+    if bias is not None:
+        y += bias
+    return activation(y)
+
+
+def reference_pool(h, padding, reduce):
+    """Pooling of size 3 and stride 2 as a loop over the windows, ignoring the padding."""
+    if padding == 'same':
+        out_len = -(-h.shape[1] // 2)
+        total = max((out_len - 1) * 2 + 3 - h.shape[1], 0)
+        h = np.pad(h, ((0, 0), (total // 2, total - total // 2), (0, 0)), constant_values=np.nan)
+    out_len = (h.shape[1] - 3) // 2 + 1
+    return np.stack([reduce(h[:, 2 * pos : 2 * pos + 3], axis=1) for pos in range(out_len)], axis=1)
+
+
+@pytest.mark.parametrize('conv_padding, stride, dilation, pool_padding, pool, global_pool, layer_list', [
+    ('same', 1, 1, 'valid', 'MaxPooling1D', False, False),
+    ('valid', 2, 1, 'same', 'MaxPooling1D', False, False),
+    ('causal', 1, 2, 'same', 'AveragePooling1D', False, False),
+    ('same', 3, 2, 'valid', 'AveragePooling1D', True, False),
+    ('same', 2, 3, 'same', 'MaxPooling1D', False, True),
+])
+def test_numpy_model_matches_loop_reference(tmp_path, conv_padding, stride, dilation, pool_padding, pool,
+                                            global_pool, layer_list):
+    rng = np.random.default_rng(0)
+    layers = [
+        layer('InputLayer', name='input'),
+        layer('Embedding', name='embedding', input_dim=23, output_dim=12, mask_zero=False),
+        layer('Conv1D', name='conv1', strides=[1], dilation_rate=[dilation], padding=conv_padding,
+              activation='relu', use_bias=True, data_format='channels_last'),
+        layer('Conv1D', name='conv2', strides=[stride], dilation_rate=[1], padding='valid', activation='tanh',
+              use_bias=False),
+        layer(pool, name='pool', pool_size=[3], strides=[2], padding=pool_padding, data_format='channels_last'),
+        layer('Dropout', name='dropout', rate=0.5),
+        layer('BatchNormalization', name='norm', axis=-1, scale=True, center=True, epsilon=1e-3),
+        layer('GlobalMaxPooling1D', name='flat') if global_pool else layer('Flatten', name='flat'),
+        layer('Dense', name='hidden', activation='relu', use_bias=True),
+        layer('Dense', name='output', activation='sigmoid', use_bias=True),
+    ]
+    weights = {
+        'embedding': [rng.normal(size=(23, 12))],
+        'conv1': [rng.normal(size=(3, 12, 7)), rng.normal(size=7)],
+        'conv2': [rng.normal(size=(5, 7, 6))],
+        'norm': [rng.normal(size=6), rng.normal(size=6), rng.normal(size=6), rng.random(6) + 0.5],
+    }
+    weights = {name: [weight.astype(np.float32) for weight in ws] for name, ws in weights.items()}
+    x = rng.integers(0, 23, size=(37, 81)).astype(np.int32)
+
+    # the reference in float64 with the float32 weights
+    h = weights['embedding'][0].astype(np.float64)[x]
+    h = reference_conv(h, *weights['conv1'], conv_padding, 1, dilation, lambda v: np.maximum(v, 0))
+    h = reference_conv(h, weights['conv2'][0], None, 'valid', stride, 1, np.tanh)
+    h = reference_pool(h, pool_padding, np.nanmax if pool == 'MaxPooling1D' else np.nanmean)
+    gamma, beta, mean, variance = weights['norm']
+    h = (h - mean) / np.sqrt(variance + 1e-3) * gamma + beta
+    h = h.max(axis=1) if global_pool else h.reshape(len(h), -1)
+    weights['hidden'] = [(rng.normal(size=(h.shape[1], 10)) * 0.3).astype(np.float32),
+                         rng.normal(size=10).astype(np.float32)]
+    weights['output'] = [rng.normal(size=(10, 1)).astype(np.float32), rng.normal(size=1).astype(np.float32)]
+    h = np.maximum(h @ weights['hidden'][0] + weights['hidden'][1], 0)
+    reference = 1 / (1 + np.exp(-(h @ weights['output'][0] + weights['output'][1])))
+
+    # the npz of convert_model.py, with the layers in a dict or, as in older Keras versions, a list
+    config = layers if layer_list else {'name': 'sequential', 'layers': layers}
+    arrays = {'model_json': np.array(json.dumps({'class_name': 'Sequential', 'config': config}))}
+    for name, ws in weights.items():
+        arrays['%s_num' % name] = np.array(len(ws))
+        for ind, weight in enumerate(ws):
+            arrays['%s_%s' % (name, ind)] = weight
+    np.savez(str(tmp_path / 'model.npz'), **arrays)
+
+    model = NumpyModel(str(tmp_path / 'model.npz'))
+    out = model.predict(x, batch_size=10)
+    assert out.dtype == np.float32 and out.shape == (37, 1)
+    assert np.abs(out - reference).max() < 1e-5
+    assert model.predict(x[:0]).shape == (0, 1)
+
+
+def test_unsupported_layers_are_rejected(tmp_path):
+    config = {'name': 'sequential', 'layers': [layer('LSTM', name='lstm', units=4)]}
+    np.savez(str(tmp_path / 'model.npz'),
+             model_json=np.array(json.dumps({'class_name': 'Sequential', 'config': config})))
+    with pytest.raises(ValueError):
+        NumpyModel(str(tmp_path / 'model.npz'))
@@ -1,6 +1,12 @@
 import pandas as pd
 import sys
 
+def add_basic_properties(peptides_df):
+    """Adds the 'length' and 'M_count' columns to a peptides DataFrame."""
+    peptides_df["length"] = peptides_df["peptide"].apply(len)
+    peptides_df["M_count"] = peptides_df["peptide"].str.count('M')
+    return peptides_df
+
 def process_peptides():
     # Load the peptides.csv file
     try:
@@ -10,8 +16,7 @@ def process_peptides():
         sys.exit(1)
 
     # Adding new columns
-    peptides_df["length"] = peptides_df["peptide"].apply(len)
-    peptides_df["M_count"] = peptides_df["peptide"].str.count('M')
+    peptides_df = add_basic_properties(peptides_df)
 
     # Save the updated DataFrame back to peptides.csv
     peptides_df.to_csv("peptides.csv", index=False)
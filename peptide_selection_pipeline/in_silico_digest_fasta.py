@@ -1,39 +1,114 @@
+import io
+import multiprocessing
+import os
 import sys
 from pyteomics import parser, fasta
 import pandas as pd
 
+# Largest shard of the FASTA file a worker digests at once
+SHARD_BYTES = 16 << 20
+
 # Function to perform in-silico digestion of a protein sequence
+# (unique peptides in order of their first position, so that reruns give the same peptides.csv)
 def digest_protein(protein_sequence, missed_cleavages):
-    return list(parser.cleave(protein_sequence, parser.expasy_rules['trypsin'], missed_cleavages=missed_cleavages))
+    cleaved = parser.icleave(protein_sequence, parser.expasy_rules['trypsin'], missed_cleavages=missed_cleavages)
+    return list(dict.fromkeys(pep for _, pep in cleaved))
 
-# Function to process a FASTA file and perform digestion
-def process_fasta(fasta_file, missed_cleavages, output_file):
+# Function to split a FASTA file into shards of whole entries, as (start, end) byte offsets
+def fasta_shards(fasta_file, n_shards):
+    size = os.path.getsize(fasta_file)
+    bounds = [0]
+    with open(fasta_file, 'rb') as f:
+        for n in range(1, n_shards):
+            # Move every boundary forward to the start of the next entry
+            offset = max(size * n // n_shards, bounds[-1])
+            f.seek(offset)
+            block = f.read(1 << 16)
+            while block and b'\n>' not in block:
+                offset += len(block) - 1
+                f.seek(offset)
+                block = f.read(1 << 16)
+            if not block:
+                break
+            bounds.append(offset + block.index(b'\n>') + 1)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+# Function to digest the entries of one shard of a FASTA file, run in the worker processes
+def digest_shard(shard):
+    fasta_file, start, end, missed_cleavages = shard
+    with open(fasta_file, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode()
+    with fasta.read(io.StringIO(text, newline=None), use_index=False) as fasta_reader:
+        return [(entry.description, digest_protein(entry.sequence, missed_cleavages)) for entry in fasta_reader]
+
+# Function to digest the proteins of a FASTA file, yielding (Protein_ID, peptides) in FASTA order.
+# With more than one worker the file is split into shards by byte offset that are digested by a
+# process pool, and the results are taken in shard order, so the order does not change.
+def iter_digested_proteins(fasta_file, missed_cleavages, workers=1):
+    if workers <= 1:
+        with fasta.read(fasta_file) as fasta_reader:
+            for entry in fasta_reader:
+                yield entry.description, digest_protein(entry.sequence, missed_cleavages)
+        return
+
+    # Several shards per worker so that the workers stay busy when some shards take longer
+    n_shards = max(workers * 4, os.path.getsize(fasta_file) // SHARD_BYTES + 1)
+    shards = [(fasta_file, start, end, missed_cleavages) for start, end in fasta_shards(fasta_file, n_shards)]
+    with multiprocessing.Pool(workers) as pool:
+        for proteins in pool.imap(digest_shard, shards):
+            yield from proteins
+
+# Function to digest every protein of a FASTA file into a DataFrame
+def digest_fasta(fasta_file, missed_cleavages, workers=1):
     peptides = []
-    
-    with fasta.read(fasta_file) as fasta_reader:
-        for entry in fasta_reader:
-            protein_id, sequence = entry.description, entry.sequence
-            digested_peptides = digest_protein(sequence, missed_cleavages)
-            peptides.extend([(protein_id, pep) for pep in digested_peptides])
-    
-    # Convert to DataFrame and save to CSV
-    peptides_df = pd.DataFrame(peptides, columns=['Protein_ID', 'peptide'])
-    peptides_df.to_csv(output_file, index=False)
+    for protein_id, digested_peptides in iter_digested_proteins(fasta_file, missed_cleavages, workers):
+        peptides.extend([(protein_id, pep) for pep in digested_peptides])
+    return pd.DataFrame(peptides, columns=['Protein_ID', 'peptide'])
+
+# Function to digest a FASTA file in DataFrames of the peptides of chunk_size proteins each
+def iter_digest_chunks(fasta_file, missed_cleavages, chunk_size, workers=1):
+    peptides = []
+    n_proteins = 0
+
+    for protein_id, digested_peptides in iter_digested_proteins(fasta_file, missed_cleavages, workers):
+        peptides.extend([(protein_id, pep) for pep in digested_peptides])
+        n_proteins += 1
+        if n_proteins == chunk_size:
+            yield pd.DataFrame(peptides, columns=['Protein_ID', 'peptide'])
+            peptides = []
+            n_proteins = 0
+
+    if n_proteins:
+        yield pd.DataFrame(peptides, columns=['Protein_ID', 'peptide'])
+
+# Function to process a FASTA file and perform digestion
+def process_fasta(fasta_file, missed_cleavages, output_file, chunk_size=1000, workers=1):
+    # Save the peptides to CSV chunk by chunk, so the whole proteome is never held in memory
+    header = True
+    for peptides_df in iter_digest_chunks(fasta_file, missed_cleavages, chunk_size, workers):
+        peptides_df.to_csv(output_file, index=False, header=header, mode='w' if header else 'a')
+        header = False
+    if header:
+        pd.DataFrame(columns=['Protein_ID', 'peptide']).to_csv(output_file, index=False)
     print(f"Peptides have been saved to {output_file}.")
 
 # Main function
 def main():
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print("Usage: python proteome_digest.py <FASTA file> [missed_cleavages]")
+    if len(sys.argv) < 2 or len(sys.argv) > 4:
+        print("Usage: python proteome_digest.py <FASTA file> [missed_cleavages] [workers]")
         print("  <FASTA file>      : Path to the FASTA file containing the proteome (required).")
         print("  [missed_cleavages]: Number of missed cleavages allowed (optional, default is 0).")
+        print("  [workers]         : Number of processes digesting the proteins (optional, default is 1).")
         sys.exit(1)
     
     fasta_file = sys.argv[1]
-    missed_cleavages = int(sys.argv[2]) if len(sys.argv) == 3 else 0
+    missed_cleavages = int(sys.argv[2]) if len(sys.argv) >= 3 else 0
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else 1
     output_file = "peptides.csv"
     
-    process_fasta(fasta_file, missed_cleavages, output_file)
+    process_fasta(fasta_file, missed_cleavages, output_file, workers=workers)
 
 if __name__ == "__main__":
     main()
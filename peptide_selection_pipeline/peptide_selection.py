@@ -6,35 +6,48 @@ def count_valid_peaks(peaks_str):
         return 0  # Return 0 if the string is empty or NaN
     return len(peaks_str.split(','))  # Count number of peaks
 
-def filter_peptides(input_csv, output_csv):
-    # Load the peptides.csv file
-    df = pd.read_csv(input_csv)
-
-    # Drop rows with missing values in the relevant columns
-    required_columns = ['length', 'M_count', 'DMP_prob', 'DD_prob', 'CS_prob', 'valid_peaks']
-    df = df.dropna(subset=required_columns)
-
-    # Count valid peaks
-    df['valid_peaks_count'] = df['valid_peaks'].apply(count_valid_peaks)
-
-    # Base filtering conditions
-    conditions = (
-        (df['length'] >= 8) & (df['length'] <= 25) &
-        (df['M_count'] == 0) &
-        (df['DMP_prob'] >= 0.60) &
-        (df['DD_prob'] >= 0.40) &
-        (df['CS_prob'] >= 0.75) &
-        (df['valid_peaks_count'] >= 5)
-    )
+def column_conditions(min_length=8, max_length=25, max_m_count=0, min_dmp_prob=0.60,
+                      min_dd_prob=0.40, min_cs_prob=0.75, min_valid_peaks=5):
+    """
+    Returns the filter criteria per column, as functions that take the column and return which rows
+    pass. Rows with a missing value fail, except for 'unique'.
+    """
+    return {
+        'length': lambda col: col.notna() & (col >= min_length) & (col <= max_length),
+        'M_count': lambda col: col.notna() & (col <= max_m_count),
+        'unique': lambda col: col != False,
+        'DMP_prob': lambda col: col.notna() & (col >= min_dmp_prob),
+        'DD_prob': lambda col: col.notna() & (col >= min_dd_prob),
+        'CS_prob': lambda col: col.notna() & (col >= min_cs_prob),
+        'valid_peaks': lambda col: col.notna() & (col.apply(count_valid_peaks) >= min_valid_peaks),
+    }
+
+def passes_filters(df, columns, **thresholds):
+    """Returns which rows of a DataFrame meet the filter criteria on the given columns."""
+    conditions = column_conditions(**thresholds)
+    passes = pd.Series(True, index=df.index)
+    for col in columns:
+        passes &= conditions[col](df[col])
+    return passes
+
+def select_peptides(df, min_length=8, max_length=25, max_m_count=0, min_dmp_prob=0.60,
+                    min_dd_prob=0.40, min_cs_prob=0.75, min_valid_peaks=5):
+    """Returns the rows of a peptides DataFrame that meet all filter criteria."""
+    columns = ['length', 'M_count', 'DMP_prob', 'DD_prob', 'CS_prob', 'valid_peaks']
 
     # Add unique column condition if it exists
     if 'unique' in df.columns:
-        conditions = conditions & (df['unique'] != False)
+        columns.append('unique')
+
+    return df[passes_filters(df, columns, min_length=min_length, max_length=max_length, max_m_count=max_m_count,
+                             min_dmp_prob=min_dmp_prob, min_dd_prob=min_dd_prob, min_cs_prob=min_cs_prob,
+                             min_valid_peaks=min_valid_peaks)]
 
-    filtered_df = df[conditions]
+def filter_peptides(input_csv, output_csv):
+    # Load the peptides.csv file
+    df = pd.read_csv(input_csv)
 
-    # Drop the temporary count column before saving
-    filtered_df = filtered_df.drop(columns=['valid_peaks_count'])
+    filtered_df = select_peptides(df)
 
     # Save the filtered dataframe to final_selection.csv
     filtered_df.to_csv(output_csv, index=False)
@@ -1,15 +1,13 @@
 import pandas as pd
 
-def generate_ms2pip_input(peptides_csv, output_tsv):
-    # Load the peptides.csv file
-    peptides_df = pd.read_csv(peptides_csv)
-    
+def build_ms2pip_input(peptides_df):
+    """Returns the MS2PIP input table (peptidoform, spectrum_id) for a peptides DataFrame."""
     # Extract 'peptide' and 'CS' columns
     if 'peptide' not in peptides_df.columns or 'CS' not in peptides_df.columns:
         raise ValueError("peptides.csv must contain 'peptide' and 'CS' columns.")
     
-    # Drop rows where 'CS' is empty
-    peptides_df = peptides_df.dropna(subset=['CS'])
+    # Drop rows where 'CS' is empty, and repeated peptides
+    peptides_df = peptides_df.dropna(subset=['CS']).drop_duplicates(subset=['peptide'])
     
     # Ensure 'CS' is formatted correctly by removing '+' and converting to integer
     peptides_df['CS'] = peptides_df['CS'].astype(str).str.replace('+', '').astype(float).astype(int).astype(str)
@@ -19,7 +17,13 @@ def generate_ms2pip_input(peptides_csv, output_tsv):
     peptides_df['spectrum_id'] = range(1, len(peptides_df) + 1)
     
     # Select relevant columns
-    ms2pip_df = peptides_df[['peptidoform', 'spectrum_id']]
+    return peptides_df[['peptidoform', 'spectrum_id']]
+
+def generate_ms2pip_input(peptides_csv, output_tsv):
+    # Load the peptides.csv file
+    peptides_df = pd.read_csv(peptides_csv)
+
+    ms2pip_df = build_ms2pip_input(peptides_df)
     
     # Save to a TSV file
     ms2pip_df.to_csv(output_tsv, sep='\t', index=False)
@@ -1,21 +1,25 @@
 import pandas as pd
 import sys
 
+def write_unique_peptides(df, output_txt, mode='w'):
+    """Writes the unique peptides of a peptides DataFrame to a text file, one per line."""
+    if "peptide" not in df.columns:
+        print("Error: 'peptide' column not found in the CSV file.")
+        sys.exit(1)
+
+    # Extract unique, non-null, and non-empty peptides
+    unique_peptides = set(df["peptide"].dropna().astype(str).str.strip())
+
+    # Write unique peptides to a text file
+    with open(output_txt, mode) as f:
+        for peptide in unique_peptides:
+            f.write(f"{peptide}\n")
+    print(f"Unique peptides written to {output_txt}")
+
 def extract_unique_peptides(input_csv, output_txt):
     try:
         df = pd.read_csv(input_csv)
-        if "peptide" not in df.columns:
-            print("Error: 'peptide' column not found in the CSV file.")
-            sys.exit(1)
-
-        # Extract unique, non-null, and non-empty peptides
-        unique_peptides = set(df["peptide"].dropna().astype(str).str.strip())
-        
-        # Write unique peptides to a text file
-        with open(output_txt, 'w') as f:
-            for peptide in unique_peptides:
-                f.write(f"{peptide}\n")
-        print(f"Unique peptides written to {output_txt}")
+        write_unique_peptides(df, output_txt)
     except FileNotFoundError:
         print(f"Error: File {input_csv} not found.")
         sys.exit(1)
@@ -0,0 +1,783 @@
+#!/usr/bin/env python3
+"""
+Runs the peptide selection steps as a DAG of stages in a single process.
+
+Every peptide gets an integer peptide_id when the peptides are loaded. Each later stage only
+produces the columns it adds, indexed by peptide_id, and stores them as a sidecar in the cache
+directory (see stage_cache.py). A stage reads just the columns it needs from its upstream stages,
+and peptides.csv and final_selection.csv are joined and written once, at the end of the run.
+
+A predictor stage whose result file does not exist yet writes the input for that predictor
+instead and is marked as pending; stages depending on it are skipped. Run the predictor in its
+own environment (see README.md) and run the pipeline again to continue, or use --run_predictors
+to have the pipeline start the predictors of all pending stages at the same time (see predictors.py).
+
+With --chunk_size the stages run on the peptides of a limited number of proteins at a time, each
+chunk with its own sidecars, and the output of every chunk is appended to the output files, so the
+memory use does not grow with the size of the proteome.
+
+In cascade mode (--cascade) the stages run one after another, cheapest first, and every stage only
+gets the peptides that passed the selection thresholds on the columns of the stages before it.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+import pandas as pd
+from pyteomics import fasta
+
+from in_silico_digest_fasta import digest_fasta, iter_digest_chunks
+from basic_properties import add_basic_properties
+from retrieve_unipept import find_problematic_matches, add_unipept_uniqueness
+from peptides2txt import write_unique_peptides
+from retrieve_dmp_preds import load_dmp_preds, add_dmp_prob
+from retrieve_dd_preds import load_dd_preds, add_dd_prob, index_dd_preds, load_indexed_dd_preds
+from peptides2cpredinput import build_cpred_input
+from retrieve_cpred_preds import load_cpred_preds, add_cpred_data
+from peptides2ms2pipinput import build_ms2pip_input
+from retrieve_ms2pip_preds import process_spectronaut, add_ms2pip_data
+from peptide_selection import select_peptides, passes_filters
+from stage_cache import stage_key, is_cached, save_sidecar, join_sidecars
+from prediction_cache import hash_model, open_prediction_cache, lookup_predictions, store_predictions
+from predictors import PREDICTORS, DD_MIN_LEN, DD_MAX_LEN, run_predictors
+
+# Thresholds passed on to select_peptides
+SELECTION_PARAMS = ["min_length", "max_length", "max_m_count", "min_dmp_prob", "min_dd_prob",
+                    "min_cs_prob", "min_valid_peaks"]
+
+# Columns added by the stages; dropped when a previous pipeline output is used as input
+STAGE_COLUMNS = ["length", "M_count", "unique", "problematic_uniprot_matches", "DMP_prob", "DD_prob",
+                 "CS", "CS_prob", "valid_peaks", "average_peak_intensity"]
+
+# The stage every other stage's rows are keyed on
+ROOT_STAGE = "peptides"
+
+# Columns of each stage that the selection thresholds apply to
+FILTER_COLUMNS = {
+    "basic_properties": ["length", "M_count"],
+    "unipept": ["unique"],
+    "dmp": ["DMP_prob"],
+    "dd": ["DD_prob"],
+    "cpred": ["CS_prob"],
+    "ms2pip": ["valid_peaks"],
+}
+
+# Rough cost in seconds per peptide, used for the cascade order until the predictor of a stage was
+# timed with --run_predictors
+DEFAULT_COSTS = {
+    "basic_properties": 1e-6,
+    "unipept": 1e-5,
+    "dmp": 1e-3,
+    "dd": 2e-3,
+    "cpred": 5e-3,
+    "ms2pip": 1e-2,
+}
+
+# A stage takes a table of the 'reads' columns of its upstream stages, indexed by peptide_id, and
+# returns the columns it adds with the same index, or None when it is pending. 'params' and 'files'
+# name the arguments whose values, or file contents, the stage output depends on. Cached stages are
+# skipped on a rerun when none of these, nor the keys of their upstream stages, changed. Only the
+# rows that pass the selection thresholds on the 'filters' columns are passed to the stage.
+Stage = namedtuple("Stage", ["name", "func", "upstream", "reads", "params", "files", "cache", "filters"],
+                   defaults=[()])
+
+
+def added_columns(table, result_df):
+    """Returns the columns that a stage function added to the table, indexed by peptide_id."""
+    result_df.index = table.index
+    return result_df.drop(columns=[col for col in table.columns if col in result_df.columns])
+
+
+def read_peptides(args, chunksize=None):
+    """Reads the peptides CSV file, or an iterator over chunks of its rows if chunksize is given."""
+    try:
+        peptides = pd.read_csv(args.peptides, chunksize=chunksize)
+    except FileNotFoundError:
+        print(f"Error: {args.peptides} not found. Provide a peptides CSV file or a FASTA file with --fasta.")
+        sys.exit(1)
+    return peptides
+
+
+def previous_output_columns(peptides_df, args):
+    """Drops the columns added by the stages from a peptides table that is used as input."""
+    if "peptide" not in peptides_df.columns:
+        print(f"Error: 'peptide' column not found in {args.peptides}.")
+        sys.exit(1)
+    return peptides_df.drop(columns=[col for col in STAGE_COLUMNS if col in peptides_df.columns])
+
+
+def load_peptides(table, args):
+    if args.fasta:
+        print(f"Digesting {args.fasta} with {args.missed_cleavages} missed cleavages.")
+        peptides_df = digest_fasta(args.fasta, args.missed_cleavages, args.digest_workers)
+    else:
+        peptides_df = previous_output_columns(read_peptides(args), args)
+
+    peptides_df.index = pd.Index(range(len(peptides_df)), name="peptide_id")
+    return peptides_df
+
+
+def peptide_chunks(args):
+    """Yields the peptides of chunk_size proteins of the FASTA file, or chunk_size rows of the peptides CSV."""
+    if args.fasta:
+        print(f"Digesting {args.fasta} with {args.missed_cleavages} missed cleavages, "
+              f"{args.chunk_size} proteins at a time.")
+        yield from iter_digest_chunks(args.fasta, args.missed_cleavages, args.chunk_size, args.digest_workers)
+    else:
+        for peptides_df in read_peptides(args, args.chunk_size):
+            yield previous_output_columns(peptides_df, args)
+
+
+def run_basic_properties(table, args):
+    return added_columns(table, add_basic_properties(table.copy()))
+
+
+@lru_cache(maxsize=1)
+def unipept_matches(unipept_file, taxon_id, protein_id, keywords):
+    # Read once per run, also when the stage runs for every chunk
+    keywords = [kw.strip() for kw in keywords.split(",")]
+    return find_problematic_matches(unipept_file, taxon_id, protein_id, keywords)
+
+
+def run_unipept(table, args):
+    if not args.unipept_file:
+        print("No --unipept_file given, skipping the uniqueness analysis.")
+        return pd.DataFrame(index=table.index)
+    problematic_matches = unipept_matches(args.unipept_file, args.taxon_id, args.protein_id, args.keywords)
+    return added_columns(table, add_unipept_uniqueness(table.copy(), problematic_matches))
+
+
+def covers_input(result_file, input_file):
+    """Checks whether a predictor result file was made after the input file that the pipeline wrote."""
+    return os.path.exists(input_file) and os.path.getmtime(result_file) >= os.path.getmtime(input_file)
+
+
+def cached_predictions(args, tool, model, keys, read_results):
+    """
+    Looks up (peptide, modifications, charge) keys in the prediction cache. Keys that are not cached
+    yet are looked up in the predictor's result file through read_results, and the predictions found
+    there are added to the cache. Returns the values found for the keys and the keys that are missing.
+    """
+    found = {}
+    if not args.no_prediction_cache:
+        conn = open_prediction_cache(args.prediction_cache)
+        model_hash = hash_model(model)
+        found = lookup_predictions(conn, tool, model_hash, keys)
+
+    missing = [key for key in keys if key not in found]
+    # In chunked mode the result files were added to the cache before the first chunk
+    if missing and not args.chunk_size:
+        results = read_results()
+        new = {key: results[key] for key in missing if key in results}
+        if new and not args.no_prediction_cache:
+            store_predictions(conn, tool, model_hash, new)
+        found.update(new)
+        missing = [key for key in missing if key not in found]
+
+    if args.no_prediction_cache:
+        # The next result file replaces this one, so it has to hold the predictions for every key
+        return found, keys if missing else []
+
+    conn.close()
+    print(f"{tool}: {len(keys) - len(missing)} of {len(keys)} predictions available.")
+    return found, missing
+
+
+def ingest_predictions(args):
+    """
+    Adds the predictions of all result files to the prediction cache, and indexes the DeepDetect
+    predictions by protein so that every chunk only reads the predictions for its own proteins.
+    """
+    conn = open_prediction_cache(args.prediction_cache)
+    for tool, model, read_results in [("DeepMSPeptide", args.dmp_model, read_dmp_results),
+                                      ("CPred", args.cpred_model, read_cpred_results),
+                                      ("MS2PIP", args.ms2pip_model, read_ms2pip_results)]:
+        results = read_results(args)
+        if results:
+            store_predictions(conn, tool, hash_model(model), results)
+            print(f"{tool}: added {len(results)} predictions to the prediction cache.")
+    conn.close()
+
+    args.dd_index = None
+    if not args.dd_inprocess and os.path.exists(args.dd_file):
+        args.dd_index = os.path.join(args.cache_dir, "dd_predictions.sqlite")
+        index_dd_preds(args.dd_file, args.dd_index)
+
+
+def unwritten_keys(args, input_file, keys):
+    """
+    Returns the keys that were not written to a predictor input in this run yet, and the number of
+    keys that were, or None if the input has not been written yet. The first chunk with missing
+    predictions replaces the input file, later chunks append only the keys that are not in it.
+    """
+    written = args.inputs_written.get(input_file)
+    offset = None if written is None else len(written)
+    new = [key for key in keys if written is None or key not in written]
+    args.inputs_written.setdefault(input_file, set()).update(new)
+    return new, offset
+
+
+def predictions_frame(found, key_column, value_columns):
+    """Turns the values found for (peptide, modifications, charge) keys into a DataFrame."""
+    rows = [[key[0]] + [value[col] for col in value_columns] for key, value in found.items()]
+    return pd.DataFrame(rows, columns=[key_column] + value_columns, dtype=object).infer_objects()
+
+
+def read_dmp_results(args):
+    if not os.path.exists(args.dmp_file):
+        return {}
+    dmp_df = load_dmp_preds(args.dmp_file)
+    results = {(pep, "", 0): {"DMP_prob": prob} for pep, prob in zip(dmp_df["peptide"], dmp_df["DMP_prob"])}
+
+    # DeepMSPeptide skips peptides it cannot score, they get an empty prediction
+    if covers_input(args.dmp_file, args.dmp_input):
+        with open(args.dmp_input) as f:
+            for pep in f.read().splitlines():
+                results.setdefault((pep, "", 0), {"DMP_prob": None})
+    return results
+
+
+@lru_cache(maxsize=1)
+def dmp_numpy_model(dmp_model):
+    # The NumPy model written by convert_model.py next to the Keras model, loaded once per run
+    dmp_dir = os.path.dirname(os.path.abspath(dmp_model))
+    sys.path.insert(0, dmp_dir)
+    from DeepMSPeptide import DeepMSPeptide
+    return DeepMSPeptide(os.path.splitext(os.path.abspath(dmp_model))[0] + ".npz")
+
+
+def predict_dmp(args, keys):
+    """Predicts the DeepMSPeptide probabilities of the keys in this process and adds them to the prediction cache."""
+    probs = dmp_numpy_model(args.dmp_model).predict([key[0] for key in keys])
+    # Peptides that DeepMSPeptide cannot score get an empty prediction
+    results = {key: {"DMP_prob": None if pd.isna(prob) else float(prob)} for key, prob in zip(keys, probs)}
+    if not args.no_prediction_cache:
+        conn = open_prediction_cache(args.prediction_cache)
+        store_predictions(conn, "DeepMSPeptide", hash_model(args.dmp_model), results)
+        conn.close()
+    return results
+
+
+def run_dmp(table, args):
+    peptides = table["peptide"].dropna().astype(str).str.strip().unique()
+    keys = [(pep, "", 0) for pep in peptides]
+    found, missing = cached_predictions(args, "DeepMSPeptide", args.dmp_model, keys,
+                                        lambda: read_dmp_results(args))
+    if missing and args.dmp_inprocess:
+        found.update(predict_dmp(args, missing))
+        missing = []
+    if missing:
+        new, offset = unwritten_keys(args, args.dmp_input, missing)
+        write_unique_peptides(pd.DataFrame({"peptide": [key[0] for key in new]}), args.dmp_input,
+                              mode="w" if offset is None else "a")
+        print(f"Run DeepMSPeptide on {args.dmp_input} and save its predictions as {args.dmp_file}.")
+        return None
+    dmp_df = predictions_frame(found, "peptide", ["DMP_prob"])
+    return added_columns(table, add_dmp_prob(table.copy(), dmp_df))
+
+
+def write_proteins(fasta_file, protein_ids, output_fasta):
+    """Writes the entries of a FASTA file whose description is one of protein_ids."""
+    with fasta.read(fasta_file) as fasta_reader:
+        entries = [entry for entry in fasta_reader if entry.description in protein_ids]
+    fasta.write(entries, output_fasta, file_mode="w")
+
+
+def dd_model_files(dd_dir):
+    """Returns the Trypsin model files DeepDetect in dd_dir predicts with, see its predictor.py."""
+    model_dir = os.path.join(dd_dir, "..", "..", "DeepDetect")
+    return [os.path.join(model_dir, name) for name in
+            ["BiLSTM_Trypsin.json", "BiLSTM_Trypsin.h5", "DeepDigest_Trypsin.json", "DeepDigest_Trypsin.h5",
+             "DeepDetect_Trypsin.npz"]]
+
+
+@lru_cache(maxsize=1)
+def deepdetect_model(dd_dir, missed_cleavages):
+    # The Trypsin models are loaded once per run, also when the stage runs for every chunk. The
+    # peptides are digested with the same length limits as by the DeepDetect subprocess.
+    sys.path.insert(0, os.path.abspath(dd_dir))
+    from deepdetect_api import DeepDetect
+    return DeepDetect("Trypsin", missed_cleavages, DD_MIN_LEN, DD_MAX_LEN)
+
+
+def protein_sequences(fasta_file, protein_ids):
+    """Returns the sequences of the FASTA entries whose description is one of protein_ids."""
+    # Only the sequences of the proteins asked for are kept, so that a chunk does not hold the whole FASTA file
+    with fasta.read(fasta_file) as fasta_reader:
+        sequences = {entry.description: entry.sequence for entry in fasta_reader if entry.description in protein_ids}
+    unknown = protein_ids - sequences.keys()
+    if unknown:
+        print(f"Error: {len(unknown)} proteins of the peptides are not in {fasta_file}, "
+              f"e.g. '{sorted(unknown)[0]}'.")
+        sys.exit(1)
+    return sequences
+
+
+def run_dd_inprocess(table, args):
+    """Predicts the detectabilities with the DeepDetect library in this process, without a result file."""
+    dd = deepdetect_model(args.dd_dir, args.missed_cleavages)
+    sequences = protein_sequences(args.fasta, set(table["Protein_ID"]))
+    # Peptides that DeepDetect does not digest from their protein get no prediction
+    dd_prob = dd.predict_peptides(list(table["peptide"]), [sequences[pro] for pro in table["Protein_ID"]])
+    return pd.DataFrame({"DD_prob": dd_prob}, index=table.index)
+
+
+def run_dd(table, args):
+    if args.dd_inprocess:
+        return run_dd_inprocess(table, args)
+    if args.cascade and args.fasta:
+        # DeepDetect is only run on the proteins that still have peptides left
+        proteins = set(table["Protein_ID"])
+        predicted = set()
+        if os.path.exists(args.dd_file):
+            # The proteins with predictions, e.g. from a DeepDetect run on the whole FASTA file
+            predicted = set(pd.read_csv(args.dd_file, sep="\t", usecols=["Protein id"], dtype=str)["Protein id"])
+            # and the proteins written for DeepDetect before, also those without any predicted peptide
+            if covers_input(args.dd_file, args.dd_input):
+                with fasta.read(args.dd_input) as fasta_reader:
+                    predicted.update(entry.description for entry in fasta_reader)
+        if not proteins <= predicted:
+            write_proteins(args.fasta, proteins, args.dd_input)
+            print(f"Run DeepDetect on {args.dd_input} and save its predictions as {args.dd_file}.")
+            return None
+    elif not os.path.exists(args.dd_file):
+        print(f"Run DeepDetect on the FASTA file and save its predictions as {args.dd_file}.")
+        return None
+    if args.chunk_size:
+        # Only the predictions for the proteins of the chunk are read, from the index made before the first chunk
+        dd_df = load_indexed_dd_preds(args.dd_index, set(table["Protein_ID"]))
+    else:
+        dd_df = load_dd_preds(args.dd_file)
+    return added_columns(table, add_dd_prob(table.copy(), dd_df))
+
+
+def read_cpred_results(args):
+    if not os.path.exists(args.cpred_file):
+        return {}
+    # The predictions are matched to cpred_input.csv by row, so they have to belong to that input
+    cpred_input_rows = len(pd.read_csv(args.cpred_input)) if os.path.exists(args.cpred_input) else None
+    if cpred_input_rows is None or not covers_input(args.cpred_file, args.cpred_input) \
+            or cpred_input_rows != len(pd.read_csv(args.cpred_file)):
+        print(f"Warning: {args.cpred_file} does not match {args.cpred_input}, ignoring it.")
+        return {}
+    cpred_df = load_cpred_preds(args.cpred_file, args.cpred_input)
+    return {(pep, "", 0): {"CS": int(cs), "CS_prob": prob}
+            for pep, cs, prob in zip(cpred_df["peptide"], cpred_df["CS"], cpred_df["CS_prob"])}
+
+
+def run_cpred(table, args):
+    cpred_input_df = build_cpred_input(table)
+    keys = [(pep, "", 0) for pep in cpred_input_df["Peptide_sequence"]]
+    found, missing = cached_predictions(args, "CPred", args.cpred_model, keys, lambda: read_cpred_results(args))
+    if missing:
+        new, offset = unwritten_keys(args, args.cpred_input, missing)
+        cpred_input_df = cpred_input_df[cpred_input_df["Peptide_sequence"].isin({key[0] for key in new})]
+        cpred_input_df.to_csv(args.cpred_input, index=False, mode="w" if offset is None else "a",
+                              header=offset is None)
+        print(f"Run CPred on {args.cpred_input} and save its predictions as {args.cpred_file}.")
+        return None
+    cpred_df = predictions_frame(found, "peptide", ["CS", "CS_prob"])
+    # The cache holds the charge as a number, the output keeps CPred's labels such as '+2'
+    cpred_df["CS"] = [f"+{int(cs)}" for cs in cpred_df["CS"]]
+    return added_columns(table, add_cpred_data(table.copy(), cpred_df))
+
+
+def peptidoform_key(peptidoform):
+    peptide, charge = peptidoform.split("/")
+    return peptide, "", int(charge)
+
+
+def read_ms2pip_results(args):
+    if not os.path.exists(args.ms2pip_file):
+        return {}
+    # Peptides are matched on their sequence, at the charge they were sent to MS2PIP with
+    if not covers_input(args.ms2pip_file, args.ms2pip_input):
+        print(f"Warning: {args.ms2pip_file} is older than {args.ms2pip_input}, ignoring it.")
+        return {}
+    ms2pip_input_df = pd.read_csv(args.ms2pip_input, sep="\t")
+    spec_results = process_spectronaut(args.ms2pip_file).set_index("StrippedPeptide")
+    results = {}
+    for peptidoform in ms2pip_input_df["peptidoform"]:
+        key = peptidoform_key(peptidoform)
+        if key[0] in spec_results.index:
+            peaks = spec_results.loc[key[0]]
+            results[key] = {"ValidPeaks": peaks["ValidPeaks"], "AvgIntensity": float(peaks["AvgIntensity"])}
+        else:
+            # No fragment with a non-zero intensity was predicted
+            results[key] = {"ValidPeaks": None, "AvgIntensity": None}
+    return results
+
+
+def run_ms2pip(table, args):
+    ms2pip_input_df = build_ms2pip_input(table)
+    keys = [peptidoform_key(peptidoform) for peptidoform in ms2pip_input_df["peptidoform"]]
+    found, missing = cached_predictions(args, "MS2PIP", args.ms2pip_model, keys, lambda: read_ms2pip_results(args))
+    if missing:
+        new, offset = unwritten_keys(args, args.ms2pip_input, missing)
+        new_peptidoforms = {f"{peptide}/{charge}" for peptide, _, charge in new}
+        ms2pip_input_df = ms2pip_input_df[ms2pip_input_df["peptidoform"].isin(new_peptidoforms)].copy()
+        first_id = (offset or 0) + 1
+        ms2pip_input_df["spectrum_id"] = range(first_id, first_id + len(ms2pip_input_df))
+        ms2pip_input_df.to_csv(args.ms2pip_input, sep="\t", index=False, mode="w" if offset is None else "a",
+                               header=offset is None)
+        print(f"Run MS2PIP on {args.ms2pip_input} with the {args.ms2pip_model} model "
+              f"and save its predictions as {args.ms2pip_file}.")
+        return None
+    spec_results = predictions_frame(found, "StrippedPeptide", ["ValidPeaks", "AvgIntensity"])
+    return added_columns(table, add_ms2pip_data(table.copy(), spec_results))
+
+
+def run_selection(table, args):
+    filtered_df = select_peptides(table, **{param: getattr(args, param) for param in SELECTION_PARAMS})
+    return pd.DataFrame({"selected": table.index.isin(filtered_df.index)}, index=table.index)
+
+
+STAGES = [
+    Stage("peptides", load_peptides, [], [], ["missed_cleavages"], [], False),
+    Stage("basic_properties", run_basic_properties, ["peptides"], ["peptide"], [], [], True),
+    Stage("unipept", run_unipept, ["peptides"], ["peptide"],
+          ["taxon_id", "protein_id", "keywords"], ["unipept_file"], True),
+    Stage("dmp", run_dmp, ["peptides"], ["peptide"], [], ["dmp_file", "dmp_model"], True),
+    Stage("dd", run_dd, ["peptides"], ["Protein_ID", "peptide"], ["dd_inprocess", "missed_cleavages", "dd_dir"],
+          ["dd_file", "fasta", "dd_models"], True),
+    Stage("cpred", run_cpred, ["peptides"], ["peptide"], [], ["cpred_file", "cpred_input", "cpred_model"], True),
+    Stage("ms2pip", run_ms2pip, ["peptides", "cpred"], ["peptide", "CS"], ["ms2pip_model"], ["ms2pip_file"], True),
+    Stage("selection", run_selection, ["basic_properties", "unipept", "dmp", "dd", "cpred", "ms2pip"],
+          ["length", "M_count", "unique", "DMP_prob", "DD_prob", "CS_prob", "valid_peaks"], SELECTION_PARAMS, [],
+          False),
+]
+
+
+def stage_costs(cache_dir):
+    """Loads the measured cost per peptide of the stages."""
+    costs = dict(DEFAULT_COSTS)
+    costs_path = os.path.join(cache_dir, "stage_costs.json")
+    if os.path.exists(costs_path):
+        with open(costs_path) as f:
+            costs.update(json.load(f))
+    return costs
+
+
+def save_stage_costs(cache_dir, costs):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, "stage_costs.json"), "w") as f:
+        json.dump(costs, f, indent=2)
+
+
+def cascade_stages(stages, costs):
+    """
+    Chains the stages for cascade mode. The stages between the root and the selection are ordered by
+    their cost per peptide, as long as every stage still comes after its upstream stages, and each
+    stage depends on all stages before it and filters its rows on their columns.
+    """
+    root = [stage for stage in stages if stage.name == ROOT_STAGE]
+    final = [stage for stage in stages if stage.name not in FILTER_COLUMNS and stage.name != ROOT_STAGE]
+    remaining = [stage for stage in stages if stage.name in FILTER_COLUMNS]
+
+    chained = []
+    while remaining:
+        names = [ROOT_STAGE] + [stage.name for stage in chained]
+        ready = [stage for stage in remaining if all(name in names for name in stage.upstream)]
+        cheapest = min(ready, key=lambda stage: costs[stage.name])
+        filters = [col for name in names[1:] for col in FILTER_COLUMNS[name]]
+        chained.append(cheapest._replace(upstream=names, params=list(cheapest.params) + SELECTION_PARAMS,
+                                         filters=filters))
+        remaining.remove(cheapest)
+    return root + chained + final
+
+
+def stage_order(stages):
+    """Orders the stages so that every stage comes after its upstream stages."""
+    by_name = {stage.name: stage for stage in stages}
+    ordered = []
+    visiting = set()
+
+    def visit(stage):
+        if stage in ordered:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Stage '{stage.name}' depends on itself.")
+        visiting.add(stage.name)
+        for name in stage.upstream:
+            visit(by_name[name])
+        visiting.discard(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def stage_inputs(stage, args):
+    """Returns the parameters and the files a stage's key is made of; a file argument may hold a list of files."""
+    params = {param: getattr(args, param) for param in stage.params}
+    files = []
+    for file_arg in stage.files:
+        path = getattr(args, file_arg)
+        files.extend(path if isinstance(path, list) else [path])
+    return params, files
+
+
+def run_stages(stages, args):
+    """
+    Runs the stages in dependency order. Returns the stages whose columns are available, the outputs
+    of the stages that ran (the others are read from their sidecars when needed) and the pending stages,
+    mapped to the number of peptides they were given.
+    """
+    keys = {}
+    frames = {}
+    done = []
+    pending = {}
+    for stage in stage_order(stages):
+        blocked = [name for name in stage.upstream if name in pending]
+        if blocked:
+            print(f"Skipping stage '{stage.name}', waiting for: {', '.join(blocked)}")
+            pending[stage.name] = None
+            continue
+
+        params, files = stage_inputs(stage, args)
+        upstream_keys = [keys[name] for name in stage.upstream]
+        if stage.cache:
+            key = stage_key(stage.name, upstream_keys, params, files)
+            if not args.no_cache and is_cached(args.cache_dir, stage.name, key):
+                print(f"Stage '{stage.name}' is up to date.")
+                keys[stage.name] = key
+                done.append(stage.name)
+                continue
+
+        table = None
+        if stage.upstream:
+            sources = [ROOT_STAGE] + [name for name in stage.upstream if name != ROOT_STAGE]
+            table = join_sidecars(args.cache_dir, sources, list(stage.reads) + list(stage.filters), frames)
+            filters = [col for col in stage.filters if col in table.columns]
+            if filters:
+                thresholds = {param: getattr(args, param) for param in SELECTION_PARAMS}
+                table = table[passes_filters(table, filters, **thresholds)]
+                print(f"{len(table)} peptides passed the filters on {', '.join(filters)}.")
+            table = table[[col for col in table.columns if col in stage.reads]]
+
+        print(f"Running stage '{stage.name}'")
+        result_df = stage.func(table, args)
+        if result_df is None:
+            pending[stage.name] = len(table)
+            continue
+
+        if not stage.cache:
+            key = stage_key(stage.name, upstream_keys, params, files, result_df)
+        save_sidecar(args.cache_dir, stage.name, key, result_df)
+        frames[stage.name] = result_df
+        keys[stage.name] = key
+        done.append(stage.name)
+    return done, frames, pending
+
+
+def write_outputs(args, peptides_df, append=False):
+    """Saves the peptides and the selected peptides, or appends them to the output files."""
+    mode = "a" if append else "w"
+    if "selected" in peptides_df.columns:
+        selected = peptides_df.pop("selected").astype(bool)
+        peptides_df[selected].to_csv(args.selection_output, index=False, mode=mode, header=not append)
+    peptides_df.to_csv(args.output, index=False, mode=mode, header=not append)
+
+
+def run_chunks(stages, args):
+    """
+    Runs the stages on one chunk of peptides at a time, with the sidecars of every chunk in its own
+    directory, and appends the output of each chunk to the output files. Returns the pending stages,
+    mapped to the number of peptides they were given in all chunks.
+    """
+    ingest_predictions(args)
+    pending = {}
+    columns = None
+    selection_written = False
+    offset = 0
+    for n, chunk_df in enumerate(peptide_chunks(args)):
+        chunk_df.index = pd.Index(range(offset, offset + len(chunk_df)), name="peptide_id")
+        offset += len(chunk_df)
+
+        # The chunk takes the place of the root stage
+        chunk_stages = [stage._replace(func=lambda table, args, chunk_df=chunk_df: chunk_df)
+                        if stage.name == ROOT_STAGE else stage for stage in stages]
+        chunk_args = argparse.Namespace(**vars(args))
+        chunk_args.cache_dir = os.path.join(args.cache_dir, "chunks", str(n))
+        done, frames, chunk_pending = run_stages(chunk_stages, chunk_args)
+        for name, rows in chunk_pending.items():
+            pending[name] = None if rows is None else (pending.get(name) or 0) + rows
+
+        # Every chunk is written with the columns of the first one
+        peptides_df = join_sidecars(chunk_args.cache_dir, done, frames=frames).reset_index(drop=True)
+        if columns is None:
+            columns = list(peptides_df.columns)
+        peptides_df = peptides_df.reindex(columns=columns)
+        if "selected" in columns:
+            # The selection is written when it ran in the first chunk, a later chunk without it selects nothing
+            peptides_df["selected"] = peptides_df["selected"] == True
+            selection_written = True
+        write_outputs(args, peptides_df, append=n > 0)
+    if selection_written:
+        print(f"Filtered peptides saved to {args.selection_output}")
+    print(f"Saved {offset} peptides to {args.output}.")
+    return pending
+
+
+def run_pipeline(stages, args):
+    """Runs the stages on all peptides, or chunk by chunk, saves the output and returns the pending stages."""
+    args.inputs_written = {}
+    args.dd_models = dd_model_files(args.dd_dir)
+    if args.chunk_size:
+        return run_chunks(stages, args)
+
+    done, frames, pending = run_stages(stages, args)
+
+    # Join the columns of all stages that ran and save the tables once
+    peptides_df = join_sidecars(args.cache_dir, done, frames=frames).reset_index(drop=True)
+    write_outputs(args, peptides_df)
+    if "selection" in done:
+        print(f"Filtered peptides saved to {args.selection_output}")
+    print(f"Saved {len(peptides_df)} peptides to {args.output}.")
+    return pending
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the peptide selection pipeline in a single process."
+    )
+    parser.add_argument("--fasta", type=str,
+                        help="FASTA file to digest. If not given, the peptides are read from --peptides")
+    parser.add_argument("--missed_cleavages", type=int, default=0,
+                        help="Number of missed cleavages allowed in the digestion (default: 0)")
+    parser.add_argument("--digest_workers", type=int, default=1,
+                        help="Number of processes digesting the FASTA file (default: 1)")
+    parser.add_argument("--peptides", type=str, default="peptides.csv",
+                        help="Peptides CSV file with at least a 'peptide' column (default: peptides.csv)")
+    parser.add_argument("--output", type=str, default="peptides.csv",
+                        help="Output CSV file with all peptide properties (default: peptides.csv)")
+    parser.add_argument("--selection_output", type=str, default="final_selection.csv",
+                        help="Output CSV file with the selected peptides (default: final_selection.csv)")
+    parser.add_argument("--unipept_file", type=str,
+                        help="Unipept pept2prot results. If not given, the uniqueness analysis is skipped")
+    parser.add_argument("--taxon_id", type=int,
+                        help="Taxon id to filter the unipept results for (e.g. 208964)")
+    parser.add_argument("--protein_id", type=str,
+                        help="Protein id to exclude from problematic matches (e.g. P48632)")
+    parser.add_argument("--keywords", type=str,
+                        help="Comma-separated keywords (e.g. 'Ferripyoverdine receptor,Ferripyoverdine,FpvA')")
+    parser.add_argument("--dmp_input", type=str, default="peptides.txt",
+                        help="DeepMSPeptide input written for the peptides without predictions (default: peptides.txt)")
+    parser.add_argument("--dmp_file", type=str, default="peptides_DMP.txt",
+                        help="DeepMSPeptide predictions (default: peptides_DMP.txt)")
+    parser.add_argument("--dd_file", type=str, default="peptides_DD.txt",
+                        help="DeepDetect predictions (default: peptides_DD.txt)")
+    parser.add_argument("--dd_input", type=str, default="dd_input.fasta",
+                        help="FASTA file written for DeepDetect in cascade mode (default: dd_input.fasta)")
+    parser.add_argument("--cpred_file", type=str, default="peptides_CPred.csv",
+                        help="CPred predictions (default: peptides_CPred.csv)")
+    parser.add_argument("--cpred_input", type=str, default="cpred_input.csv",
+                        help="CPred input the predictions were made for (default: cpred_input.csv)")
+    parser.add_argument("--ms2pip_input", type=str, default="ms2pip_input.tsv",
+                        help="MS2PIP input written for the peptides without predictions (default: ms2pip_input.tsv)")
+    parser.add_argument("--ms2pip_file", type=str, default="peptides_ms2pip.spectronaut.tsv",
+                        help="MS2PIP predictions (default: peptides_ms2pip.spectronaut.tsv)")
+    parser.add_argument("--dmp_model", type=str,
+                        default=os.path.join("..", "deepmspeptide", "DeepMSPeptide", "DeepMSPeptide", "model_2_1D.h5"),
+                        help="DeepMSPeptide model the predictions are made with")
+    parser.add_argument("--cpred_model", type=str,
+                        default=os.path.join("..", "cpred_optimized", "CPred", "CPred", "Data", "Models",
+                                             "CPred_model_v1.h5"),
+                        help="CPred model the predictions are made with")
+    parser.add_argument("--ms2pip_model", type=str, default="HCD",
+                        help="MS2PIP model the predictions are made with (default: HCD)")
+    parser.add_argument("--prediction_cache", type=str,
+                        default=os.path.join(os.path.expanduser("~"), ".cache", "peptide_selection", "predictions.sqlite"),
+                        help="SQLite file with the predictions of previous runs (default: "
+                             "~/.cache/peptide_selection/predictions.sqlite)")
+    parser.add_argument("--no_prediction_cache", action="store_true",
+                        help="Do not read or store predictions in the prediction cache")
+    parser.add_argument("--min_length", type=int, default=8, help="Minimum peptide length (default: 8)")
+    parser.add_argument("--max_length", type=int, default=25, help="Maximum peptide length (default: 25)")
+    parser.add_argument("--max_m_count", type=int, default=0, help="Maximum number of methionines (default: 0)")
+    parser.add_argument("--min_dmp_prob", type=float, default=0.60,
+                        help="Minimum DeepMSPeptide probability (default: 0.60)")
+    parser.add_argument("--min_dd_prob", type=float, default=0.40,
+                        help="Minimum DeepDetect detectability (default: 0.40)")
+    parser.add_argument("--min_cs_prob", type=float, default=0.75,
+                        help="Minimum probability of the predicted charge state (default: 0.75)")
+    parser.add_argument("--min_valid_peaks", type=int, default=5,
+                        help="Minimum number of valid MS2PIP peaks (default: 5)")
+    parser.add_argument("--cache_dir", type=str, default=".pipeline_cache",
+                        help="Directory for the stage sidecar files (default: .pipeline_cache)")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Run every stage, even if its cached sidecar is up to date")
+    parser.add_argument("--chunk_size", type=int,
+                        help="Run the stages on the peptides of this many proteins at a time (or this many rows "
+                             "of the peptides CSV) and append the output of every chunk")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Apply each selection threshold as soon as its column exists and only pass the "
+                             "peptides that are left to the more expensive stages")
+    parser.add_argument("--run_predictors", action="store_true",
+                        help="Run the predictors of pending stages as concurrent subprocesses and continue "
+                             "with their results")
+    parser.add_argument("--dd_dir", type=str, default=os.path.join("..", "deepdetect", "SourceCode", "deepdetect_pred"),
+                        help="DeepDetect directory with main.py and the models")
+    parser.add_argument("--dmp_inprocess", action="store_true",
+                        help="Predict the missing DeepMSPeptide probabilities in this process with the NumPy model "
+                             "written by convert_model.py next to --dmp_model, without TensorFlow")
+    parser.add_argument("--dd_inprocess", action="store_true",
+                        help="Predict the DeepDetect detectabilities in this process with the models of --dd_dir "
+                             "instead of reading --dd_file (needs --fasta and the DeepDetect packages)")
+    parser.add_argument("--dd_regular", type=str, default=r">(\S+)",
+                        help="Regular expression DeepDetect takes the protein id from (default: '>(\\S+)')")
+    parser.add_argument("--cpred_dir", type=str, default=os.path.join("..", "cpred_optimized", "CPred", "CPred"),
+                        help="CPred directory with CPred_main.py")
+    envs = {"dmp": "deepms_env", "dd": "deepdetect_env", "cpred": "cpred_optimized_env", "ms2pip": "ms2pip_env"}
+    for name, env in envs.items():
+        parser.add_argument(f"--{name}_env", type=str, default=env,
+                            help=f"Conda environment the {name} predictor runs in (default: {env})")
+        parser.add_argument(f"--{name}_python", type=str,
+                            help=f"Python interpreter to run the {name} predictor with instead of the conda environment")
+        parser.add_argument(f"--{name}_cores", type=int,
+                            help=f"Number of CPU cores for the {name} predictor "
+                                 "(default: an even share of the cores that are not assigned)")
+    args = parser.parse_args()
+
+    if args.unipept_file and None in (args.taxon_id, args.protein_id, args.keywords):
+        parser.error("--unipept_file requires --taxon_id, --protein_id and --keywords")
+    if args.chunk_size and (args.cascade or args.no_prediction_cache):
+        parser.error("--chunk_size cannot be combined with --cascade or --no_prediction_cache")
+    if args.dd_inprocess and not args.fasta:
+        parser.error("--dd_inprocess requires --fasta")
+
+    costs = stage_costs(args.cache_dir)
+    stages = STAGES
+    if args.cascade:
+        stages = cascade_stages(STAGES, costs)
+        print(f"Cascade order: {', '.join(stage.name for stage in stages)}")
+
+    pending = run_pipeline(stages, args)
+    attempted = set()
+    while args.run_predictors:
+        # Predictors whose input was written, i.e. pending stages that are not waiting for another stage
+        ready = [stage.name for stage in stage_order(stages) if stage.name in pending and stage.name in PREDICTORS
+                 and stage.name not in attempted and not any(name in pending for name in stage.upstream)]
+        if "dd" in ready and not args.fasta:
+            print("DeepDetect needs the FASTA file, it can only be run with --fasta.")
+            ready.remove("dd")
+        if not ready:
+            break
+        attempted.update(ready)
+        finished = run_predictors(args, ready)
+        if not finished:
+            break
+        for name, seconds in finished.items():
+            costs[name] = seconds / max(pending[name] or 0, 1)
+        pending = run_pipeline(stages, args)
+    save_stage_costs(args.cache_dir, costs)
+
+    if pending:
+        print(f"Pending stages: {', '.join(sorted(pending))}. Run the pipeline again once their predictions exist.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+from stage_cache import hash_file
+
+# Predictions are stored per (tool, model_hash, peptide, modifications, charge). The value is a JSON
+# object with the columns the pipeline takes from the predictor output; a prediction that the tool
+# could not make is stored with null values, so that the peptide is not sent to the tool again.
+
+def hash_model(model):
+    """Hashes a model file, or the model name for tools that select a built-in model by name."""
+    file_hash = hash_file(model)
+    if file_hash is not None:
+        return file_hash
+    return hashlib.sha256(str(model).encode()).hexdigest()
+
+def open_prediction_cache(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS predictions (
+            tool TEXT NOT NULL,
+            model_hash TEXT NOT NULL,
+            peptide TEXT NOT NULL,
+            modifications TEXT NOT NULL,
+            charge INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (tool, model_hash, peptide, modifications, charge)
+        )
+    """)
+    return conn
+
+def lookup_predictions(conn, tool, model_hash, keys):
+    """
+    Looks up (peptide, modifications, charge) keys for one tool and model.
+    Returns a dict mapping the keys that were found to their values.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_keys (peptide TEXT, modifications TEXT, charge INTEGER)")
+    conn.execute("DELETE FROM lookup_keys")
+    conn.executemany("INSERT INTO lookup_keys VALUES (?, ?, ?)", keys)
+    rows = conn.execute("""
+        SELECT p.peptide, p.modifications, p.charge, p.value
+        FROM lookup_keys k
+        JOIN predictions p
+          ON p.peptide = k.peptide AND p.modifications = k.modifications AND p.charge = k.charge
+        WHERE p.tool = ? AND p.model_hash = ?
+    """, (tool, model_hash))
+    found = {(peptide, modifications, charge): json.loads(value) for peptide, modifications, charge, value in rows}
+    conn.execute("DELETE FROM lookup_keys")
+    return found
+
+def store_predictions(conn, tool, model_hash, predictions):
+    """Stores a dict mapping (peptide, modifications, charge) keys to values for one tool and model."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+        ((tool, model_hash, peptide, modifications, charge, json.dumps(value))
+         for (peptide, modifications, charge), value in predictions.items())
+    )
+    conn.commit()
@@ -0,0 +1,171 @@
+import os
+import shutil
+import subprocess
+import time
+
+# Runs the predictors of pending pipeline stages as subprocesses in their own conda environments.
+# Every predictor is a list of commands that run one after another in the tool's directory, while
+# the predictors themselves run at the same time, each pinned to its own set of CPU cores. The
+# results are written to a work directory and only moved to the result file when all commands
+# succeeded, so an interrupted run never leaves a partial result behind.
+
+# Length limits DeepDetect digests with, its own defaults, so that its predictions do not depend on
+# the selection thresholds
+DD_MIN_LEN = 7
+DD_MAX_LEN = 47
+
+# Thread pool sizes of the numerical libraries the tools use
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                    "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"]
+
+
+def interpreter(args, name):
+    """Returns the command that starts Python in a tool's environment."""
+    python = getattr(args, f"{name}_python")
+    if python:
+        return [python]
+    return ["conda", "run", "--no-capture-output", "-n", getattr(args, f"{name}_env"), "python"]
+
+
+def dmp_job(args, work_dir, cores):
+    # DeepMSPeptide names its output after the input file, up to the first '.', so the input is
+    # copied to the work directory under a plain name
+    shutil.copyfile(args.dmp_input, os.path.join(work_dir, "peptides.txt"))
+    script = os.path.join(os.path.dirname(os.path.abspath(args.dmp_model)), "DeepMSPeptide.py")
+    commands = [interpreter(args, "dmp") + [script, "peptides.txt", f"--model={os.path.abspath(args.dmp_model)}"]]
+    return work_dir, commands, lambda: os.replace(os.path.join(work_dir, "peptides_Predictions.txt"), args.dmp_file)
+
+
+def dd_job(args, work_dir, cores):
+    output = os.path.join(work_dir, "peptides_DD.txt")
+    # In cascade mode only the proteins with peptides left are predicted
+    fasta_file = args.dd_input if args.cascade else args.fasta
+    commands = [interpreter(args, "dd") + [
+        "main.py",
+        f"--input={os.path.abspath(fasta_file)}",
+        f"--output={output}",
+        f"--regular={args.dd_regular}",
+        "--protease=Trypsin",
+        f"--missed_cleavages={args.missed_cleavages}",
+        f"--min_len={DD_MIN_LEN}",
+        f"--max_len={DD_MAX_LEN}",
+    ]]
+    return args.dd_dir, commands, lambda: os.replace(output, args.dd_file)
+
+
+def cpred_job(args, work_dir, cores):
+    python = interpreter(args, "cpred")
+    commands = [
+        python + ["CPred_main.py", "FeatureEngineering", "-i", os.path.abspath(args.cpred_input),
+                  "-o", "output_FE", "-d", work_dir + os.sep],
+        python + ["CPred_main.py", "prediction", "-i", os.path.join(work_dir, "output_FE.parquet"),
+                  "-m", os.path.abspath(args.cpred_model), "-o", work_dir],
+    ]
+    return args.cpred_dir, commands, lambda: os.replace(os.path.join(work_dir, "Model_predictions.csv"),
+                                                        args.cpred_file)
+
+
+def ms2pip_job(args, work_dir, cores):
+    commands = [interpreter(args, "ms2pip") + [
+        "-m", "ms2pip", "predict-batch", os.path.abspath(args.ms2pip_input), "-f", "spectronaut",
+        "-o", os.path.join(work_dir, "peptides_ms2pip"), "--model", args.ms2pip_model, "-n", str(len(cores)),
+    ]]
+    return os.getcwd(), commands, lambda: os.replace(os.path.join(work_dir, "peptides_ms2pip.spectronaut.tsv"),
+                                                     args.ms2pip_file)
+
+
+# Pipeline stage -> function returning the directory to run in, the commands and the step that
+# moves the result into place
+PREDICTORS = {
+    "dmp": dmp_job,
+    "dd": dd_job,
+    "cpred": cpred_job,
+    "ms2pip": ms2pip_job,
+}
+
+
+def core_budgets(args, names):
+    """
+    Splits the CPU cores this process may use over the predictors. A predictor gets the number of
+    cores given with --<name>_cores; the cores that are left are shared evenly by the others.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+
+    requested = {name: getattr(args, f"{name}_cores") for name in names}
+    unset = [name for name in names if not requested[name]]
+    if unset:
+        left = len(cpus) - sum(n for n in requested.values() if n)
+        for name in unset:
+            requested[name] = max(1, left // len(unset))
+
+    budgets = {}
+    start = 0
+    for name in names:
+        n = min(requested[name], len(cpus))
+        budgets[name] = [cpus[(start + i) % len(cpus)] for i in range(n)]
+        start += n
+    if start > len(cpus):
+        print(f"Warning: the predictors ask for {start} cores, but only {len(cpus)} are available.")
+    return budgets
+
+
+def start_command(command, cwd, cores, log):
+    env = dict(os.environ)
+    env.update({variable: str(len(cores)) for variable in THREAD_VARIABLES})
+    preexec_fn = None
+    if hasattr(os, "sched_setaffinity"):
+        preexec_fn = lambda: os.sched_setaffinity(0, cores)
+    log.write(f"$ {' '.join(command)}\n")
+    log.flush()
+    return subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT, preexec_fn=preexec_fn)
+
+
+def run_predictors(args, names):
+    """
+    Runs the predictors of the given stages at the same time and waits for all of them.
+    Returns the predictors that finished successfully, mapped to the seconds they took.
+    """
+    budgets = core_budgets(args, names)
+    jobs = {}
+    for name in names:
+        work_dir = os.path.abspath(os.path.join(args.cache_dir, "predictors", name))
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+        os.makedirs(work_dir)
+        cwd, commands, finish = PREDICTORS[name](args, work_dir, budgets[name])
+        log_path = os.path.join(work_dir, f"{name}.log")
+        log = open(log_path, "w")
+        print(f"Starting {name} on cores {','.join(map(str, budgets[name]))}, log: {log_path}")
+        jobs[name] = {"cwd": cwd, "commands": commands, "finish": finish, "log": log, "log_path": log_path,
+                      "process": start_command(commands.pop(0), cwd, budgets[name], log), "start": time.time()}
+
+    finished = {}
+    while jobs:
+        time.sleep(0.5)
+        for name in list(jobs):
+            job = jobs[name]
+            returncode = job["process"].poll()
+            if returncode is None:
+                continue
+            if returncode == 0 and job["commands"]:
+                job["process"] = start_command(job["commands"].pop(0), job["cwd"], budgets[name], job["log"])
+                continue
+
+            job["log"].close()
+            del jobs[name]
+            elapsed = time.time() - job["start"]
+            if returncode != 0:
+                print(f"Error: {name} failed after {elapsed:.1f} seconds (exit code {returncode}), "
+                      f"see {job['log_path']}")
+                continue
+            try:
+                job["finish"]()
+            except FileNotFoundError as e:
+                print(f"Error: {name} did not write its predictions ({e}), see {job['log_path']}")
+                continue
+            print(f"{name} finished in {elapsed:.1f} seconds.")
+            finished[name] = elapsed
+    return finished
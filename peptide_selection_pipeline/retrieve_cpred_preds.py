@@ -1,8 +1,11 @@
 import pandas as pd
 
-def merge_cpred_data(peptides_csv, peptides_cpred_csv, cpred_input_csv):
+def load_cpred_preds(peptides_cpred_csv, cpred_input_csv):
+    """
+    Pairs the CPred predictions with the peptides of cpred_input.csv and keeps the most probable charge state.
+    Returns a DataFrame with columns: peptide, CS, CS_prob.
+    """
     # Load dataframes
-    peptides_df = pd.read_csv(peptides_csv)
     peptides_cpred_df = pd.read_csv(peptides_cpred_csv)
     cpred_input_df = pd.read_csv(cpred_input_csv)
 
@@ -18,14 +21,25 @@ def merge_cpred_data(peptides_csv, peptides_cpred_csv, cpred_input_csv):
     merged_df['CS'] = merged_df[probability_columns].idxmax(axis=1)
     merged_df['CS_prob'] = merged_df.max(axis=1, numeric_only=True)
 
-    # Reformat 'CS' values to remove the 'Probability_CS' prefix
+    # Reformat 'CS' values to remove the 'Probability_CS' prefix, keeping CPred's labels such as '+2'
     merged_df['CS'] = merged_df['CS'].str.replace('Probability_CS', '')
 
     # Drop the original probability columns and keep relevant columns
-    merged_df = merged_df[['peptide', 'CS', 'CS_prob']]
+    return merged_df[['peptide', 'CS', 'CS_prob']]
+
+def add_cpred_data(peptides_df, cpred_df):
+    """Adds the 'CS' and 'CS_prob' columns to a peptides DataFrame."""
+    # Merge the predictions back to the original peptides dataframe based on 'peptide',
+    # one prediction per peptide so that no rows are added
+    cpred_df = cpred_df.drop_duplicates(subset='peptide')
+    return pd.merge(peptides_df, cpred_df, on='peptide', how='left')
+
+def merge_cpred_data(peptides_csv, peptides_cpred_csv, cpred_input_csv):
+    # Load dataframes
+    peptides_df = pd.read_csv(peptides_csv)
+    cpred_df = load_cpred_preds(peptides_cpred_csv, cpred_input_csv)
 
-    # Merge the predictions back to the original peptides dataframe based on 'peptide'
-    final_df = pd.merge(peptides_df, merged_df, on='peptide', how='left')
+    final_df = add_cpred_data(peptides_df, cpred_df)
 
     # Save the updated peptides.csv
     final_df.to_csv(peptides_csv, index=False)
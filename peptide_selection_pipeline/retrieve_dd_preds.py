@@ -1,38 +1,101 @@
-import pandas as pd
+import os
+import sqlite3
 import sys
 
+import pandas as pd
+
+from stage_cache import hash_file
+
+def rename_dd_columns(dd_df):
+    """Renames the columns of peptides_DD.txt to 'Protein_ID', 'peptide' and 'DD_prob'."""
+    required_dd_cols = {"Protein id", "Peptide sequence", "Peptide detectability"}
+    if not required_dd_cols.issubset(dd_df.columns):
+        print("Error: Required columns not found in peptides_DD.txt.")
+        sys.exit(1)
+
+    # Rename columns in dd_df to standard names
+    return dd_df.rename(columns={
+        "Protein id": "Protein_ID",
+        "Peptide sequence": "peptide",
+        "Peptide detectability": "DD_prob"
+    })
+
+def load_dd_preds(dd_txt):
+    """Loads peptides_DD.txt with the columns renamed to 'Protein_ID', 'peptide' and 'DD_prob'."""
+    # Load peptides_DD.txt (tab-separated file)
+    return rename_dd_columns(pd.read_csv(dd_txt, sep="\t"))
+
+def index_dd_preds(dd_txt, index_file):
+    """
+    Stores the predictions of peptides_DD.txt in an SQLite file indexed by protein, reading the file
+    in chunks. The index is kept as long as peptides_DD.txt does not change.
+    """
+    dd_hash = hash_file(dd_txt)
+    if os.path.exists(index_file):
+        conn = sqlite3.connect(index_file)
+        indexed = conn.execute("SELECT dd_hash FROM source").fetchone()
+        conn.close()
+        if indexed == (dd_hash,):
+            return
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+    tmp_file = index_file + ".tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    conn = sqlite3.connect(tmp_file)
+    conn.execute("CREATE TABLE source (dd_hash TEXT NOT NULL)")
+    conn.execute("CREATE TABLE dd_preds (Protein_ID TEXT NOT NULL, peptide TEXT, DD_prob REAL)")
+    for chunk in pd.read_csv(dd_txt, sep="\t", chunksize=1000000):
+        chunk = rename_dd_columns(chunk)
+        conn.executemany("INSERT INTO dd_preds VALUES (?, ?, ?)",
+                         chunk[["Protein_ID", "peptide", "DD_prob"]].itertuples(index=False))
+    conn.execute("CREATE INDEX dd_preds_protein ON dd_preds (Protein_ID)")
+    conn.execute("INSERT INTO source VALUES (?)", (dd_hash,))
+    conn.commit()
+    conn.close()
+    # Replaced in one step, so that an interrupted run does not leave a partial index behind
+    os.replace(tmp_file, index_file)
+
+def load_indexed_dd_preds(index_file, proteins):
+    """Loads the predictions for the given proteins from the index written by index_dd_preds, in file order."""
+    conn = sqlite3.connect(index_file)
+    conn.execute("CREATE TEMP TABLE lookup_proteins (Protein_ID TEXT PRIMARY KEY)")
+    conn.executemany("INSERT INTO lookup_proteins VALUES (?)", ((str(pro),) for pro in proteins))
+    dd_df = pd.read_sql_query("""
+        SELECT d.Protein_ID, d.peptide, d.DD_prob
+        FROM dd_preds d
+        JOIN lookup_proteins p ON p.Protein_ID = d.Protein_ID
+        ORDER BY d.rowid
+    """, conn)
+    conn.close()
+    dd_df["DD_prob"] = dd_df["DD_prob"].astype(float)
+    return dd_df
+
+def add_dd_prob(peptides_df, dd_df):
+    """Adds the 'DD_prob' column to a peptides DataFrame."""
+    if "peptide" not in peptides_df.columns:
+        print("Error: 'peptide' column not found in peptides.csv.")
+        sys.exit(1)
+
+    # Determine merge strategy based on peptides_df columns
+    if "Protein_ID" in peptides_df.columns:
+        merge_cols = ["Protein_ID", "peptide"]
+    else:
+        merge_cols = ["peptide"]
+        # If Protein_ID is not present in peptides_df, drop it from dd_df to avoid merging it in.
+        dd_df = dd_df.drop("Protein_ID", axis=1)
+
+    # Merge dataframes on the determined columns, one prediction per key so that no rows are added
+    dd_df = dd_df.drop_duplicates(subset=merge_cols)
+    return peptides_df.merge(dd_df, on=merge_cols, how="left")
+
 def merge_dd_prob(peptides_csv, dd_txt):
     try:
         # Load peptides.csv
         peptides_df = pd.read_csv(peptides_csv)
-        if "peptide" not in peptides_df.columns:
-            print("Error: 'peptide' column not found in peptides.csv.")
-            sys.exit(1)
-
-        # Load peptides_DD.txt (tab-separated file)
-        dd_df = pd.read_csv(dd_txt, sep="\t")
-        required_dd_cols = {"Protein id", "Peptide sequence", "Peptide detectability"}
-        if not required_dd_cols.issubset(dd_df.columns):
-            print("Error: Required columns not found in peptides_DD.txt.")
-            sys.exit(1)
-
-        # Rename columns in dd_df to standard names
-        dd_df = dd_df.rename(columns={
-            "Protein id": "Protein_ID",
-            "Peptide sequence": "peptide",
-            "Peptide detectability": "DD_prob"
-        })
-
-        # Determine merge strategy based on peptides_df columns
-        if "Protein_ID" in peptides_df.columns:
-            merge_cols = ["Protein_ID", "peptide"]
-        else:
-            merge_cols = ["peptide"]
-            # If Protein_ID is not present in peptides_df, drop it from dd_df to avoid merging it in.
-            dd_df = dd_df.drop("Protein_ID", axis=1)
-
-        # Merge dataframes on the determined columns
-        merged_df = peptides_df.merge(dd_df, on=merge_cols, how="left")
+
+        # Load and merge the DeepDetect predictions
+        merged_df = add_dd_prob(peptides_df, load_dd_preds(dd_txt))
 
         # Overwrite peptides.csv with the updated data
         merged_df.to_csv(peptides_csv, index=False)
@@ -1,23 +1,33 @@
 import pandas as pd
 import sys
 
+def load_dmp_preds(dmp_txt):
+    """Loads peptides_DMP.txt as a DataFrame with the columns 'peptide' and 'DMP_prob'."""
+    # Load peptides_DMP.txt (tab-separated file)
+    dmp_df = pd.read_csv(dmp_txt, sep="\t")
+
+    # Rename columns and drop the last column
+    dmp_df = dmp_df.iloc[:, :2]  # Keep only the first two columns
+    dmp_df.columns = ["peptide", "DMP_prob"]
+    return dmp_df
+
+def add_dmp_prob(peptides_df, dmp_df):
+    """Adds the 'DMP_prob' column to a peptides DataFrame."""
+    if "peptide" not in peptides_df.columns:
+        print("Error: 'peptide' column not found in peptides.csv.")
+        sys.exit(1)
+
+    # Merge dataframes on 'peptide', one prediction per peptide so that no rows are added
+    dmp_df = dmp_df.drop_duplicates(subset="peptide")
+    return peptides_df.merge(dmp_df, on="peptide", how="left")
+
 def merge_peptides_with_dmp(peptides_csv, dmp_txt, output_csv):
     try:
         # Load peptides.csv
         peptides_df = pd.read_csv(peptides_csv)
-        if "peptide" not in peptides_df.columns:
-            print("Error: 'peptide' column not found in peptides.csv.")
-            sys.exit(1)
-
-        # Load peptides_DMP.txt (tab-separated file)
-        dmp_df = pd.read_csv(dmp_txt, sep="\t")
-
-        # Rename columns and drop the last column
-        dmp_df = dmp_df.iloc[:, :2]  # Keep only the first two columns
-        dmp_df.columns = ["peptide", "DMP_prob"]
 
-        # Merge dataframes on 'peptide' allowing duplicates
-        merged_df = peptides_df.merge(dmp_df, on="peptide", how="left")
+        # Load and merge the DeepMSPeptide predictions
+        merged_df = add_dmp_prob(peptides_df, load_dmp_preds(dmp_txt))
 
         # Save updated peptides.csv
         merged_df.to_csv(output_csv, index=False)
@@ -71,24 +71,28 @@ def process_spectronaut(tsv_file, intensity_threshold=0.05, mz_separation_thresh
 
     return pd.DataFrame(results)
 
-def main():
-    peptides_csv = "peptides.csv"
-    spectronaut_tsv = "peptides_ms2pip.spectronaut.tsv"
-
-    peptides_df = pd.read_csv(peptides_csv)
-    spec_results = process_spectronaut(spectronaut_tsv)
-
+def add_ms2pip_data(peptides_df, spec_results):
+    """Adds the 'valid_peaks' and 'average_peak_intensity' columns to a peptides DataFrame."""
     merged_df = pd.merge(peptides_df, spec_results,
                          left_on='peptide',
                          right_on='StrippedPeptide',
                          how='left')
 
     merged_df = merged_df.drop(columns=['StrippedPeptide'])
-    merged_df = merged_df.rename(columns={
+    return merged_df.rename(columns={
         'ValidPeaks': 'valid_peaks',
         'AvgIntensity': 'average_peak_intensity'
     })
 
+def main():
+    peptides_csv = "peptides.csv"
+    spectronaut_tsv = "peptides_ms2pip.spectronaut.tsv"
+
+    peptides_df = pd.read_csv(peptides_csv)
+    spec_results = process_spectronaut(spectronaut_tsv)
+
+    merged_df = add_ms2pip_data(peptides_df, spec_results)
+
     merged_df.to_csv(peptides_csv, index=False)
     print(f"Updated {peptides_csv} with 'valid_peaks' and 'average_peak_intensity' columns.")
 
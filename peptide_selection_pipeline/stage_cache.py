@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Every stage stores the columns it adds as a sidecar directory in the cache directory:
+#   <cache_dir>/<stage>/peptide_id.npy   integer peptide ids the rows belong to
+#   <cache_dir>/<stage>/<n>.npy          one file per column
+#   <cache_dir>/<stage>/columns.json     column names, files and whether they hold Python objects
+#   <cache_dir>/<stage>/key              key of the stage inputs, written last
+
+# File hashes by path, modification time and size, so that a file read by every chunk is hashed once
+_file_hashes = {}
+
+def hash_file(path):
+    """Returns the SHA-256 of a file's contents, or None if the file does not exist."""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    file_id = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if file_id not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        _file_hashes[file_id] = sha.hexdigest()
+    return _file_hashes[file_id]
+
+def hash_table(peptides_df):
+    """Returns a hash of a table's column names and values."""
+    sha = hashlib.sha256(json.dumps([str(col) for col in peptides_df.columns]).encode())
+    sha.update(pd.util.hash_pandas_object(peptides_df, index=True).values.tobytes())
+    return sha.hexdigest()
+
+def stage_key(name, upstream_keys, params, files, table=None):
+    """
+    Hashes everything a stage's output depends on: the keys of its upstream stages, its parameters
+    and the contents of the files it reads. Stages that are not cached are keyed by the table they
+    produced instead.
+    """
+    record = {
+        'stage': name,
+        'upstream': upstream_keys,
+        'params': params,
+        'files': {path: hash_file(path) for path in files if path},
+        'table': hash_table(table) if table is not None else None,
+    }
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+def is_cached(cache_dir, name, key):
+    """Checks whether the sidecar of a stage was produced with the given key."""
+    key_path = os.path.join(cache_dir, name, 'key')
+    if not os.path.exists(key_path):
+        return False
+    with open(key_path) as f:
+        return f.read().strip() == key
+
+def save_sidecar(cache_dir, name, key, columns_df):
+    """Stores the columns of a stage output, indexed by peptide_id, as a sidecar directory."""
+    sidecar_dir = os.path.join(cache_dir, name)
+    if os.path.exists(sidecar_dir):
+        shutil.rmtree(sidecar_dir)
+    os.makedirs(sidecar_dir)
+
+    np.save(os.path.join(sidecar_dir, 'peptide_id.npy'), columns_df.index.to_numpy(dtype=np.int64))
+    columns = []
+    for n, col in enumerate(columns_df.columns):
+        values = columns_df[col].to_numpy()
+        is_object = values.dtype == object
+        np.save(os.path.join(sidecar_dir, f'{n}.npy'), values, allow_pickle=is_object)
+        columns.append({'name': col, 'file': f'{n}.npy', 'object': bool(is_object)})
+    with open(os.path.join(sidecar_dir, 'columns.json'), 'w') as f:
+        json.dump(columns, f)
+
+    # The key is written last so that an interrupted write is never reused
+    with open(os.path.join(sidecar_dir, 'key'), 'w') as f:
+        f.write(key)
+
+def sidecar_columns(cache_dir, name):
+    with open(os.path.join(cache_dir, name, 'columns.json')) as f:
+        return [column['name'] for column in json.load(f)]
+
+def load_sidecar(cache_dir, name, columns=None):
+    """
+    Loads the requested columns of a stage sidecar as a DataFrame indexed by peptide_id.
+    Numeric columns are memory-mapped; columns that the stage did not write are ignored.
+    """
+    sidecar_dir = os.path.join(cache_dir, name)
+    with open(os.path.join(sidecar_dir, 'columns.json')) as f:
+        stored = json.load(f)
+
+    peptide_id = np.load(os.path.join(sidecar_dir, 'peptide_id.npy'))
+    data = {}
+    for column in stored:
+        if columns is not None and column['name'] not in columns:
+            continue
+        path = os.path.join(sidecar_dir, column['file'])
+        if column['object']:
+            data[column['name']] = np.load(path, allow_pickle=True)
+        else:
+            data[column['name']] = np.load(path, mmap_mode='r')
+    return pd.DataFrame(data, index=pd.Index(peptide_id, name='peptide_id'))
+
+def join_sidecars(cache_dir, names, columns=None, frames=None):
+    """
+    Joins the columns of several stages on peptide_id. The first stage is the root whose rows define
+    the table; rows that a later stage has no value for are left empty. 'frames' maps stage names to
+    outputs that are still in memory, so that those are not read back from disk.
+    """
+    frames = frames or {}
+
+    def stage_columns(name):
+        if name in frames:
+            frame = frames[name]
+            return frame if columns is None else frame[[col for col in frame.columns if col in columns]]
+        return load_sidecar(cache_dir, name, columns)
+
+    root, *others = names
+    table = stage_columns(root)
+    if not others:
+        return table
+    parts = [table] + [stage_columns(name).reindex(table.index) for name in others]
+    return pd.concat(parts, axis=1)
@@ -0,0 +1,54 @@
+import argparse
+
+import pandas as pd
+
+import pipeline
+from pipeline import Stage, run_chunks
+
+
+class ChunkStages:
+    """A prediction stage that is pending until its predictions are given, and a selection on it."""
+    def __init__(self, predictions=None):
+        self.predictions = predictions
+
+    def predict(self, table, args):
+        if self.predictions is None:
+            return None
+        return pd.DataFrame({"prob": table["peptide"].map(self.predictions)}, index=table.index)
+
+    def select(self, table, args):
+        return pd.DataFrame({"selected": table["prob"] > 0.5}, index=table.index)
+
+    def stages(self):
+        return [
+            Stage("peptides", None, [], [], [], [], False),
+            Stage("predict", self.predict, ["peptides"], ["peptide"], [], [], True),
+            Stage("selection", self.select, ["predict"], ["prob"], [], [], False),
+        ]
+
+
+def chunk_args(tmp_path):
+    return argparse.Namespace(cache_dir=str(tmp_path / "cache"), no_cache=False, chunk_size=2,
+                              output=str(tmp_path / "peptides.csv"),
+                              selection_output=str(tmp_path / "final_selection.csv"))
+
+
+def test_chunks_write_the_selection_only_when_it_ran(tmp_path, monkeypatch):
+    peptides = ["PEPTIDEK", "LESLIEK", "AAAAR", "GGGGK", "MPEPK"]
+    monkeypatch.setattr(pipeline, "ingest_predictions", lambda args: None)
+    monkeypatch.setattr(pipeline, "peptide_chunks", lambda args: (
+        pd.DataFrame({"peptide": peptides[start:start + args.chunk_size]})
+        for start in range(0, len(peptides), args.chunk_size)))
+    args = chunk_args(tmp_path)
+    with open(args.selection_output, "w") as f:
+        f.write("peptide,prob\nPEPTIDEK,0.9\n")
+
+    # The predictions are pending, the selection of a previous run is kept
+    assert run_chunks(ChunkStages().stages(), args) == {"predict": 5, "selection": None}
+    assert list(pd.read_csv(args.output).columns) == ["peptide"]
+    assert list(pd.read_csv(args.selection_output)["peptide"]) == ["PEPTIDEK"]
+
+    predictions = dict(zip(peptides, [0.25, 0.75, 0.5, 0.875, 0.625]))
+    assert run_chunks(ChunkStages(predictions).stages(), args) == {}
+    assert list(pd.read_csv(args.output)["prob"]) == [0.25, 0.75, 0.5, 0.875, 0.625]
+    assert list(pd.read_csv(args.selection_output)["peptide"]) == ["LESLIEK", "GGGGK", "MPEPK"]
@@ -0,0 +1,59 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from pipeline import run_cpred
+from retrieve_cpred_preds import load_cpred_preds
+from stage_cache import save_sidecar, load_sidecar
+
+
+def baseline_merge_cpred_data(peptides_df, peptides_cpred_csv, cpred_input_csv):
+    """merge_cpred_data of the original scripts, without reading and writing peptides.csv."""
+    peptides_cpred_df = pd.read_csv(peptides_cpred_csv)
+    cpred_input_df = pd.read_csv(cpred_input_csv)
+    merged_df = pd.concat([cpred_input_df, peptides_cpred_df], axis=1)
+    merged_df = merged_df.drop(columns=['Modifications'])
+    merged_df = merged_df.rename(columns={'Peptide_sequence': 'peptide'})
+    probability_columns = [col for col in merged_df.columns if col.startswith('Probability_CS')]
+    merged_df['CS'] = merged_df[probability_columns].idxmax(axis=1)
+    merged_df['CS_prob'] = merged_df.max(axis=1, numeric_only=True)
+    merged_df['CS'] = merged_df['CS'].str.replace('Probability_CS', '')
+    merged_df = merged_df[['peptide', 'CS', 'CS_prob']]
+    return pd.merge(peptides_df, merged_df, on='peptide', how='left')
+
+
+def write_cpred_files(tmp_path, peptides):
+    cpred_input = tmp_path / "cpred_input.csv"
+    cpred_file = tmp_path / "peptides_CPred.csv"
+    pd.DataFrame({"Peptide_sequence": peptides, "Modifications": ""}).to_csv(cpred_input, index=False)
+    rng = np.random.default_rng(0)
+    probs = rng.dirichlet(np.ones(7), size=len(peptides))
+    pd.DataFrame(probs, columns=[f"Probability_CS+{cs}" for cs in range(1, 8)]).to_csv(cpred_file, index=False)
+    return str(cpred_input), str(cpred_file)
+
+
+def test_load_cpred_preds_keeps_cpred_labels(tmp_path):
+    cpred_input, cpred_file = write_cpred_files(tmp_path, ["PEPTIDEK", "LESLIEK", "AAAAR"])
+    cpred_df = load_cpred_preds(cpred_file, cpred_input)
+    assert all(cs.startswith("+") for cs in cpred_df["CS"])
+
+
+def test_cpred_stage_output_matches_baseline_scripts(tmp_path):
+    # CPred is not run on peptides with 'U', so the column has empty values as well
+    peptides = ["PEPTIDEK", "LESLIEK", "AAAAR", "PEPUK"]
+    cpred_input, cpred_file = write_cpred_files(tmp_path, peptides[:3])
+    table = pd.DataFrame({"peptide": peptides}, index=pd.Index(range(4), name="peptide_id"))
+    args = argparse.Namespace(cpred_file=cpred_file, cpred_input=cpred_input, cpred_model="model.h5",
+                              no_prediction_cache=False, prediction_cache=str(tmp_path / "cache.sqlite"),
+                              chunk_size=None, inputs_written={})
+
+    # Through the prediction cache and the sidecar files, as in a pipeline run
+    columns = run_cpred(table, args)
+    save_sidecar(str(tmp_path / "cache"), "cpred", "key", columns)
+    output = pd.concat([table, load_sidecar(str(tmp_path / "cache"), "cpred")], axis=1)
+
+    expected = baseline_merge_cpred_data(table.reset_index(drop=True), cpred_file, cpred_input)
+    output.to_csv(tmp_path / "pipeline.csv", index=False)
+    expected.to_csv(tmp_path / "baseline.csv", index=False)
+    assert (tmp_path / "pipeline.csv").read_text() == (tmp_path / "baseline.csv").read_text()
@@ -0,0 +1,79 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import retrieve_dd_preds
+from pipeline import run_dd, protein_sequences
+from retrieve_dd_preds import index_dd_preds
+
+
+def write_dd_file(path, proteins, rng):
+    rows = []
+    for pro in proteins:
+        for pep in ["PEPTIDEK", "LESLIEK", "AAAAR", "GGGGK"]:
+            rows.append((pro, pep, rng.random()))
+    # DeepDetect lists a peptide that occurs twice in a protein twice, the first prediction is used
+    rows.append((proteins[0], "PEPTIDEK", 0.0))
+    rows.append((proteins[1], "AAAAR", np.nan))
+    pd.DataFrame(rows, columns=["Protein id", "Peptide sequence", "Peptide detectability"]).to_csv(
+        path, sep="\t", index=False)
+
+
+def dd_args(tmp_path, chunk_size=None):
+    return argparse.Namespace(dd_inprocess=False, cascade=False, fasta=None, dd_file=str(tmp_path / "peptides_DD.txt"),
+                              dd_input=str(tmp_path / "dd_input.fasta"), chunk_size=chunk_size,
+                              dd_index=str(tmp_path / "cache" / "dd_predictions.sqlite"))
+
+
+def peptides_table(proteins, peptides, start=0):
+    rows = [(pro, pep) for pro in proteins for pep in peptides]
+    return pd.DataFrame(rows, columns=["Protein_ID", "peptide"],
+                        index=pd.Index(range(start, start + len(rows)), name="peptide_id"))
+
+
+def test_chunked_dd_predictions_are_read_from_the_index(tmp_path, monkeypatch):
+    proteins = [f"sp|P{n:05d}|PROT" for n in range(6)]
+    args = dd_args(tmp_path)
+    write_dd_file(args.dd_file, proteins, np.random.default_rng(0))
+    peptides = ["PEPTIDEK", "AAAAR", "LESLIEK", "MISSINGK"]
+    table = peptides_table(proteins, peptides)
+    expected = run_dd(table, args)
+
+    chunk_args = dd_args(tmp_path, chunk_size=4)
+    index_dd_preds(chunk_args.dd_file, chunk_args.dd_index)
+    index_dd_preds(chunk_args.dd_file, chunk_args.dd_index)
+
+    # The chunks do not read peptides_DD.txt again
+    def read_csv(*args, **kwargs):
+        raise AssertionError("peptides_DD.txt was read for a chunk")
+    monkeypatch.setattr(retrieve_dd_preds.pd, "read_csv", read_csv)
+    chunks = [run_dd(peptides_table(proteins[:4], peptides), chunk_args),
+              run_dd(peptides_table(proteins[4:], peptides, start=16), chunk_args)]
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_protein_sequences_keeps_only_the_proteins_asked_for(tmp_path, capsys):
+    fasta_file = str(tmp_path / "proteins.fasta")
+    with open(fasta_file, "w") as f:
+        f.write(">P1 first\nMPEPTIDEK\nAAR\n>P2 second\nLESLIEK\n>P3 third\nGGGGK\n")
+    assert protein_sequences(fasta_file, {"P1 first", "P3 third"}) == {"P1 first": "MPEPTIDEKAAR",
+                                                                       "P3 third": "GGGGK"}
+
+    with pytest.raises(SystemExit):
+        protein_sequences(fasta_file, {"P1 first", "P4 fourth"})
+    assert "'P4 fourth'" in capsys.readouterr().out
+
+
+def test_cascade_uses_dd_predictions_for_every_protein(tmp_path):
+    proteins = [f"P{n}" for n in range(4)]
+    args = dd_args(tmp_path)
+    write_dd_file(args.dd_file, proteins, np.random.default_rng(1))
+    table = peptides_table(proteins[1:3], ["PEPTIDEK", "AAAAR"])
+    expected = run_dd(table, args)
+
+    # The predictions of a run on the whole FASTA file are used without writing dd_input.fasta
+    args.cascade, args.fasta = True, str(tmp_path / "proteins.fasta")
+    pd.testing.assert_frame_equal(run_dd(table, args), expected)
+    assert not (tmp_path / "dd_input.fasta").exists()
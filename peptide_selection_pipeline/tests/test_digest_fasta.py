@@ -0,0 +1,41 @@
+import random
+
+import pandas as pd
+import pytest
+from pyteomics import parser
+
+from in_silico_digest_fasta import process_fasta
+
+
+def baseline_digest_protein(protein_sequence, missed_cleavages):
+    """digest_protein of the original script; pyteomics returns the peptides as a set."""
+    return list(parser.cleave(protein_sequence, parser.expasy_rules['trypsin'], missed_cleavages=missed_cleavages))
+
+
+def write_fasta(path, n_proteins):
+    rand = random.Random(0)
+    proteins = []
+    with open(path, "w") as f:
+        for n in range(n_proteins):
+            sequence = "".join(rand.choice("ACDEFGHIKLMNPQRSTVWY") for _ in range(rand.randint(5, 300)))
+            proteins.append((f"sp|P{n}|PROT{n} protein {n}", sequence))
+            lines = [sequence[start : start + 60] for start in range(0, len(sequence), 60)]
+            f.write(f">{proteins[-1][0]}\n" + "\n".join(lines) + "\n")
+    return proteins
+
+
+@pytest.mark.parametrize("missed_cleavages", [0, 2])
+def test_pooled_and_chunked_digestion_give_the_same_peptides_csv(tmp_path, missed_cleavages):
+    fasta_file = str(tmp_path / "proteins.fasta")
+    proteins = write_fasta(fasta_file, 200)
+
+    process_fasta(fasta_file, missed_cleavages, str(tmp_path / "serial.csv"), chunk_size=1000)
+    process_fasta(fasta_file, missed_cleavages, str(tmp_path / "pooled.csv"), chunk_size=7, workers=3)
+    assert (tmp_path / "pooled.csv").read_bytes() == (tmp_path / "serial.csv").read_bytes()
+
+    # the peptides of every protein are those of the original digestion, in a fixed order
+    peptides_df = pd.read_csv(tmp_path / "serial.csv", keep_default_na=False)
+    assert list(dict.fromkeys(peptides_df["Protein_ID"])) == [protein_id for protein_id, _ in proteins]
+    for protein_id, sequence in proteins:
+        peptides = list(peptides_df.loc[peptides_df["Protein_ID"] == protein_id, "peptide"])
+        assert sorted(peptides) == sorted(baseline_digest_protein(sequence, missed_cleavages))
@@ -0,0 +1,82 @@
+import argparse
+import os
+
+import pandas as pd
+
+from pipeline import run_dmp
+from prediction_cache import open_prediction_cache, lookup_predictions, store_predictions
+
+
+def baseline_merge_peptides_with_dmp(peptides_df, dmp_txt):
+    """merge_peptides_with_dmp of the original scripts, without reading and writing peptides.csv."""
+    dmp_df = pd.read_csv(dmp_txt, sep="\t")
+    dmp_df = dmp_df.iloc[:, :2]
+    dmp_df.columns = ["peptide", "DMP_prob"]
+    return peptides_df.merge(dmp_df, on="peptide", how="left")
+
+
+def test_lookup_returns_stored_predictions_of_the_same_tool_and_model(tmp_path):
+    path = str(tmp_path / "cache" / "predictions.sqlite")
+    conn = open_prediction_cache(path)
+    store_predictions(conn, "CPred", "model", {("PEPTIDEK", "", 0): {"CS": "+2", "CS_prob": 0.9},
+                                               ("AAAAR", "", 0): {"CS": None, "CS_prob": None}})
+    conn.close()
+
+    conn = open_prediction_cache(path)
+    keys = [("PEPTIDEK", "", 0), ("AAAAR", "", 0), ("LESLIEK", "", 0)]
+    assert lookup_predictions(conn, "CPred", "model", keys) == {
+        ("PEPTIDEK", "", 0): {"CS": "+2", "CS_prob": 0.9}, ("AAAAR", "", 0): {"CS": None, "CS_prob": None}}
+    assert lookup_predictions(conn, "CPred", "other model", keys) == {}
+    assert lookup_predictions(conn, "DeepMSPeptide", "model", keys) == {}
+    conn.close()
+
+
+def dmp_args(tmp_path):
+    model = tmp_path / "model_2_1D.h5"
+    model.write_text("weights")
+    return argparse.Namespace(dmp_file=str(tmp_path / "peptides_DMP.txt"), dmp_input=str(tmp_path / "peptides.txt"),
+                              dmp_model=str(model), prediction_cache=str(tmp_path / "predictions.sqlite"),
+                              no_prediction_cache=False, chunk_size=None, dmp_inprocess=False, inputs_written={})
+
+
+def peptides_table(peptides):
+    return pd.DataFrame({"peptide": peptides}, index=pd.Index(range(len(peptides)), name="peptide_id"))
+
+
+def test_dmp_predictions_come_from_the_cache_once_read(tmp_path):
+    args = dmp_args(tmp_path)
+    # DeepMSPeptide skipped PEPUK, it gets an empty prediction
+    with open(args.dmp_input, "w") as f:
+        f.write("PEPTIDEK\nLESLIEK\nAAAAR\nPEPUK\n")
+    with open(args.dmp_file, "w") as f:
+        f.write("Peptide\tProb\tDetectability\nPEPTIDEK\t0.8125\t1\nLESLIEK\t0.25\t0\nAAAAR\t0.5\t1\n")
+    table = peptides_table(["PEPTIDEK", "LESLIEK", "AAAAR", "PEPTIDEK", "PEPUK"])
+    expected = baseline_merge_peptides_with_dmp(table.reset_index(drop=True), args.dmp_file)["DMP_prob"]
+
+    from_file = run_dmp(table, args)
+    pd.testing.assert_series_equal(from_file["DMP_prob"].reset_index(drop=True), expected)
+
+    # the result file is gone, every prediction is a cache hit
+    os.remove(args.dmp_file)
+    os.remove(args.dmp_input)
+    from_cache = run_dmp(table, args)
+    pd.testing.assert_frame_equal(from_cache, from_file)
+
+    # only the peptide without a prediction is written for DeepMSPeptide
+    assert run_dmp(peptides_table(["PEPTIDEK", "GGGGK"]), args) is None
+    with open(args.dmp_input) as f:
+        assert f.read().splitlines() == ["GGGGK"]
+
+
+def test_dmp_predictions_of_another_model_are_misses(tmp_path):
+    args = dmp_args(tmp_path)
+    with open(args.dmp_file, "w") as f:
+        f.write("Peptide\tProb\tDetectability\nPEPTIDEK\t0.8125\t1\n")
+    assert run_dmp(peptides_table(["PEPTIDEK"]), args) is not None
+    os.remove(args.dmp_file)
+
+    with open(args.dmp_model, "w") as f:
+        f.write("retrained weights")
+    assert run_dmp(peptides_table(["PEPTIDEK"]), args) is None
+    with open(args.dmp_input) as f:
+        assert f.read().splitlines() == ["PEPTIDEK"]
@@ -0,0 +1,20 @@
+import argparse
+
+from predictors import dd_job, DD_MIN_LEN, DD_MAX_LEN
+
+
+def dd_args(**thresholds):
+    args = dict(dd_python="python", dd_env="deepdetect_env", cascade=False, fasta="proteins.fasta",
+                dd_input="dd_input.fasta", dd_regular=r">(\S+)", missed_cleavages=2, dd_file="peptides_DD.txt",
+                dd_dir="deepdetect", min_length=8, max_length=25)
+    args.update(thresholds)
+    return argparse.Namespace(**args)
+
+
+def test_dd_job_does_not_depend_on_the_length_thresholds(tmp_path):
+    # The dd stage is not keyed on the selection thresholds, so they must not reach DeepDetect
+    _, commands, _ = dd_job(dd_args(), str(tmp_path), [0])
+    _, other_commands, _ = dd_job(dd_args(min_length=5, max_length=40), str(tmp_path), [0])
+    assert commands == other_commands
+    assert f"--min_len={DD_MIN_LEN}" in commands[0] and f"--max_len={DD_MAX_LEN}" in commands[0]
+    assert "--missed_cleavages=2" in commands[0]
@@ -0,0 +1,119 @@
+import argparse
+import os
+
+import pandas as pd
+
+from pipeline import STAGES, Stage, run_stages, stage_inputs, dd_model_files
+from stage_cache import stage_key, join_sidecars
+
+
+def stage_named(name):
+    return next(stage for stage in STAGES if stage.name == name)
+
+
+def key_of(stage, args):
+    params, files = stage_inputs(stage, args)
+    return stage_key(stage.name, ["upstream"], params, files)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def dd_stage_args(tmp_path, **changes):
+    dd_dir = str(tmp_path / "deepdetect" / "SourceCode" / "deepdetect_pred")
+    args = dict(dd_inprocess=True, missed_cleavages=2, dd_dir=dd_dir, dd_file=str(tmp_path / "peptides_DD.txt"),
+                fasta=str(tmp_path / "proteins.fasta"), min_length=8, max_length=25)
+    args.update(changes)
+    args["dd_models"] = dd_model_files(args["dd_dir"])
+    return argparse.Namespace(**args)
+
+
+def test_dd_stage_key_covers_its_inputs(tmp_path):
+    write(str(tmp_path / "proteins.fasta"), ">P1\nMPEPTIDEKAAR\n")
+    for path in dd_model_files(dd_stage_args(tmp_path).dd_dir)[:4]:
+        write(path, "model")
+    dd = stage_named("dd")
+    key = key_of(dd, dd_stage_args(tmp_path))
+
+    assert key_of(dd, dd_stage_args(tmp_path, missed_cleavages=1)) != key
+    assert key_of(dd, dd_stage_args(tmp_path, dd_dir=str(tmp_path / "other"))) != key
+    # DeepDetect digests with its own length limits, the thresholds only act in the selection
+    assert key_of(dd, dd_stage_args(tmp_path, min_length=5, max_length=40)) == key
+
+    write(str(tmp_path / "proteins.fasta"), ">P1\nMPEPTIDEKAARPEPTIDER\n")
+    fasta_key = key_of(dd, dd_stage_args(tmp_path))
+    assert fasta_key != key
+
+    # retrained weights, and a converted model file next to the JSON and h5 files
+    write(dd_model_files(dd_stage_args(tmp_path).dd_dir)[1], "retrained model")
+    model_key = key_of(dd, dd_stage_args(tmp_path))
+    assert model_key != fasta_key
+    write(dd_model_files(dd_stage_args(tmp_path).dd_dir)[4], "converted models")
+    assert key_of(dd, dd_stage_args(tmp_path)) != model_key
+
+
+class CountingStages:
+    """A root stage and two cached stages, one reading a file, that count how often they run."""
+    def __init__(self):
+        self.runs = {"weights": 0, "score": 0}
+
+    def peptides(self, table, args):
+        return pd.DataFrame({"peptide": args.peptides}, index=pd.Index(range(len(args.peptides)), name="peptide_id"))
+
+    def weights(self, table, args):
+        self.runs["weights"] += 1
+        with open(args.weights_file) as f:
+            offset = float(f.read())
+        return pd.DataFrame({"w": table["peptide"].str.len() * args.scale + offset}, index=table.index)
+
+    def score(self, table, args):
+        self.runs["score"] += 1
+        return pd.DataFrame({"score": table["w"] * 2}, index=table.index)
+
+    def stages(self):
+        return [
+            Stage("peptides", self.peptides, [], [], [], [], False),
+            Stage("weights", self.weights, ["peptides"], ["peptide"], ["scale"], ["weights_file"], True),
+            Stage("score", self.score, ["peptides", "weights"], ["w"], [], [], True),
+        ]
+
+
+def run_counted(counting, args):
+    before = dict(counting.runs)
+    done, frames, pending = run_stages(counting.stages(), args)
+    assert not pending
+    table = join_sidecars(args.cache_dir, done, frames=frames)
+    return {name: counting.runs[name] - before[name] for name in before}, list(table["score"])
+
+
+def test_stages_rerun_only_when_their_inputs_change(tmp_path):
+    weights_file = str(tmp_path / "weights.txt")
+    write(weights_file, "1")
+    args = argparse.Namespace(cache_dir=str(tmp_path / "cache"), no_cache=False, peptides=["PEPTIDEK", "AAR"],
+                              scale=1.0, weights_file=weights_file)
+    counting = CountingStages()
+
+    assert run_counted(counting, args) == ({"weights": 1, "score": 1}, [18.0, 8.0])
+    # nothing changed, the sidecars are read back
+    assert run_counted(counting, args) == ({"weights": 0, "score": 0}, [18.0, 8.0])
+
+    # a parameter of the first stage reruns it and the stage below it
+    args.scale = 2.0
+    assert run_counted(counting, args) == ({"weights": 1, "score": 1}, [34.0, 14.0])
+
+    # a changed file content reruns them, a rewritten file with the same content does not
+    write(weights_file, "0")
+    assert run_counted(counting, args) == ({"weights": 1, "score": 1}, [32.0, 12.0])
+    os.remove(weights_file)
+    write(weights_file, "0")
+    assert run_counted(counting, args) == ({"weights": 0, "score": 0}, [32.0, 12.0])
+
+    # other peptides change the key of the root stage, which every stage depends on
+    args.peptides = ["PEPTIDEK"]
+    assert run_counted(counting, args) == ({"weights": 1, "score": 1}, [32.0])
+
+    args.no_cache = True
+    assert run_counted(counting, args) == ({"weights": 1, "score": 1}, [32.0])